@@ -5,728 +5,1539 @@ Provides real satellite data from Google Earth Engine
 """
 
 import os
-import json
+import math
+import time
+import threading
 import ee
-from flask import Flask, request, jsonify
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout, as_completed
+from functools import partial, wraps
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 
+from cache import DAY, DATASET_STALE_TTLS, DATASET_TTLS, cache_from_env, disk_cache_from_env
+from ee_init import EarthEngineInitializer
+from singleflight import SingleFlight
+from grid_store import DEFAULT_GRID_PATH, GridStore
+from raster_store import DEFAULT_RASTER_PATH, RASTER_LAYERS, RasterStore
+from geometry import SIMPLIFY_FRACTION, parse_area
+from formats import (
+    COLUMNAR, COMPRESS_MIN_BYTES, NotAcceptable, choose_encoding, compress, compress_chunks, compressible,
+    content_type, encode, encode_stream, negotiate
+)
+from datasets import DATASETS, composite, filtered, outputs, prepared, reducer, source
+from timeseries import DEFAULT_PERIODS, MAX_PERIODS, SERIES, fetch_points, is_final, period_ranges, series_scale
+from rolling import combine, fetch_days
+from jobs import STATUSES, QueueFull, jobs_from_env, parse_priority
+from tiling import (
+    TILE_PIXELS, circle_bounds, merge, partial_image, partial_reducer, plan_tiles, touches_circle
+)
+from scale_policy import DEFAULT_QUALITY, parse_quality, reduction_params, tile_scale
+from scoring import COMPONENTS, DEFAULT_WEIGHTS, GRADES, assess, parse_weights, recommendations
+from scheduler import SCHEDULER, Overloaded, set_priority
+from instrumentation import (
+    REGISTRY, begin_request, begin_task, current_request, end_request, end_task, get_info, get_logger, submit
+)
+
 # Load environment variables
 load_dotenv()
 
 app = Flask(__name__)
 CORS(app)
 
-# Initialize Earth Engine
-def initialize_earth_engine():
-    """Initialize Earth Engine with service account credentials"""
-    try:
-        # Load credentials from environment
-        credentials_json = os.getenv('GOOGLE_EARTH_ENGINE_KEY')
-        if not credentials_json:
-            print("[ERROR] GOOGLE_EARTH_ENGINE_KEY not found in environment")
-            return False
-
-        credentials = json.loads(credentials_json)
-        service_account = credentials['client_email']
-
-        # Create credentials file
-        credentials_file = '/tmp/ee-service-account.json'
-        with open(credentials_file, 'w') as f:
-            json.dump(credentials, f)
-
-        # Initialize Earth Engine
-        credentials_obj = ee.ServiceAccountCredentials(service_account, credentials_file)
-        ee.Initialize(credentials_obj)
-
-        print(f"[SUCCESS] Earth Engine initialized with {service_account}")
-        return True
-    except Exception as e:
-        print(f"[ERROR] Failed to initialize Earth Engine: {e}")
-        return False
+# Structured JSON logs, one object per line
+log = get_logger()
 
-# Initialize on startup
-EE_INITIALIZED = initialize_earth_engine()
+# Earth Engine is initialized lazily in each worker process on first use
+EE = EarthEngineInitializer()
 
+# Shared result cache for metric endpoints
+CACHE_ENABLED = os.getenv('EE_CACHE_ENABLED', 'true').lower() != 'false'
+RESULT_CACHE = cache_from_env()
 
-@app.route('/health', methods=['GET'])
-def health():
-    """Health check endpoint"""
-    return jsonify({
-        'status': 'ok',
-        'earth_engine': 'initialized' if EE_INITIALIZED else 'failed',
-        'timestamp': datetime.utcnow().isoformat()
-    })
+# Persistent second tier shared by all workers; hottest entries are loaded at boot
+DISK_CACHE = disk_cache_from_env() if CACHE_ENABLED else None
+if DISK_CACHE is not None:
+    warmed = DISK_CACHE.warm(RESULT_CACHE, limit=int(os.getenv('EE_DISK_CACHE_WARM_KEYS', 500)))
+    log.info('Warmed disk cache', extra={'entries': warmed, 'path': DISK_CACHE.path})
 
+# Precomputed grid for static layers, built offline by precompute_grid.py
+GRID = GridStore.open(DEFAULT_GRID_PATH)
+GRID_ROUTE_METRICS = ('surface-water', 'landcover')
 
-@app.route('/ndvi', methods=['GET'])
-def get_ndvi():
-    """Get Sentinel-2 NDVI data"""
-    if not EE_INITIALIZED:
-        return jsonify({'error': 'Earth Engine not initialized'}), 500
+# Pixel rasters of hot regions, fetched by fetch_hot_regions.py
+RASTERS = RasterStore.open(DEFAULT_RASTER_PATH)
 
-    try:
-        lat = float(request.args.get('lat', 0))
-        lon = float(request.args.get('lon', 0))
-        radius = float(request.args.get('radius', 10)) * 1000  # km to meters
+# Identical concurrent queries (e.g. overlapping widget requests) share one EE computation
+IN_FLIGHT = SingleFlight()
 
-        # Create point and buffer
-        point = ee.Geometry.Point([lon, lat])
-        region = point.buffer(radius)
-
-        # Try progressively longer date ranges to find images
-        end_date = datetime.utcnow()
-        collection_size = 0
-        date_ranges = [30, 90, 180, 365]  # Days to look back
-
-        for days_back in date_ranges:
-            start_date = end_date - timedelta(days=days_back)
-
-            collection = ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED') \
-                .filterBounds(point) \
-                .filterDate(start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')) \
-                .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', 80))
-
-            collection_size = collection.size().getInfo()
-            print(f"[INFO] Searching {days_back} days: found {collection_size} images")
-
-            if collection_size > 0:
-                break
-
-        if collection_size == 0:
-            print(f"[WARNING] No images found for {lat}, {lon} in last year")
-            # Try one more time with no cloud filter
-            start_date = end_date - timedelta(days=365)
-            collection = ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED') \
-                .filterBounds(point) \
-                .filterDate(start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'))
-
-            collection_size = collection.size().getInfo()
-            print(f"[INFO] No cloud filter: found {collection_size} images")
-
-            if collection_size == 0:
-                return jsonify({
-                    'mean': 0,
-                    'min': 0,
-                    'max': 0,
-                    'stdDev': 0,
-                    'cloudCover': 0,
-                    'timestamp': datetime.utcnow().isoformat(),
-                    'source': 'Sentinel-2 SR Harmonized',
-                    'info': f'No satellite images available for this location'
-                })
-
-        # Calculate NDVI
-        def calc_ndvi(image):
-            ndvi = image.normalizedDifference(['B8', 'B4']).rename('NDVI')
-            return ndvi
-
-        ndvi_collection = collection.map(calc_ndvi)
-
-        # Get median NDVI
-        ndvi_median = ndvi_collection.median()
-
-        # Calculate statistics
-        stats = ndvi_median.reduceRegion(
-            reducer=ee.Reducer.mean().combine(
-                ee.Reducer.minMax(), '', True
-            ).combine(
-                ee.Reducer.stdDev(), '', True
-            ),
-            geometry=region,
-            scale=10,
-            maxPixels=1e9
-        ).getInfo()
-
-        # Get cloud cover
-        cloud_cover = collection.aggregate_mean('CLOUDY_PIXEL_PERCENTAGE').getInfo()
-
-        print(f"[INFO] NDVI - Mean: {stats.get('NDVI_mean', 0):.3f}, Cloud: {cloud_cover:.1f}%")
 
-        return jsonify({
-            'mean': round(stats.get('NDVI_mean', 0), 3),
-            'min': round(stats.get('NDVI_min', 0), 3),
-            'max': round(stats.get('NDVI_max', 0), 3),
-            'stdDev': round(stats.get('NDVI_stdDev', 0), 3),
-            'cloudCover': round(cloud_cover or 0, 1),
-            'timestamp': datetime.utcnow().isoformat(),
-            'source': 'Sentinel-2 SR Harmonized (Real Data)'
+def cache_key(path, args, area=None):
+    """
+    Result cache key for a metric request, or None if its location does not
+    parse. Keys carry no date: entries age out by their dataset's cadence.
+    """
+    params = {k: v for k, v in args.items() if k not in ('lat', 'lon', 'format')}
+    if area is not None:
+        # A posted area is keyed on its exact shape; the centroid only picks the cell
+        lat, lon = area.centroid
+        params['geometry'] = area.hash
+    else:
+        try:
+            lat = float(args.get('lat', 0))
+            lon = float(args.get('lon', 0))
+        except ValueError:
+            return None
+
+    return RESULT_CACHE.make_key(path, lat, lon, params)
+
+
+def cache_entry(key):
+    """
+    Return (result, age in seconds, fresh) for a fresh or stale entry from
+    memory, then disk (promoting it to memory), or None
+    """
+    entry = RESULT_CACHE.get_entry(key)
+    if entry is not None:
+        return entry
+
+    stored = DISK_CACHE.get(key) if DISK_CACHE is not None else None
+    if stored is None:
+        return None
+    result, expires_at, stale_until, stored_at = stored
+    now = time.time()
+    remaining = expires_at - now if expires_at is not None else None
+    stale_ttl = stale_until - expires_at if expires_at is not None else 0
+    RESULT_CACHE.set(key, result, remaining, stale_ttl, stored_at)
+    return result, now - stored_at, expires_at is None or expires_at > now
+
+
+def cache_lookup(key):
+    """Return a fresh cached result from memory, then disk, or None"""
+    entry = cache_entry(key)
+    return entry[0] if entry is not None and entry[2] else None
+
+
+def cache_store(key, result, ttl, stale_ttl=0):
+    RESULT_CACHE.set(key, result, ttl, stale_ttl)
+    if DISK_CACHE is not None:
+        DISK_CACHE.set(key, result, ttl, stale_ttl)
+
+
+def request_area():
+    """The validated GeoJSON area posted with a metric request, or None for lat/lon/radius"""
+    if request.method != 'POST':
+        return None
+    if 'area' not in g:
+        g.area = parse_area(request.get_json(silent=True))
+    return g.area
+
+
+def parse_location(args, area=None):
+    """(lat, lon, radius in metres) from query params, or the centroid and equal-area radius of `area`"""
+    if area is not None:
+        return area.centroid[0], area.centroid[1], area.radius_m
+    lat = float(args.get('lat', 0))
+    lon = float(args.get('lon', 0))
+    radius = float(args.get('radius', 10)) * 1000  # km to meters
+    return lat, lon, radius
+
+
+def request_location(area):
+    """(lat, lon, radius in metres) of the current request"""
+    return parse_location(request.args, area)
+
+
+def request_region(area, point, radius, scale):
+    """The region to reduce over: the posted area simplified for `scale`, or the buffered point"""
+    return area.region(scale) if area is not None else point.buffer(radius)
+
+
+# Expired entries are served (marked stale) for one more dataset cadence while
+# a background worker recomputes them, so users rarely wait on Earth Engine
+STALE_WHILE_REVALIDATE = os.getenv('EE_STALE_WHILE_REVALIDATE', 'true').lower() != 'false'
+REFRESH_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv('EE_REFRESH_WORKERS', 4)), thread_name_prefix='ee-refresh'
+)
+REFRESHING = set()
+REFRESH_LOCK = threading.Lock()
+
+
+def cached_response(result, age, stale=False):
+    """A cache hit, with the age of its data and, once expired, a stale flag"""
+    response = respond({**result, 'stale': True} if stale else result)
+    response.headers['X-Data-Age'] = str(int(age))
+    return response
+
+
+def refresh_in_background(key, view, args, kwargs, ttl, stale_ttl):
+    """Rerun the current request off the request path to replace a stale entry, once per key at a time"""
+    with REFRESH_LOCK:
+        if key in REFRESHING:
+            return
+        REFRESHING.add(key)
+
+    route = request.url_rule.rule if request.url_rule else request.path
+    context = {
+        'path': request.path, 'query_string': request.query_string.decode(), 'method': request.method,
+        'data': request.get_data(), 'content_type': request.content_type,
+    }
+
+    def refresh():
+        stats = begin_task(f'refresh:{route}')
+        set_priority('background')
+        status = 500
+        try:
+            with app.test_request_context(**context):
+                response = view(*args, **kwargs)
+                if not isinstance(response, tuple):
+                    status = response.status_code
+                if status == 200 and 'result' in g:
+                    cache_store(key, g.result, ttl, stale_ttl)
+        except Exception as e:
+            log.warning('Background refresh failed', extra={'route': route, 'error': str(e)})
+        finally:
+            end_task(stats, status)
+            with REFRESH_LOCK:
+                REFRESHING.discard(key)
+
+    REFRESH_EXECUTOR.submit(refresh)
+
+
+def cached(dataset):
+    """
+    Serve a metric route from the result cache, keyed on snapped location and
+    params; stale entries are served while they are refreshed in the background
+    """
+    ttl = DATASET_TTLS[dataset]
+    stale_ttl = DATASET_STALE_TTLS[dataset] if STALE_WHILE_REVALIDATE else 0
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not CACHE_ENABLED:
+                return view(*args, **kwargs)
+
+            try:
+                key = cache_key(request.path, request.args, request_area())
+            except ValueError:
+                key = None
+            if key is None:
+                return view(*args, **kwargs)
+
+            entry = cache_entry(key)
+            if entry is not None:
+                result, age, fresh = entry
+                if not fresh:
+                    refresh_in_background(key, view, args, kwargs, ttl, stale_ttl)
+                return cached_response(result, age, stale=not fresh)
+
+            response = view(*args, **kwargs)
+            if not isinstance(response, tuple) and response.status_code == 200 and 'result' in g:
+                cache_store(key, g.result, ttl, stale_ttl)
+                response.headers['X-Data-Age'] = '0'
+            return response
+        return wrapper
+    return decorator
+
+
+# Bounded pool for concurrent sub-metric computations
+ASSESSMENT_WORKERS = int(os.getenv('EE_ASSESSMENT_WORKERS', 12))
+METRIC_TIMEOUT = float(os.getenv('EE_METRIC_TIMEOUT', 20))
+ASSESSMENT_EXECUTOR = ThreadPoolExecutor(max_workers=ASSESSMENT_WORKERS, thread_name_prefix='ee-assessment')
+
+
+# Routes whose Earth Engine calls queue behind interactive map requests (see scheduler.py)
+BATCH_ROUTES = ('/batch/<metric>', '/environmental-assessment/batch', '/large-area/<metric>')
+
+
+@app.before_request
+def start_request_timer():
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    begin_request(route)
+    set_priority('batch' if route in BATCH_ROUTES else 'interactive')
+    g.format = negotiate(request.headers.get('Accept'), request.args.get('format'))
+
+
+@app.errorhandler(NotAcceptable)
+def not_acceptable(e):
+    return jsonify({'error': str(e), 'available': e.available}), 406
+
+
+def respond(result, rows=None):
+    """A successful response in the negotiated format; the result is kept in g for the cache"""
+    g.result = result
+    fmt = g.get('format', 'json')
+    if fmt == 'json':
+        return jsonify(result)
+    return Response(encode(result, fmt, rows), mimetype=content_type(fmt))
+
+
+def stream_response(items):
+    """A streamed response of objects (batch rows, progress events) in the negotiated format"""
+    fmt = g.get('format', 'json')
+    return Response(encode_stream(items, fmt), mimetype=content_type(fmt, stream=True))
+
+
+def error_response(e):
+    """500 for a failed request, or 503 with Retry-After when Earth Engine capacity ran out"""
+    if isinstance(e, Overloaded):
+        response = jsonify({'error': str(e), 'retry_after': e.retry_after})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response
+    return jsonify({'error': str(e)}), 500
+
+
+@app.after_request
+def record_request(response):
+    stats = current_request()
+    if stats is None:
+        return response
+
+    def finish():
+        duration = end_request(stats, response.status_code)
+        log.info('request', extra={
+            'route': stats.route,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 1),
+            'ee_calls': stats.ee_calls,
+            'ee_ms': round(stats.ee_seconds * 1000, 1)
         })
-    except Exception as e:
-        print(f"[ERROR] NDVI calculation failed: {e}")
-        return jsonify({'error': str(e)}), 500
 
+    # Streamed responses (batch NDJSON) are timed until the last chunk is sent
+    if response.is_streamed:
+        response.call_on_close(finish)
+    else:
+        finish()
+    return response
+
+
+@app.after_request
+def compress_response(response):
+    """Compress responses with brotli or gzip when the client accepts it (see formats.py)"""
+    response.vary.update(('Accept', 'Accept-Encoding'))
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+    if encoding is None or response.direct_passthrough \
+            or not compressible(response.mimetype, response.content_encoding):
+        return response
+
+    if response.is_streamed:
+        response.response = compress_chunks(response.response, encoding)
+    else:
+        body = response.get_data()
+        if len(body) < COMPRESS_MIN_BYTES:
+            return response
+        response.set_data(compress(body, encoding))
+    response.content_encoding = encoding
+    return response
+
+
+def cache_gauges(field):
+    """Scrape-time values of one stats field for each cache tier"""
+    def collect():
+        values = {}
+        if CACHE_ENABLED:
+            values[('memory',)] = RESULT_CACHE.stats()[field]
+        if DISK_CACHE is not None:
+            values[('disk',)] = DISK_CACHE.stats()[field]
+        return values
+    return collect
+
+
+REGISTRY.gauge('ee_service_cache_hits', 'Result cache hits', ['tier'], cache_gauges('hits'))
+REGISTRY.gauge('ee_service_cache_misses', 'Result cache misses', ['tier'], cache_gauges('misses'))
+REGISTRY.gauge('ee_service_cache_hit_ratio', 'Result cache hit ratio', ['tier'], cache_gauges('hit_ratio'))
+REGISTRY.gauge('ee_service_cache_bytes', 'Result cache size in bytes', ['tier'], cache_gauges('bytes'))
+REGISTRY.gauge('ee_service_coalesced_requests', 'Requests that shared an in-flight EE computation', [],
+               lambda: {(): IN_FLIGHT.stats()['shared']})
+REGISTRY.gauge('ee_service_earth_engine_initialized', 'Whether this worker has an EE session', [],
+               lambda: {(): int(EE.initialized)})
+REGISTRY.gauge('ee_scheduler_running', 'Earth Engine calls in flight', [],
+               lambda: {(): SCHEDULER.stats()['running']})
+REGISTRY.gauge('ee_scheduler_waiting', 'Earth Engine calls waiting for a slot', ['priority'],
+               lambda: {(name,): count for name, count in SCHEDULER.stats()['waiting'].items()})
+REGISTRY.gauge('ee_scheduler_rejected', 'Earth Engine calls rejected with 503 by the scheduler', [],
+               lambda: {(): SCHEDULER.stats()['rejected']})
+REGISTRY.gauge('ee_scheduler_quota_retries', 'Earth Engine calls retried after a quota error', [],
+               lambda: {(): SCHEDULER.stats()['quota_retries']})
+
+
+@app.route('/prometheus', methods=['GET'])
+def prometheus():
+    """Prometheus metrics for this worker process"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
 
-@app.route('/landcover', methods=['GET'])
-def get_landcover():
-    """Get ESA WorldCover land classification"""
-    if not EE_INITIALIZED:
-        return jsonify({'error': 'Earth Engine not initialized'}), 500
 
-    try:
-        lat = float(request.args.get('lat', 0))
-        lon = float(request.args.get('lon', 0))
-        radius = float(request.args.get('radius', 10)) * 1000  # km to meters
+@app.route('/health', methods=['GET'])
+def health():
+    """Health check endpoint"""
+    return jsonify({
+        'status': 'ok',
+        'earth_engine': 'initialized' if EE.ensure() else 'failed',
+        'earth_engine_init': EE.status(),
+        'cache': RESULT_CACHE.stats() if CACHE_ENABLED else 'disabled',
+        'disk_cache': DISK_CACHE.stats() if DISK_CACHE is not None else 'disabled',
+        'coalescing': IN_FLIGHT.stats(),
+        'scheduler': SCHEDULER.stats(),
+        'grid': {'path': GRID.path, 'layers': GRID.layers} if GRID else 'none',
+        'rasters': {'path': RASTERS.path, 'regions': RASTERS.regions} if RASTERS else 'none',
+        'jobs': JOBS.stats() if JOBS is not None else 'disabled',
+        'timestamp': datetime.utcnow().isoformat()
+    })
 
-        # Create point and buffer
-        point = ee.Geometry.Point([lon, lat])
-        region = point.buffer(radius)
 
-        # Get ESA WorldCover 2021 (or 2020)
-        try:
-            worldcover = ee.ImageCollection('ESA/WorldCover/v200').first()
-        except:
-            worldcover = ee.ImageCollection('ESA/WorldCover/v100').first()
-
-        # Land cover class names
-        class_names = {
-            10: 'Tree cover',
-            20: 'Shrubland',
-            30: 'Grassland',
-            40: 'Cropland',
-            50: 'Built-up',
-            60: 'Bare/sparse vegetation',
-            70: 'Snow and ice',
-            80: 'Water bodies',
-            90: 'Herbaceous wetland',
-            95: 'Mangroves',
-            100: 'Moss and lichen'
+# Land cover class names (ESA WorldCover)
+LANDCOVER_CLASSES = {
+    10: 'Tree cover',
+    20: 'Shrubland',
+    30: 'Grassland',
+    40: 'Cropland',
+    50: 'Built-up',
+    60: 'Bare/sparse vegetation',
+    70: 'Snow and ice',
+    80: 'Water bodies',
+    90: 'Herbaceous wetland',
+    95: 'Mangroves',
+    100: 'Moss and lichen'
+}
+
+
+def stat(stats, key, default=0):
+    """Read a reduction output, treating a null (fully masked region) as the default"""
+    value = stats.get(key)
+    return default if value is None else value
+
+
+# Formatters turn the statistics fetched for a metric into the JSON shape its
+# route returns. What is fetched, and how, is declared in datasets.py;
+# reductions stay server-side (unevaluated) so that /metrics can combine several
+# into one getInfo() round trip and /batch can run the same reduction over many
+# sites with reduceRegions.
+
+
+def format_ndvi(info):
+    stats = info.get('stats') or {}
+    if info.get('image_count', 0) == 0 or stats.get('NDVI_mean') is None:
+        if info.get('image_count', 0) == 0:
+            message = 'No satellite images available for this location'
+        else:
+            # Images, but every pixel of the region is masked
+            message = 'No valid pixels in the satellite images for this location'
+        return {
+            'mean': 0,
+            'min': 0,
+            'max': 0,
+            'stdDev': 0,
+            'cloudCover': 0,
+            'timestamp': datetime.utcnow().isoformat(),
+            'source': 'Sentinel-2 SR Harmonized',
+            'info': message
         }
 
-        # Get frequency histogram - count pixels per class
-        histogram = worldcover.select('Map').reduceRegion(
-            reducer=ee.Reducer.frequencyHistogram(),
-            geometry=region,
-            scale=10,
-            maxPixels=1e9
-        ).getInfo()
-
-        # Parse results
-        class_counts = histogram.get('Map', {})
-        total_pixels = sum(class_counts.values()) if class_counts else 0
-
-        classes = {}
-        for class_id, count in class_counts.items():
-            class_num = int(class_id)
-            percentage = (count / total_pixels * 100) if total_pixels > 0 else 0
-
-            classes[class_id] = {
-                'name': class_names.get(class_num, 'Unknown'),
-                'percentage': round(percentage, 1),
-                'pixel_count': int(count)
-            }
-
-        print(f"[INFO] Land cover - {len(classes)} classes found")
+    cloud_cover = info.get('cloud_cover') or 0
+    log.info('NDVI computed', extra={
+        'ndvi_mean': stat(stats, 'NDVI_mean'),
+        'cloud_cover': cloud_cover,
+        'window_days': info.get('window_days')
+    })
 
-        return jsonify({
-            'classes': classes,
-            'timestamp': datetime.utcnow().isoformat(),
-            'source': 'ESA WorldCover v200'
-        })
-    except Exception as e:
-        print(f"[ERROR] Land cover calculation failed: {e}")
-        return jsonify({'error': str(e)}), 500
+    return {
+        'mean': round(stat(stats, 'NDVI_mean'), 3),
+        'min': round(stat(stats, 'NDVI_min'), 3),
+        'max': round(stat(stats, 'NDVI_max'), 3),
+        'stdDev': round(stat(stats, 'NDVI_stdDev'), 3),
+        'cloudCover': round(cloud_cover, 1),
+        'window_days': info.get('window_days'),
+        'cloud_filtered': info.get('cloud_filtered'),
+        'timestamp': datetime.utcnow().isoformat(),
+        'source': 'Sentinel-2 SR Harmonized (Real Data)'
+    }
+
+
+def format_landcover(histogram):
+    # Parse results
+    class_counts = histogram.get('Map') or {}
+    total_pixels = sum(class_counts.values()) if class_counts else 0
+
+    classes = {}
+    for class_id, count in class_counts.items():
+        class_num = int(class_id)
+        percentage = (count / total_pixels * 100) if total_pixels > 0 else 0
+
+        classes[class_id] = {
+            'name': LANDCOVER_CLASSES.get(class_num, 'Unknown'),
+            'percentage': round(percentage, 1),
+            'pixel_count': int(count)
+        }
 
+    log.info('Land cover computed', extra={'classes': len(classes)})
+
+    return {
+        'classes': classes,
+        'timestamp': datetime.utcnow().isoformat(),
+        'source': 'ESA WorldCover v200'
+    }
+
+
+def format_temperature(stats):
+    return {
+        'mean_celsius': round(stat(stats, 'LST_Day_1km_mean'), 1),
+        'min_celsius': round(stat(stats, 'LST_Day_1km_min'), 1),
+        'max_celsius': round(stat(stats, 'LST_Day_1km_max'), 1),
+        'timestamp': datetime.utcnow().isoformat(),
+        'source': 'MODIS MOD11A1'
+    }
+
+
+def format_soil_moisture(stats):
+    return {
+        'mean': round(stat(stats, 'sm_surface_mean'), 3),
+        'min': round(stat(stats, 'sm_surface_min'), 3),
+        'max': round(stat(stats, 'sm_surface_max'), 3),
+        'timestamp': datetime.utcnow().isoformat(),
+        'source': 'SMAP SPL4SMGP',
+        'unit': 'm³/m³'
+    }
+
+
+def format_precipitation(stats):
+    return {
+        'total_mm': round(stat(stats, 'precipitation'), 2),
+        'timestamp': datetime.utcnow().isoformat(),
+        'source': 'GPM IMERG V06',
+        'period': '30 days'
+    }
+
+
+def format_evapotranspiration(stats):
+    return {
+        'mean_mm_8day': round(stat(stats, 'ET'), 2),
+        'timestamp': datetime.utcnow().isoformat(),
+        'source': 'MODIS MOD16A2GF',
+        'unit': 'mm/8-day'
+    }
+
+
+def format_surface_water(stats):
+    return {
+        'water_occurrence_pct': round(stat(stats, 'occurrence'), 1),
+        'timestamp': datetime.utcnow().isoformat(),
+        'source': 'JRC Global Surface Water v1.4',
+        'info': 'Percentage of time water was present (1984-2021)'
+    }
+
+
+def format_air_quality(stats):
+    return {
+        'no2_mol_m2': stat(stats, 'tropospheric_NO2_column_number_density'),
+        'timestamp': datetime.utcnow().isoformat(),
+        'source': 'Sentinel-5P TROPOMI',
+        'pollutant': 'NO2',
+        'unit': 'mol/m²'
+    }
+
+
+def format_fire(stats):
+    return {
+        'fire_detections': int(stat(stats, 'MaxFRP')),
+        'timestamp': datetime.utcnow().isoformat(),
+        'source': 'MODIS MOD14A1',
+        'period': '7 days'
+    }
+
+
+# Metric name -> response formatter
+METRICS = {
+    'ndvi': format_ndvi,
+    'landcover': format_landcover,
+    'temperature': format_temperature,
+    'soil-moisture': format_soil_moisture,
+    'precipitation': format_precipitation,
+    'evapotranspiration': format_evapotranspiration,
+    'surface-water': format_surface_water,
+    'air-quality': format_air_quality,
+    'fire': format_fire,
+}
+
+
+# Rolling-window routes assembled from stored per-day partials (see rolling.py):
+# how the days of the metric's window combine and how many days after the fact
+# a day's data can still change. Each day is composited as the metric declares.
+# Only sum composites are listed: their daily statistics add up to the
+# composite's exactly, so warm and cold cells answer the same question, while
+# median-composited metrics (temperature, air quality) stay single reductions.
+# A cell's first request is answered with the single composite reduction; its
+# daily partials are only backfilled if it is asked for again within
+# ROLLING_WARM_TTL, so one-off lookups do not pay for a reduction per day.
+ROLLING_ENABLED = os.getenv('EE_ROLLING_ENABLED', 'true').lower() != 'false'
+ROLLING_WARM_TTL = int(os.getenv('EE_ROLLING_WARM_TTL', 7 * DAY))
+ROLLING = {
+    'precipitation': {'combine': 'sum', 'settle_days': 2},
+}
+
+
+def metric_params(name, radius, quality):
+    """reduceRegion parameters for a metric over a circle of `radius` metres (see scale_policy.py)"""
+    return reduction_params(DATASETS[name]['scale'], radius, quality)
+
+
+def metric_reduction(name, point, region, params):
+    """Build the unevaluated statistics for one metric over a region"""
+    image, context = source(name, point)
+    stats = image.reduceRegion(reducer=reducer(DATASETS[name]['reducer']), geometry=region, **params)
+    return context.set('stats', stats) if context is not None else stats
+
+
+def format_metric(name, info, params, quality):
+    """Format fetched statistics, reporting the scale they were reduced at"""
+    result = METRICS[name](info)
+    result['scale_m'] = params['scale']
+    result['quality'] = quality
+    return result
+
+
+def compute_metric(name, point, region, radius, quality=DEFAULT_QUALITY):
+    """Evaluate a single metric with one getInfo() call"""
+    params = metric_params(name, radius, quality)
+    return format_metric(name, get_info(metric_reduction(name, point, region, params), name), params, quality)
+
+
+def compute_metrics(names, point, region, radius, quality=DEFAULT_QUALITY):
+    """Evaluate several metrics in a single combined getInfo() round trip"""
+    params = {name: metric_params(name, radius, quality) for name in names}
+    combined = ee.Dictionary({name: metric_reduction(name, point, region, params[name]) for name in names})
+    info = get_info(combined, '+'.join(names))
+    return {name: format_metric(name, info[name], params[name], quality) for name in names}
+
+
+def refresh_periods(key, ranges, ttl, settled, fetch):
+    """
+    Per-period entries for `ranges` from the series stored under `key`. Only
+    periods not stored yet, or unsettled and older than `ttl`, are fetched (in
+    one call to fetch(missing ranges)). Returns (entries in order, number fetched).
+    """
+    stored = (cache_lookup(key) or {}) if CACHE_ENABLED else {}
+
+    now = time.time()
+    reusable = {
+        start: entry for start, entry in stored.items()
+        if entry['final'] or now - entry['fetched_at'] < ttl
+    }
+    missing = [r for r in ranges if r[0].isoformat() not in reusable]
+    fetched = fetch(missing) if missing else []
+
+    for entry in fetched:
+        entry['final'] = settled(datetime.strptime(entry['end'], '%Y-%m-%d').date())
+        entry['fetched_at'] = now
+        reusable[entry['date']] = entry
+    if fetched and CACHE_ENABLED:
+        # Keep the newest periods, enough for the longest series a request can ask for
+        cache_store(key, dict(sorted(reusable.items())[-MAX_PERIODS:]), None)
+
+    return [reusable[start.isoformat()] for start, _ in ranges], len(fetched)
+
+
+def compute_rolling(name, lat, lon, radius, region, quality=DEFAULT_QUALITY, geometry=None):
+    """
+    Evaluate a rolling-window metric from stored daily partials, fetching only
+    missing days. `geometry` is the hash of a posted area, which keys its partials.
+    """
+    spec, dataset = ROLLING[name], DATASETS[name]
+    today = datetime.utcnow().date()
+    # Same days as datasets.date_window(): the full days of the window before today
+    days = period_ranges('daily', dataset['window_days'], today - timedelta(days=1))
+    params = metric_params(name, radius, quality)
+    key = RESULT_CACHE.make_key(
+        f'/rolling/{name}', lat, lon, {'radius': radius, 'scale': params['scale'], 'geometry': geometry}
+    )
+
+    def fetch(missing):
+        return fetch_days(
+            prepared(name, filtered(name, region)), lambda images: composite(name, images),
+            reducer(dataset['reducer']), region, params, missing, name
+        )
+
+    def settled(end):
+        return end + timedelta(days=spec['settle_days']) <= today
+
+    if cache_lookup(key) is None:
+        # Cold cell: one reduction of the composite, and an empty series marking the cell as seen
+        result = compute_metric(name, region, region, radius, quality)
+        cache_store(key, {}, ROLLING_WARM_TTL)
+        result['fetched_days'] = 0
+        return result
+
+    entries, fetched = refresh_periods(key, days, DATASET_TTLS[dataset['dataset']], settled, fetch)
+    result = format_metric(name, combine(entries, spec['combine']), params, quality)
+    result['fetched_days'] = fetched
+    return result
+
+
+def layer_max_age(name):
+    """
+    Seconds a precomputed layer of a metric (grid or raster) may answer for:
+    as long as a cached result could, or None for static layers
+    """
+    dataset = DATASETS[name]['dataset']
+    ttl = DATASET_TTLS[dataset]
+    return ttl + DATASET_STALE_TTLS[dataset] if ttl is not None else None
+
+
+def grid_metric(name, lat, lon, radius_km, quality=DEFAULT_QUALITY):
+    """Answer a metric from the precomputed grid, or None to fall back to Earth Engine"""
+    if GRID is None:
+        return None
+
+    # Grids of changing layers (NDVI) serve for as long as a cached result could
+    stats = GRID.stats(name, lat, lon, radius_km, layer_max_age(name))
+    if stats is None:
+        return None
+
+    layer = GRID.layer_info(name)
+    if name == 'ndvi':
+        stats = {
+            'image_count': 1 if stats else 0,
+            'window_days': layer.get('window_days'),
+            'cloud_filtered': True,
+            'cloud_cover': layer.get('cloud_cover'),
+            'stats': stats
+        }
 
-@app.route('/temperature', methods=['GET'])
-def get_temperature():
-    """Get MODIS Land Surface Temperature"""
-    if not EE_INITIALIZED:
-        return jsonify({'error': 'Earth Engine not initialized'}), 500
+    # Cells are reduced at the layer's native scale whatever the quality asked for
+    result = format_metric(name, stats, {'scale': layer['scale']}, quality)
+    result['precomputed'] = True
+    return result
+
+
+def raster_metric(name, lat, lon, radius, quality=DEFAULT_QUALITY, area=None):
+    """Answer a metric from a hot region's local raster, or None to fall back to Earth Engine"""
+    if RASTERS is None or name not in RASTER_LAYERS:
+        return None
+
+    # Reduce at the scale and over the simplified outline a live query would use
+    scale = metric_params(name, radius, quality)['scale']
+    polygons = None
+    if area is not None:
+        polygons = [[np.asarray(ring) for ring in rings] for rings in area.simplified(scale * SIMPLIFY_FRACTION)]
+
+    # Rasters of changing layers (NDVI) serve for as long as a cached result could
+    found = RASTERS.stats(name, lat, lon, radius, polygons, scale, layer_max_age(name))
+    if found is None:
+        return None
+    stats, region, layer = found
+    context = layer.get('context')
+    # Pixels are subsampled to the requested scale, in whole steps of the raster's own
+    reduced_at = layer['scale'] * max(1, int(round(scale / layer['scale'])))
+    info = {**context, 'stats': stats} if context is not None else stats
+    result = format_metric(name, info, {'scale': reduced_at}, quality)
+    result['precomputed'] = True
+    result['hot_region'] = region
+    return result
+
+
+def serve_metric(name, label):
+    """
+    Respond with one metric for the lat/lon/radius query params, or for a
+    GeoJSON area in a POST body, at the requested quality
+    """
+    try:
+        quality = parse_quality(request.args)
+        area = request_area()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
     try:
-        lat = float(request.args.get('lat', 0))
-        lon = float(request.args.get('lon', 0))
-        radius = float(request.args.get('radius', 10)) * 1000  # km to meters
+        lat, lon, radius = request_location(area)
+
+        # Hot regions' rasters, and static layers inside the precomputed grid, need no Earth Engine call
+        result = raster_metric(name, lat, lon, radius, quality, area)
+        if result is None and name in GRID_ROUTE_METRICS and area is None:
+            result = grid_metric(name, lat, lon, radius / 1000, quality)
+        if result is not None:
+            return respond({**result, 'area': area.describe()} if area is not None else result)
+
+        if not EE.ensure():
+            return jsonify({'error': 'Earth Engine not initialized'}), 500
 
         # Create point and buffer
         point = ee.Geometry.Point([lon, lat])
-        region = point.buffer(radius)
+        region = request_region(area, point, radius, metric_params(name, radius, quality)['scale'])
+        geometry = area.hash if area is not None else None
 
-        # Get recent MODIS LST data (last 30 days)
-        end_date = datetime.utcnow()
-        start_date = end_date - timedelta(days=30)
+        key = (name, round(lat, 6), round(lon, 6), radius, quality, geometry)
+        # Rolling windows are rebuilt from stored daily partials, which live in the cache
+        if name in ROLLING and ROLLING_ENABLED and CACHE_ENABLED:
+            result = IN_FLIGHT.do(key, compute_rolling, name, lat, lon, radius, region, quality, geometry)
+        else:
+            result = IN_FLIGHT.do(key, compute_metric, name, point, region, radius, quality)
+        return respond({**result, 'area': area.describe()} if area is not None else result)
+    except Exception as e:
+        log.error(f'{label} failed', extra={'error': str(e)})
+        return error_response(e)
 
-        collection = ee.ImageCollection('MODIS/061/MOD11A1') \
-            .filterBounds(point) \
-            .filterDate(start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')) \
-            .select('LST_Day_1km')
 
-        # Convert from Kelvin to Celsius and get mean
-        def kelvin_to_celsius(image):
-            return image.multiply(0.02).subtract(273.15)
+# One cached route per registered metric, e.g. GET /soil-moisture, or POST with a GeoJSON area
+for _name in METRICS:
+    app.add_url_rule(
+        f'/{_name}', f"get_{_name.replace('-', '_')}",
+        cached(DATASETS[_name]['dataset'])(partial(serve_metric, _name, DATASETS[_name]['label'])),
+        methods=['GET', 'POST']
+    )
 
-        lst_celsius = collection.map(kelvin_to_celsius).median()
 
-        # Calculate statistics
-        stats = lst_celsius.reduceRegion(
-            reducer=ee.Reducer.mean().combine(
-                ee.Reducer.minMax(), '', True
-            ),
-            geometry=region,
-            scale=1000,
-            maxPixels=1e9
-        ).getInfo()
+@app.route('/metrics', methods=['GET', 'POST'])
+def get_metrics():
+    """Get several metrics for one location in a single Earth Engine round trip"""
+    if not EE.ensure():
+        return jsonify({'error': 'Earth Engine not initialized'}), 500
 
+    names = [n.strip() for n in request.args.get('names', '').split(',') if n.strip()]
+    unknown = [n for n in names if n not in METRICS]
+    if not names or unknown:
         return jsonify({
-            'mean_celsius': round(stats.get('LST_Day_1km_mean', 0), 1),
-            'min_celsius': round(stats.get('LST_Day_1km_min', 0), 1),
-            'max_celsius': round(stats.get('LST_Day_1km_max', 0), 1),
-            'timestamp': datetime.utcnow().isoformat(),
-            'source': 'MODIS MOD11A1'
-        })
-    except Exception as e:
-        print(f"[ERROR] Temperature calculation failed: {e}")
-        return jsonify({'error': str(e)}), 500
-
+            'error': f"Unknown metrics: {', '.join(unknown)}" if unknown else 'No metrics requested',
+            'available': list(METRICS)
+        }), 400
 
-@app.route('/soil-moisture', methods=['GET'])
-def get_soil_moisture():
-    """Get SMAP Soil Moisture"""
-    if not EE_INITIALIZED:
-        return jsonify({'error': 'Earth Engine not initialized'}), 500
+    try:
+        quality = parse_quality(request.args)
+        area = request_area()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
     try:
-        lat = float(request.args.get('lat', 0))
-        lon = float(request.args.get('lon', 0))
-        radius = float(request.args.get('radius', 10)) * 1000  # km to meters
+        lat, lon, radius = request_location(area)
 
-        # Create point and buffer
         point = ee.Geometry.Point([lon, lat])
-        region = point.buffer(radius)
-
-        # Get recent SMAP data (last 30 days)
-        end_date = datetime.utcnow()
-        start_date = end_date - timedelta(days=30)
-
-        collection = ee.ImageCollection('NASA/SMAP/SPL4SMGP/007') \
-            .filterBounds(point) \
-            .filterDate(start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')) \
-            .select('sm_surface')
-
-        # Get median soil moisture
-        sm_median = collection.median()
-
-        # Calculate statistics
-        stats = sm_median.reduceRegion(
-            reducer=ee.Reducer.mean().combine(
-                ee.Reducer.minMax(), '', True
-            ),
-            geometry=region,
-            scale=11000,
-            maxPixels=1e9
-        ).getInfo()
+        # One region serves every metric, so simplify for the finest scale among them
+        scale = min(metric_params(name, radius, quality)['scale'] for name in names)
+        region = request_region(area, point, radius, scale)
+        key = ('metrics', tuple(names), round(lat, 6), round(lon, 6), radius, quality, area and area.hash)
 
-        return jsonify({
-            'mean': round(stats.get('sm_surface_mean', 0), 3),
-            'min': round(stats.get('sm_surface_min', 0), 3),
-            'max': round(stats.get('sm_surface_max', 0), 3),
+        response = {
+            'coordinates': {'lat': lat, 'lon': lon},
+            'radius_km': radius / 1000,
             'timestamp': datetime.utcnow().isoformat(),
-            'source': 'SMAP SPL4SMGP',
-            'unit': 'm³/m³'
-        })
+            'metrics': IN_FLIGHT.do(key, compute_metrics, names, point, region, radius, quality)
+        }
+        if area is not None:
+            response['area'] = area.describe()
+        return respond(response)
     except Exception as e:
-        print(f"[ERROR] Soil moisture calculation failed: {e}")
-        return jsonify({'error': str(e)}), 500
+        log.error('Combined metrics failed', extra={'error': str(e), 'metrics': names})
+        return error_response(e)
 
 
-@app.route('/precipitation', methods=['GET'])
-def get_precipitation():
-    """Get GPM IMERG Precipitation"""
-    if not EE_INITIALIZED:
-        return jsonify({'error': 'Earth Engine not initialized'}), 500
-
+def parse_timeseries(args):
+    """Validate the period, periods and quality query params, returning (period, count, quality)"""
+    period = args.get('period', 'weekly')
+    if period not in DEFAULT_PERIODS:
+        raise ValueError(f"period must be one of: {', '.join(DEFAULT_PERIODS)}")
     try:
-        lat = float(request.args.get('lat', 0))
-        lon = float(request.args.get('lon', 0))
-        radius = float(request.args.get('radius', 10)) * 1000  # km to meters
-
-        # Create point and buffer
-        point = ee.Geometry.Point([lon, lat])
-        region = point.buffer(radius)
-
-        # Get recent precipitation data (last 30 days)
-        end_date = datetime.utcnow()
-        start_date = end_date - timedelta(days=30)
-
-        collection = ee.ImageCollection('NASA/GPM_L3/IMERG_V06') \
-            .filterBounds(point) \
-            .filterDate(start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')) \
-            .select('precipitation')
-
-        # Calculate total precipitation
-        total_precip = collection.sum()
+        count = int(args.get('periods', DEFAULT_PERIODS[period]))
+    except ValueError:
+        raise ValueError('periods must be an integer')
+    if not 1 <= count <= MAX_PERIODS:
+        raise ValueError(f'periods must be between 1 and {MAX_PERIODS}')
+    return period, count, parse_quality(args)
+
+
+def compute_timeseries(name, lat, lon, radius, period, count, region, quality=DEFAULT_QUALITY, geometry=None):
+    """
+    Return the series of the last `count` periods. With the cache enabled the
+    stored series is extended incrementally: settled periods are reused and
+    only new or still-changing periods are fetched, all in one getInfo().
+    `geometry` is the hash of a posted area, which keys its stored series.
+    """
+    ranges = period_ranges(period, count)
+    params = reduction_params(series_scale(name), radius, quality)
+    key = RESULT_CACHE.make_key(
+        f'/timeseries/{name}', lat, lon,
+        {'radius': radius, 'period': period, 'scale': params['scale'], 'geometry': geometry}
+    )
+    points, fetched = refresh_periods(
+        key, ranges, DATASET_TTLS[DATASETS[name]['dataset']],
+        lambda end: is_final(name, end),
+        lambda missing: fetch_points(name, region, missing, params)
+    )
+
+    return {
+        'metric': name,
+        'period': period,
+        'coordinates': {'lat': lat, 'lon': lon},
+        'radius_km': radius / 1000,
+        'unit': SERIES[name]['unit'],
+        'source': DATASETS[name]['dataset'],
+        'scale_m': params['scale'],
+        'quality': quality,
+        'points': [{k: v for k, v in p.items() if k != 'fetched_at'} for p in points],
+        'fetched_periods': fetched,
+        'cached_periods': len(points) - fetched,
+        'timestamp': datetime.utcnow().isoformat()
+    }
 
-        # Calculate statistics
-        stats = total_precip.reduceRegion(
-            reducer=ee.Reducer.mean(),
-            geometry=region,
-            scale=11000,
-            maxPixels=1e9
-        ).getInfo()
 
-        return jsonify({
-            'total_mm': round(stats.get('precipitation', 0), 2),
-            'timestamp': datetime.utcnow().isoformat(),
-            'source': 'GPM IMERG V06',
-            'period': '30 days'
-        })
-    except Exception as e:
-        print(f"[ERROR] Precipitation calculation failed: {e}")
-        return jsonify({'error': str(e)}), 500
+@app.route('/timeseries/<metric>', methods=['GET', 'POST'])
+def get_timeseries(metric):
+    """Get a daily, weekly or monthly series of a metric in one Earth Engine job"""
+    if metric not in SERIES:
+        return jsonify({'error': f'Unknown metric: {metric}', 'available': list(SERIES)}), 404
 
+    try:
+        period, count, quality = parse_timeseries(request.args)
+        area = request_area()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-@app.route('/evapotranspiration', methods=['GET'])
-def get_evapotranspiration():
-    """Get MODIS Evapotranspiration"""
-    if not EE_INITIALIZED:
+    if not EE.ensure():
         return jsonify({'error': 'Earth Engine not initialized'}), 500
 
     try:
-        lat = float(request.args.get('lat', 0))
-        lon = float(request.args.get('lon', 0))
-        radius = float(request.args.get('radius', 10)) * 1000  # km to meters
+        lat, lon, radius = request_location(area)
 
-        # Create point and buffer
         point = ee.Geometry.Point([lon, lat])
-        region = point.buffer(radius)
-
-        # Get recent ET data (last 60 days, MOD16A2 is 8-day composite)
-        end_date = datetime.utcnow()
-        start_date = end_date - timedelta(days=60)
-
-        collection = ee.ImageCollection('MODIS/061/MOD16A2GF') \
-            .filterBounds(point) \
-            .filterDate(start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')) \
-            .select('ET')
-
-        # Get median ET (scale factor 0.1)
-        et_median = collection.median().multiply(0.1)
-
-        # Calculate statistics
-        stats = et_median.reduceRegion(
-            reducer=ee.Reducer.mean(),
-            geometry=region,
-            scale=500,
-            maxPixels=1e9
-        ).getInfo()
-
-        return jsonify({
-            'mean_mm_8day': round(stats.get('ET', 0), 2),
-            'timestamp': datetime.utcnow().isoformat(),
-            'source': 'MODIS MOD16A2GF',
-            'unit': 'mm/8-day'
-        })
+        region = request_region(area, point, radius, reduction_params(series_scale(metric), radius, quality)['scale'])
+        geometry = area.hash if area is not None else None
+        key = ('timeseries', metric, period, count, round(lat, 6), round(lon, 6), radius, quality, geometry)
+        result = IN_FLIGHT.do(
+            key, compute_timeseries, metric, lat, lon, radius, period, count, region, quality, geometry
+        )
+        return respond({**result, 'area': area.describe()} if area is not None else result)
     except Exception as e:
-        print(f"[ERROR] Evapotranspiration calculation failed: {e}")
-        return jsonify({'error': str(e)}), 500
-
+        log.error('Time series failed', extra={'error': str(e), 'metric': metric})
+        return error_response(e)
+
+
+# Large-area mode: tiles reduced at once per request (see tiling.py)
+TILE_CONCURRENCY = int(os.getenv('EE_TILE_CONCURRENCY', 8))
+TILE_ATTEMPTS = 2
+
+
+def plan_large_area(name, lat, lon, radius, area=None):
+    """Tile a circle (or posted area) for a metric and build the image every tile reduces"""
+    spec = DATASETS[name]
+    if area is not None:
+        scale, tiles = plan_tiles(area.bounds, spec['scale'])
+    else:
+        scale, tiles = plan_tiles(
+            circle_bounds(lat, lon, radius), spec['scale'], lambda tile: touches_circle(tile, lat, lon, radius)
+        )
+
+    region = request_region(area, ee.Geometry.Point([lon, lat]), radius, scale)
+    # Filter collections by the whole region rather than its centre, so outer tiles have imagery too
+    image, context = source(name, region)
+    return {
+        'name': name,
+        'region': region,
+        'image': partial_image(spec['reducer'], image, spec['band']),
+        'context': context,
+        'scale': scale,
+        'tiles': tiles,
+        'area': area.describe() if area is not None else None,
+    }
+
+
+def reduce_tile(plan, tile):
+    """Partial statistics of one tile, retried once if Earth Engine fails"""
+    name = plan['name']
+    geometry = plan['region'].intersection(ee.Geometry.Rectangle(list(tile), None, False), plan['scale'])
+    stats = plan['image'].reduceRegion(
+        reducer=partial_reducer(DATASETS[name]['reducer']),
+        geometry=geometry,
+        scale=plan['scale'],
+        maxPixels=TILE_PIXELS * 4,
+        tileScale=tile_scale(TILE_PIXELS)
+    )
+    for attempt in range(TILE_ATTEMPTS):
+        try:
+            return get_info(stats, f'{name}:tile')
+        except Exception:
+            if attempt == TILE_ATTEMPTS - 1:
+                raise
+
+
+def large_area_result(plan, partials, context, failed):
+    """Format the statistics merged from the tiles reduced so far"""
+    name = plan['name']
+    spec = DATASETS[name]
+    stats = merge(spec['reducer'], spec['band'], partials)
+    result = METRICS[name]({**context, 'stats': stats} if context is not None else stats)
+    result['scale_m'] = plan['scale']
+    result['tiles'] = {'total': len(plan['tiles']), 'reduced': len(partials), 'failed': failed}
+    if plan['area'] is not None:
+        result['area'] = plan['area']
+    return result
+
+
+def stream_event(event, **fields):
+    return {'event': event, **fields}
+
+
+def large_area_events(plan, key, ttl):
+    """
+    Reduce every tile of a plan, yielding (event, fields): progress with the
+    statistics merged so far after each tile, tile failures, and the final
+    result, which is cached when every tile succeeded
+    """
+    name, total = plan['name'], len(plan['tiles'])
+    try:
+        context = get_info(plan['context'], name) if plan['context'] is not None else None
+    except Exception as e:
+        log.error('Large-area reduction failed', extra={'metric': name, 'error': str(e)})
+        yield 'error', {'error': str(e)}
+        return
 
-@app.route('/surface-water', methods=['GET'])
-def get_surface_water():
-    """Get JRC Global Surface Water"""
-    if not EE_INITIALIZED:
-        return jsonify({'error': 'Earth Engine not initialized'}), 500
+    partials, failed = [], 0
+    pool = ThreadPoolExecutor(max_workers=min(TILE_CONCURRENCY, total))
+    try:
+        futures = {submit(pool, reduce_tile, plan, tile): i for i, tile in enumerate(plan['tiles'])}
+        for future in as_completed(futures):
+            try:
+                partials.append(future.result())
+            except Exception as e:
+                failed += 1
+                log.warning('Large-area tile failed', extra={'metric': name, 'error': str(e)})
+                yield 'tile_failed', {'tile': futures[future], 'error': str(e)}
+            yield 'progress', {
+                'done': len(partials) + failed, 'total': total,
+                'partial': large_area_result(plan, partials, context, failed)
+            }
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    result = large_area_result(plan, partials, context, failed)
+    # Only complete results are worth replaying
+    if key is not None and not failed:
+        cache_store(key, result, ttl)
+    yield 'result', result
+
+
+def large_area_job(params):
+    """Job handler: the final result of a large-area reduction"""
+    if not EE.ensure():
+        raise RuntimeError('Earth Engine not initialized')
+    metric, args = params['metric'], params['args']
+    area = parse_area(params['body']) if params['body'] is not None else None
+
+    ttl = DATASET_TTLS[DATASETS[metric]['dataset']]
+    key = cache_key(f'/large-area/{metric}', args, area) if CACHE_ENABLED else None
+    result = cache_lookup(key) if key is not None else None
+    if result is not None:
+        return result
+
+    plan = plan_large_area(metric, *parse_location(args, area), area)
+    for event, fields in large_area_events(plan, key, ttl):
+        if event == 'error':
+            raise RuntimeError(fields['error'])
+    return fields
+
+
+@app.route('/large-area/<metric>', methods=['GET', 'POST'])
+def get_large_area(metric):
+    """
+    Reduce a metric over a large circle or posted area tile by tile, streaming
+    newline-delimited JSON (or msgpack): a plan, progress with the statistics
+    merged so far after every tile, and the final result
+    """
+    if metric not in METRICS:
+        return jsonify({'error': f'Unknown metric: {metric}', 'available': list(METRICS)}), 404
 
     try:
-        lat = float(request.args.get('lat', 0))
-        lon = float(request.args.get('lon', 0))
-        radius = float(request.args.get('radius', 10)) * 1000  # km to meters
+        area = request_area()
+        lat, lon, radius = request_location(area)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-        # Create point and buffer
-        point = ee.Geometry.Point([lon, lat])
-        region = point.buffer(radius)
+    if wants_job(request.args):
+        return queue_job('large-area', metric=metric)
 
-        # Get JRC surface water data
-        water = ee.Image('JRC/GSW1_4/GlobalSurfaceWater')
+    # Progress events have no common columns
+    if g.format in COLUMNAR:
+        raise NotAcceptable('Large-area progress is streamed as JSON or msgpack')
 
-        # Calculate water occurrence
-        occurrence = water.select('occurrence')
+    if not EE.ensure():
+        return jsonify({'error': 'Earth Engine not initialized'}), 500
 
-        # Calculate statistics
-        stats = occurrence.reduceRegion(
-            reducer=ee.Reducer.mean(),
-            geometry=region,
-            scale=30,
-            maxPixels=1e9
-        ).getInfo()
+    ttl = DATASET_TTLS[DATASETS[metric]['dataset']]
+    key = cache_key(request.path, request.args, area) if CACHE_ENABLED else None
+    result = cache_lookup(key) if key is not None else None
+    if result is not None:
+        return stream_response([stream_event('result', **result, cached=True)])
+
+    plan = plan_large_area(metric, lat, lon, radius, area)
+    total = len(plan['tiles'])
+    log.info('Large-area reduction started', extra={'metric': metric, 'tiles': total, 'scale_m': plan['scale']})
+
+    def generate():
+        yield stream_event('plan', metric=metric, tiles=total, scale_m=plan['scale'])
+        for event, fields in large_area_events(plan, key, ttl):
+            yield stream_event(event, **fields)
+
+    return stream_response(generate())
+
+
+# Sites per reduceRegions call, keeping each request well under EE payload limits
+BATCH_CHUNK_SIZE = int(os.getenv('EE_BATCH_CHUNK_SIZE', 100))
+BATCH_MAX_SITES = int(os.getenv('EE_BATCH_MAX_SITES', 5000))
+BATCH_CONCURRENCY = int(os.getenv('EE_BATCH_CONCURRENCY', 4))
+
+
+def parse_sites(payload):
+    """
+    Validate a batch body: a list (or {'sites': [...]}) of {id, lat, lon, radius}
+    or {id, geometry} with a GeoJSON Polygon/MultiPolygon (see geometry.py)
+    """
+    sites = payload.get('sites') if isinstance(payload, dict) else payload
+    if not isinstance(sites, list) or not sites:
+        raise ValueError('Expected a non-empty list of sites')
+    if len(sites) > BATCH_MAX_SITES:
+        raise ValueError(f'At most {BATCH_MAX_SITES} sites per batch')
+
+    parsed = []
+    for i, site in enumerate(sites):
+        if isinstance(site, dict) and 'geometry' in site:
+            try:
+                area = parse_area(site['geometry'])
+            except ValueError as e:
+                raise ValueError(f'Site {i}: {e}')
+            lat, lon = area.centroid
+            parsed.append({
+                'id': site.get('id', i), 'lat': lat, 'lon': lon, 'radius': area.radius_m / 1000, 'area': area
+            })
+            continue
+        try:
+            parsed.append({
+                'id': site.get('id', i),
+                'lat': float(site['lat']),
+                'lon': float(site['lon']),
+                'radius': float(site.get('radius', 10))  # km
+            })
+        except (AttributeError, KeyError, TypeError, ValueError):
+            raise ValueError(f'Site {i} needs numeric lat and lon')
+    return parsed
+
+
+def compute_batch(name, sites, quality=DEFAULT_QUALITY):
+    """
+    Reduce one metric over a chunk of sites in one getInfo() call: a single
+    reduceRegions, or for metrics whose image window depends on the region, a
+    reduceRegion mapped over the sites
+    """
+    # The chunk is reduced at one scale, so the largest site in the chunk sets it
+    params = metric_params(name, max(s['radius'] for s in sites) * 1000, quality)
+    features = ee.FeatureCollection([
+        ee.Feature(
+            request_region(s.get('area'), ee.Geometry.Point([s['lon'], s['lat']]), s['radius'] * 1000, params['scale']),
+            {'site_index': i}
+        )
+        for i, s in enumerate(sites)
+    ])
+
+    per_site = 'windows' in DATASETS[name]
+    if per_site:
+        # The image window is chosen for the region it covers (see
+        # datasets._fallback_source), so each site picks its own rather than
+        # the chunk sharing one, and reports its own image count
+        reduced = features.map(
+            lambda feature: feature.set(metric_reduction(name, feature.geometry(), feature.geometry(), params))
+        )
+    else:
+        image, _ = source(name, features)
+        reduced = image.reduceRegions(
+            collection=features,
+            reducer=reducer(DATASETS[name]['reducer']),
+            scale=params['scale'],
+            tileScale=params['tileScale']
+        )
+    # Drop the buffered geometries so only the statistics come back
+    info = get_info(reduced.select(['.*'], None, False), name)
+
+    band, names = DATASETS[name]['band'], outputs(name)
+    results = []
+    for feature in info['features']:
+        props = feature['properties']
+        if per_site:
+            # The window context plus reduceRegion's band-prefixed 'stats'
+            data = props
+        elif len(names) == 1:
+            data = {band: props.get(names[0])}
+        else:
+            data = {f'{band}_{output}': props.get(output) for output in names}
 
-        return jsonify({
-            'water_occurrence_pct': round(stats.get('occurrence', 0), 1),
-            'timestamp': datetime.utcnow().isoformat(),
-            'source': 'JRC Global Surface Water v1.4',
-            'info': 'Percentage of time water was present (1984-2021)'
-        })
-    except Exception as e:
-        print(f"[ERROR] Surface water calculation failed: {e}")
-        return jsonify({'error': str(e)}), 500
+        site = sites[props['site_index']]
+        row = {'id': site['id'], **format_metric(name, data, params, quality)}
+        if 'area' in site:
+            row['area'] = site['area'].describe()
+        results.append(row)
+    return results
 
 
-@app.route('/air-quality', methods=['GET'])
-def get_air_quality():
-    """Get Sentinel-5P TROPOMI Air Quality"""
-    if not EE_INITIALIZED:
+@app.route('/batch/<metric>', methods=['POST'])
+def post_batch(metric):
+    """Get one metric for many sites, streamed back as newline-delimited JSON, msgpack or one columnar table"""
+    if not EE.ensure():
         return jsonify({'error': 'Earth Engine not initialized'}), 500
 
-    try:
-        lat = float(request.args.get('lat', 0))
-        lon = float(request.args.get('lon', 0))
-        radius = float(request.args.get('radius', 10)) * 1000  # km to meters
+    if metric not in METRICS:
+        return jsonify({'error': f'Unknown metric: {metric}', 'available': list(METRICS)}), 404
 
-        # Create point and buffer
-        point = ee.Geometry.Point([lon, lat])
-        region = point.buffer(radius)
-
-        # Get recent NO2 data (last 7 days)
-        end_date = datetime.utcnow()
-        start_date = end_date - timedelta(days=7)
-
-        collection = ee.ImageCollection('COPERNICUS/S5P/OFFL/L3_NO2') \
-            .filterBounds(point) \
-            .filterDate(start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')) \
-            .select('tropospheric_NO2_column_number_density')
-
-        # Get median NO2
-        no2_median = collection.median()
+    try:
+        sites = parse_sites(request.get_json(silent=True))
+        quality = parse_quality(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Chunks share one reduction scale, so group sites of similar size
+    sites.sort(key=lambda s: s['radius'])
+    chunks = [sites[i:i + BATCH_CHUNK_SIZE] for i in range(0, len(sites), BATCH_CHUNK_SIZE)]
+    log.info('Batch started', extra={'metric': metric, 'sites': len(sites), 'chunks': len(chunks)})
+
+    def generate():
+        pool = ThreadPoolExecutor(max_workers=min(BATCH_CONCURRENCY, len(chunks)))
+        try:
+            futures = {submit(pool, compute_batch, metric, chunk, quality): chunk for chunk in chunks}
+            for future in as_completed(futures):
+                try:
+                    rows = future.result()
+                except Exception as e:
+                    log.error('Batch chunk failed', extra={'metric': metric, 'error': str(e)})
+                    rows = [{'id': s['id'], 'error': str(e)} for s in futures[future]]
+                yield from rows
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    return stream_response(generate())
+
+
+def vegetation_value(ndvi):
+    """Reported metrics and NDVI mean from the /ndvi response"""
+    if ndvi.get('info') or ndvi.get('mean') is None:
+        # No imagery in any window, or no valid pixels - leave vegetation out of the weighting
+        return {}, math.nan
+
+    ndvi_mean = ndvi['mean']
+    return {'ndvi': {'value': round(ndvi_mean, 3), 'unit': 'index'}}, ndvi_mean
+
+
+def landcover_value(landcover):
+    """Reported metrics and natural land cover share from the /landcover response"""
+    classes = landcover['classes']
+    if not classes:
+        # No classified pixels in the region - leave land cover out of the weighting
+        return {}, math.nan
+
+    # Natural land cover (not built-up). Percentages come from the raw, possibly
+    # fractional histogram counts; pixel_count is truncated for display.
+    natural_pct = sum(
+        entry['percentage'] for class_id, entry in classes.items()
+        if int(class_id) in [10, 20, 30, 80, 90, 95, 100]
+    )
+
+    metrics = {
+        'landcover_diversity': {'value': len(classes), 'unit': 'classes'},
+        'natural_landcover': {'value': round(natural_pct, 1), 'unit': '%'}
+    }
+    return metrics, natural_pct
+
+
+def water_value(water):
+    """Reported metrics and water occurrence from the /surface-water response"""
+    water_pct = water['water_occurrence_pct']
+    return {'water_occurrence': {'value': round(water_pct, 1), 'unit': '%'}}, water_pct
+
+
+# Score key -> (log label, metric name, value extractor), in scoring.COMPONENTS order
+ASSESSMENT_COMPONENTS = {
+    'vegetation': ('NDVI', 'ndvi', vegetation_value),
+    'landcover': ('Land cover', 'landcover', landcover_value),
+    'water': ('Water', 'surface-water', water_value),
+}
+
+
+def assessment_scale(radius, quality):
+    """Finest reduction scale among the assessment's metrics, which share one region"""
+    return min(metric_params(metric, radius, quality)['scale'] for _, metric, _ in ASSESSMENT_COMPONENTS.values())
+
+
+def compute_assessment_metrics(lat, lon, radius, point, region, quality=DEFAULT_QUALITY, area=None):
+    """
+    Fetch the assessment's metrics, returning {metric name: response or Exception}.
+    Metrics covered by a hot region's rasters or the precomputed grid are
+    answered locally (the grid only for circles, as it approximates them). The
+    rest are requested in one combined round trip; if that fails they are
+    retried concurrently one by one so a single broken dataset only degrades itself.
+    """
+    results = {}
+    for _, metric, _ in ASSESSMENT_COMPONENTS.values():
+        result = raster_metric(metric, lat, lon, radius, quality, area)
+        if result is None and area is None:
+            result = grid_metric(metric, lat, lon, radius / 1000, quality)
+        if result is not None:
+            results[metric] = result
+
+    names = [metric for _, metric, _ in ASSESSMENT_COMPONENTS.values() if metric not in results]
+    if not names:
+        return results
 
-        # Calculate statistics
-        stats = no2_median.reduceRegion(
-            reducer=ee.Reducer.mean(),
-            geometry=region,
-            scale=1113,
-            maxPixels=1e9
-        ).getInfo()
+    try:
+        future = submit(ASSESSMENT_EXECUTOR, compute_metrics, names, point, region, radius, quality)
+        return {**results, **future.result(timeout=METRIC_TIMEOUT)}
+    except FuturesTimeout:
+        error = TimeoutError(f'timed out after {METRIC_TIMEOUT:g}s')
+        return {**results, **{name: error for name in names}}
+    except Exception as e:
+        log.warning('Combined assessment query failed, retrying per metric', extra={'error': str(e)})
 
-        return jsonify({
-            'no2_mol_m2': stats.get('tropospheric_NO2_column_number_density', 0),
+    futures = {
+        name: submit(ASSESSMENT_EXECUTOR, compute_metric, name, point, region, radius, quality) for name in names
+    }
+    deadline = time.monotonic() + METRIC_TIMEOUT
+    for name, future in futures.items():
+        try:
+            results[name] = future.result(timeout=max(0, deadline - time.monotonic()))
+        except FuturesTimeout:
+            future.cancel()
+            results[name] = TimeoutError(f'timed out after {METRIC_TIMEOUT:g}s')
+        except Exception as e:
+            results[name] = e
+    return results
+
+
+def assessment_responses(locations, metric_results, weights=DEFAULT_WEIGHTS):
+    """
+    Score fetched assessment metrics into /environmental-assessment responses.
+    `locations` are (lat, lon, radius) and `metric_results` the matching
+    {metric name: response or Exception}; all locations are scored at once.
+    """
+    values = np.full((len(locations), len(COMPONENTS)), np.nan)
+    failed = np.zeros(values.shape, dtype=bool)
+    responses = []
+
+    for i, ((lat, lon, radius), results) in enumerate(zip(locations, metric_results)):
+        response = {
+            'coordinates': {'lat': lat, 'lon': lon},
+            'radius_km': radius / 1000,
             'timestamp': datetime.utcnow().isoformat(),
-            'source': 'Sentinel-5P TROPOMI',
-            'pollutant': 'NO2',
-            'unit': 'mol/m²'
-        })
-    except Exception as e:
-        print(f"[ERROR] Air quality calculation failed: {e}")
-        return jsonify({'error': str(e)}), 500
+            'metrics': {},
+            'scores': {},
+            'overall_score': 0,
+            'health_grade': 'Unknown',
+            'recommendations': [],
+            'weights': weights,
+            # Reduction scale of each live metric (see scale_policy.py)
+            'scales_m': {
+                metric: result['scale_m'] for metric, result in results.items()
+                if isinstance(result, dict) and 'scale_m' in result
+            }
+        }
 
+        # A failed or timed-out metric degrades to a neutral score
+        for j, (key, (label, metric, value_fn)) in enumerate(ASSESSMENT_COMPONENTS.items()):
+            result = results[metric]
+            if isinstance(result, Exception):
+                log.warning(f'{label} failed', extra={'error': str(result)})
+                if key == 'vegetation':
+                    response['metrics']['ndvi'] = {'value': 0, 'unit': 'index', 'error': str(result)}
+                failed[i, j] = True
+                continue
+
+            metrics, values[i, j] = value_fn(result)
+            response['metrics'].update(metrics)
+        responses.append(response)
+
+    assessed = assess(values, failed, weights)
+    advice = recommendations(assessed, values)
+    for i, response in enumerate(responses):
+        response['scores'] = {
+            key: float(score) for key, score in zip(COMPONENTS, assessed['scores'][i]) if not np.isnan(score)
+        }
+        response['overall_score'] = float(assessed['overall'][i])
+        response['health_grade'] = GRADES[assessed['grade'][i]][0]
+        response['recommendations'] = advice[i]
+    return responses
 
-@app.route('/fire', methods=['GET'])
-def get_fire():
-    """Get MODIS/VIIRS Active Fires"""
-    if not EE_INITIALIZED:
-        return jsonify({'error': 'Earth Engine not initialized'}), 500
 
-    try:
-        lat = float(request.args.get('lat', 0))
-        lon = float(request.args.get('lon', 0))
-        radius = float(request.args.get('radius', 10)) * 1000  # km to meters
+def assessment_response(lat, lon, radius, metric_results, weights=DEFAULT_WEIGHTS):
+    """Score one location's fetched assessment metrics"""
+    return assessment_responses([(lat, lon, radius)], [metric_results], weights)[0]
 
-        # Create point and buffer
-        point = ee.Geometry.Point([lon, lat])
-        region = point.buffer(radius)
 
-        # Get recent fire data (last 7 days)
-        end_date = datetime.utcnow()
-        start_date = end_date - timedelta(days=7)
+def environmental_assessment(lat, lon, radius, quality=DEFAULT_QUALITY, weights=DEFAULT_WEIGHTS, area=None):
+    """Assess one location, or a posted area"""
+    log.info('Environmental assessment', extra={'lat': lat, 'lon': lon})
 
-        collection = ee.ImageCollection('MODIS/061/MOD14A1') \
-            .filterBounds(point) \
-            .filterDate(start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')) \
-            .select('MaxFRP')
+    # Create point and buffer
+    point = ee.Geometry.Point([lon, lat])
+    region = request_region(area, point, radius, assessment_scale(radius, quality))
 
-        # Count fire detections
-        fire_count = collection.count()
+    key = ('assessment', round(lat, 6), round(lon, 6), radius, quality, area and area.hash)
+    metric_results = IN_FLIGHT.do(
+        key, compute_assessment_metrics, lat, lon, radius, point, region, quality, area
+    )
+    response = assessment_response(lat, lon, radius, metric_results, weights)
+    if area is not None:
+        response['area'] = area.describe()
+    return response
 
-        # Calculate max fire radiative power
-        stats = fire_count.reduceRegion(
-            reducer=ee.Reducer.max(),
-            geometry=region,
-            scale=1000,
-            maxPixels=1e9
-        ).getInfo()
 
-        return jsonify({
-            'fire_detections': int(stats.get('MaxFRP', 0)),
-            'timestamp': datetime.utcnow().isoformat(),
-            'source': 'MODIS MOD14A1',
-            'period': '7 days'
-        })
-    except Exception as e:
-        print(f"[ERROR] Fire detection failed: {e}")
-        return jsonify({'error': str(e)}), 500
+def assessment_job(params):
+    """Job handler: an assessment queued with ?async=true"""
+    if not EE.ensure():
+        raise RuntimeError('Earth Engine not initialized')
+    args = params['args']
+    area = parse_area(params['body']) if params['body'] is not None else None
+    return environmental_assessment(
+        *parse_location(args, area), parse_quality(args), parse_weights(args.get('weights'), DEFAULT_WEIGHTS), area
+    )
 
 
-@app.route('/environmental-assessment', methods=['GET'])
+@app.route('/environmental-assessment', methods=['GET', 'POST'])
 def get_environmental_assessment():
     """Get comprehensive environmental assessment with scoring"""
-    if not EE_INITIALIZED:
-        return jsonify({'error': 'Earth Engine not initialized'}), 500
-
     try:
-        lat = float(request.args.get('lat', 0))
-        lon = float(request.args.get('lon', 0))
-        radius = float(request.args.get('radius', 10)) * 1000  # km to meters
-
-        print(f"[INFO] Environmental assessment for {lat}, {lon}")
+        quality = parse_quality(request.args)
+        weights = parse_weights(request.args.get('weights'), DEFAULT_WEIGHTS)
+        area = request_area()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-        # Create point and buffer
-        point = ee.Geometry.Point([lon, lat])
-        region = point.buffer(radius)
+    if not wants_job(request.args) and not EE.ensure():
+        return jsonify({'error': 'Earth Engine not initialized'}), 500
 
-        # Initialize results
-        results = {
-            'coordinates': {'lat': lat, 'lon': lon},
-            'radius_km': radius / 1000,
-            'timestamp': datetime.utcnow().isoformat(),
-            'metrics': {},
-            'scores': {},
-            'overall_score': 0,
-            'health_grade': 'Unknown',
-            'recommendations': []
-        }
+    if wants_job(request.args):
+        return queue_job('environmental-assessment')
 
-        # 1. NDVI (Vegetation Health)
+    try:
+        return respond(environmental_assessment(*request_location(area), quality, weights, area))
+    except Exception as e:
+        log.error('Environmental assessment failed', extra={'error': str(e)})
+        return error_response(e)
+
+
+def compute_assessment_batch(sites, quality=DEFAULT_QUALITY, weights=DEFAULT_WEIGHTS):
+    """
+    Assess a chunk of sites: each assessment metric is reduced over the whole
+    chunk with one compute_batch call (run concurrently), then every site is
+    scored at once. A metric that fails degrades to a neutral score for the
+    chunk, as in the single-location assessment.
+    """
+    names = [metric for _, metric, _ in ASSESSMENT_COMPONENTS.values()]
+    futures = {name: submit(ASSESSMENT_EXECUTOR, compute_batch, name, sites, quality) for name in names}
+
+    metric_results = [{} for _ in sites]
+    for name, future in futures.items():
         try:
-            end_date = datetime.utcnow()
-            for days_back in [30, 90, 180, 365]:
-                start_date = end_date - timedelta(days=days_back)
-                collection = ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED') \
-                    .filterBounds(point) \
-                    .filterDate(start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')) \
-                    .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', 80))
-                if collection.size().getInfo() > 0:
-                    ndvi_collection = collection.map(lambda img: img.normalizedDifference(['B8', 'B4']).rename('NDVI'))
-                    ndvi_median = ndvi_collection.median()
-                    stats = ndvi_median.reduceRegion(
-                        reducer=ee.Reducer.mean(),
-                        geometry=region,
-                        scale=10,
-                        maxPixels=1e9
-                    ).getInfo()
-                    ndvi_mean = stats.get('NDVI', 0)
-                    results['metrics']['ndvi'] = {'value': round(ndvi_mean, 3), 'unit': 'index'}
-                    # Score: 0.8-1.0 = 100, 0.6-0.8 = 80, 0.4-0.6 = 60, 0.2-0.4 = 40, <0.2 = 20
-                    if ndvi_mean >= 0.8:
-                        results['scores']['vegetation'] = 100
-                    elif ndvi_mean >= 0.6:
-                        results['scores']['vegetation'] = 60 + ((ndvi_mean - 0.6) / 0.2) * 40
-                    elif ndvi_mean >= 0.4:
-                        results['scores']['vegetation'] = 40 + ((ndvi_mean - 0.4) / 0.2) * 20
-                    elif ndvi_mean >= 0.2:
-                        results['scores']['vegetation'] = 20 + ((ndvi_mean - 0.2) / 0.2) * 20
-                    else:
-                        results['scores']['vegetation'] = max(0, ndvi_mean / 0.2 * 20)
-                    break
+            rows = future.result()
         except Exception as e:
-            print(f"[WARN] NDVI failed: {e}")
-            results['metrics']['ndvi'] = {'value': 0, 'unit': 'index', 'error': str(e)}
-            results['scores']['vegetation'] = 50  # Neutral score
+            log.warning('Batch assessment metric failed', extra={'metric': name, 'error': str(e)})
+            rows = [e] * len(sites)
+        for results, row in zip(metric_results, rows):
+            results[name] = row
+
+    locations = [(s['lat'], s['lon'], s['radius'] * 1000) for s in sites]
+    rows = []
+    for site, response in zip(sites, assessment_responses(locations, metric_results, weights)):
+        if 'area' in site:
+            response['area'] = site['area'].describe()
+        rows.append({'id': site['id'], **response})
+    return rows
+
+
+@app.route('/environmental-assessment/batch', methods=['POST'])
+def post_assessment_batch():
+    """Assess many sites, streamed back as newline-delimited JSON, msgpack or one columnar table"""
+    if not EE.ensure():
+        return jsonify({'error': 'Earth Engine not initialized'}), 500
 
-        # 2. Land Cover Diversity
+    try:
+        sites = parse_sites(request.get_json(silent=True))
+        quality = parse_quality(request.args)
+        weights = parse_weights(request.args.get('weights'), DEFAULT_WEIGHTS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Chunks share one reduction scale per metric, so group sites of similar size
+    sites.sort(key=lambda s: s['radius'])
+    chunks = [sites[i:i + BATCH_CHUNK_SIZE] for i in range(0, len(sites), BATCH_CHUNK_SIZE)]
+    log.info('Batch assessment started', extra={'sites': len(sites), 'chunks': len(chunks)})
+
+    def generate():
+        pool = ThreadPoolExecutor(max_workers=min(BATCH_CONCURRENCY, len(chunks)))
         try:
-            worldcover = ee.ImageCollection('ESA/WorldCover/v200').first()
-            histogram = worldcover.select('Map').reduceRegion(
-                reducer=ee.Reducer.frequencyHistogram(),
-                geometry=region,
-                scale=10,
-                maxPixels=1e9
-            ).getInfo()
-            class_counts = histogram.get('Map', {})
-            total_pixels = sum(class_counts.values()) if class_counts else 0
-
-            # Calculate natural land cover percentage
-            natural_pct = 0
-            class_names = {10: 'Tree cover', 20: 'Shrubland', 30: 'Grassland', 40: 'Cropland',
-                          50: 'Built-up', 60: 'Bare/sparse vegetation', 70: 'Snow and ice',
-                          80: 'Water bodies', 90: 'Herbaceous wetland', 95: 'Mangroves',
-                          100: 'Moss and lichen'}
-
-            for class_id, count in class_counts.items():
-                p = count / total_pixels
-
-                # Natural land cover (not built-up)
-                if int(class_id) in [10, 20, 30, 80, 90, 95, 100]:
-                    natural_pct += p * 100
-
-            results['metrics']['landcover_diversity'] = {'value': len(class_counts), 'unit': 'classes'}
-            results['metrics']['natural_landcover'] = {'value': round(natural_pct, 1), 'unit': '%'}
-
-            # Score based on natural land cover percentage
-            results['scores']['landcover'] = min(100, natural_pct)
+            futures = {submit(pool, compute_assessment_batch, chunk, quality, weights): chunk for chunk in chunks}
+            for future in as_completed(futures):
+                try:
+                    rows = future.result()
+                except Exception as e:
+                    log.error('Batch assessment chunk failed', extra={'error': str(e)})
+                    rows = [{'id': s['id'], 'error': str(e)} for s in futures[future]]
+                yield from rows
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
 
-        except Exception as e:
-            print(f"[WARN] Land cover failed: {e}")
-            results['scores']['landcover'] = 50
+    return stream_response(generate())
 
-        # 3. Surface Water
-        try:
-            water = ee.Image('JRC/GSW1_4/GlobalSurfaceWater')
-            occurrence = water.select('occurrence')
-            stats = occurrence.reduceRegion(
-                reducer=ee.Reducer.mean(),
-                geometry=region,
-                scale=30,
-                maxPixels=1e9
-            ).getInfo()
-            water_pct = stats.get('occurrence', 0)
-            results['metrics']['water_occurrence'] = {'value': round(water_pct, 1), 'unit': '%'}
-            # Optimal water: 5-15% (balanced), score accordingly
-            if 5 <= water_pct <= 15:
-                results['scores']['water'] = 100
-            elif water_pct < 5:
-                results['scores']['water'] = max(20, water_pct / 5 * 100)
-            else:
-                results['scores']['water'] = max(20, 100 - ((water_pct - 15) / 85 * 80))
-        except Exception as e:
-            print(f"[WARN] Water failed: {e}")
-            results['scores']['water'] = 50
-
-        # Calculate overall score (weighted average)
-        weights = {'vegetation': 0.4, 'landcover': 0.35, 'water': 0.25}
-        overall = 0
-        total_weight = 0
-
-        for key, weight in weights.items():
-            if key in results['scores']:
-                overall += results['scores'][key] * weight
-                total_weight += weight
-
-        if total_weight > 0:
-            results['overall_score'] = round(overall / total_weight, 1)
-
-        # Assign health grade
-        score = results['overall_score']
-        if score >= 90:
-            results['health_grade'] = 'Excellent'
-            results['recommendations'].append('Ecosystem is thriving - continue conservation efforts')
-        elif score >= 75:
-            results['health_grade'] = 'Good'
-            results['recommendations'].append('Healthy ecosystem with room for improvement')
-        elif score >= 60:
-            results['health_grade'] = 'Fair'
-            results['recommendations'].append('Monitor environmental indicators and reduce human impact')
-        elif score >= 40:
-            results['health_grade'] = 'Poor'
-            results['recommendations'].append('Ecosystem under stress - restoration efforts needed')
-        else:
-            results['health_grade'] = 'Critical'
-            results['recommendations'].append('Immediate conservation and restoration required')
 
-        # Add specific recommendations
-        if results['scores'].get('vegetation', 50) < 60:
-            results['recommendations'].append('Increase vegetation cover through reforestation')
-        if results['scores'].get('landcover', 50) < 60:
-            results['recommendations'].append('Reduce urban sprawl and preserve natural habitats')
-        if results['metrics'].get('water_occurrence', {}).get('value', 10) < 3:
-            results['recommendations'].append('Improve water retention and watershed management')
+# Long-running requests queued with ?async=true (see jobs.py)
+JOBS = jobs_from_env()
+if JOBS is not None:
+    JOBS.register('environmental-assessment', assessment_job)
+    JOBS.register('large-area', large_area_job)
+    REGISTRY.gauge('ee_service_jobs', 'Queued jobs by status, across all workers', ['status'],
+                   lambda: {(status,): JOBS.stats()[status] for status in STATUSES})
 
-        return jsonify(results)
 
-    except Exception as e:
-        print(f"[ERROR] Environmental assessment failed: {e}")
-        return jsonify({'error': str(e)}), 500
+def wants_job(args):
+    return args.get('async', '').lower() in ('1', 'true')
+
+
+def request_client():
+    """Who a job is queued for, for fairness between clients"""
+    return request.headers.get('X-Client-Id') or request.remote_addr or 'unknown'
+
+
+def job_params(args, body, **extra):
+    """What a worker needs to rerun a request: its query params (minus job options) and posted area"""
+    return {
+        'args': {k: v for k, v in args.items() if k not in ('async', 'priority', 'format')}, 'body': body, **extra
+    }
+
+
+def queue_job(kind, **extra):
+    """Queue the current request as a job and answer 202 with where to poll for it"""
+    if JOBS is None:
+        return jsonify({'error': 'Asynchronous jobs are disabled'}), 400
+    try:
+        priority = parse_priority(request.args.get('priority'))
+        body = request.get_json(silent=True) if request.method == 'POST' else None
+        job = JOBS.submit(kind, job_params(request.args, body, **extra), request_client(), priority)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except QueueFull as e:
+        return jsonify({'error': str(e)}), 429
+
+    response = respond({**job, 'status_url': f"/jobs/{job['job_id']}"})
+    response.status_code = 202
+    response.headers['Location'] = f"/jobs/{job['job_id']}"
+    return response
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Status of a queued job, with its result once done"""
+    if JOBS is None:
+        return jsonify({'error': 'Asynchronous jobs are disabled'}), 400
+    job = JOBS.get(job_id)
+    if job is None:
+        return jsonify({'error': f'Unknown job: {job_id}'}), 404
+    return respond(job)
 
 
 if __name__ == '__main__':
+    # Development only - production runs under gunicorn (see gunicorn_conf.py)
     port = int(os.getenv('PORT', 5001))
-    app.run(host='0.0.0.0', port=port, debug=True)
+    debug = os.getenv('FLASK_DEBUG', 'false').lower() == 'true'
+    app.run(host='0.0.0.0', port=port, debug=debug)
@@ -0,0 +1,789 @@
+#!/usr/bin/env python3
+"""
+Earth Engine Python API Service (ASGI)
+Same routes and responses as app.py, served by Starlette. Handlers are
+coroutines: blocking getInfo() calls run on a bounded thread pool behind a
+global concurrency limit, so a request waiting on Earth Engine holds a
+coroutine rather than a worker thread. Runs side by side with the Flask app:
+
+    uvicorn asgi_app:app --port 5002
+"""
+
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from datetime import datetime
+from functools import wraps
+
+import ee
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders, QueryParams
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Match, Route
+
+from cache import DATASET_STALE_TTLS, DATASET_TTLS
+from datasets import DATASETS
+from formats import (
+    COLUMNAR, COMPRESS_MIN_BYTES, Compressor, NotAcceptable, choose_encoding, compress, compressible, content_type,
+    encode, encode_async_stream, encode_stream, negotiate
+)
+from geometry import parse_area
+from jobs import QueueFull, parse_priority
+from raster_store import RASTER_LAYERS
+from scale_policy import parse_quality, reduction_params
+from scoring import DEFAULT_WEIGHTS, parse_weights
+from singleflight import AsyncSingleFlight
+from timeseries import series_scale
+from instrumentation import REGISTRY, begin_request, begin_task, end_request, end_task, get_info
+from scheduler import SCHEDULER, Overloaded, set_priority
+from app import (
+    ASSESSMENT_COMPONENTS, BATCH_CHUNK_SIZE, BATCH_CONCURRENCY, CACHE_ENABLED, DISK_CACHE, EE, GRID, JOBS,
+    GRID_ROUTE_METRICS, METRIC_TIMEOUT, METRICS, RASTERS, RESULT_CACHE, ROLLING, ROLLING_ENABLED, SERIES,
+    STALE_WHILE_REVALIDATE, TILE_CONCURRENCY, assessment_response, assessment_scale, cache_entry, cache_key,
+    cache_lookup, cache_store, compute_assessment_batch, compute_batch, compute_metric, compute_metrics,
+    compute_rolling, compute_timeseries, grid_metric, job_params, large_area_result, log, metric_params,
+    parse_location, parse_sites, parse_timeseries, plan_large_area, raster_metric, reduce_tile, request_region,
+    stream_event, wants_job
+)
+
+
+class EarthEngineExecutor:
+    """
+    Runs blocking Earth Engine calls off the event loop. At most `limit` calls
+    are admitted at once; the rest wait as coroutines. The pool has the same
+    size, so calls abandoned by a timeout still cannot grow the thread count.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._pool = ThreadPoolExecutor(max_workers=limit, thread_name_prefix='ee-async')
+        self._semaphore = None
+        self.running = 0
+        self.waiting = 0
+
+    async def run(self, fn, *args):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.limit)
+
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.running += 1
+        try:
+            # Carry the request's instrumentation context into the pool thread
+            return await asyncio.get_running_loop().run_in_executor(self._pool, copy_context().run, fn, *args)
+        finally:
+            self.running -= 1
+            self._semaphore.release()
+
+    def stats(self):
+        return {'limit': self.limit, 'running': self.running, 'waiting': self.waiting}
+
+
+EE_CALLS = EarthEngineExecutor(int(os.getenv('EE_ASYNC_CONCURRENCY', 128)))
+
+# Identical concurrent queries share one EE computation
+IN_FLIGHT = AsyncSingleFlight()
+
+REGISTRY.gauge('ee_service_async_running', 'Earth Engine calls running on the async executor', [],
+               lambda: {(): EE_CALLS.running})
+REGISTRY.gauge('ee_service_async_waiting', 'Earth Engine calls waiting for an executor slot', [],
+               lambda: {(): EE_CALLS.waiting})
+
+
+def error(message, status=500, **extra):
+    return JSONResponse({'error': message, **extra}, status_code=status)
+
+
+def error_response(e):
+    """500 for a failed request, or 503 with Retry-After when Earth Engine capacity ran out"""
+    if isinstance(e, Overloaded):
+        return JSONResponse(
+            {'error': str(e), 'retry_after': e.retry_after}, status_code=503,
+            headers={'Retry-After': str(e.retry_after)}
+        )
+    return error(str(e))
+
+
+def not_acceptable(request, e):
+    return error(str(e), 406, available=e.available)
+
+
+def respond(request, result, status_code=200, headers=None, rows=None):
+    """A successful response in the negotiated format; the result is kept on the request for the cache"""
+    request.state.result = result
+    fmt = getattr(request.state, 'format', 'json')
+    if fmt == 'json':
+        return JSONResponse(result, status_code=status_code, headers=headers)
+    return Response(encode(result, fmt, rows), status_code=status_code, headers=headers, media_type=content_type(fmt))
+
+
+def stream_response(request, items):
+    """A streamed response of objects (batch rows, progress events) in the negotiated format"""
+    fmt = getattr(request.state, 'format', 'json')
+    body = encode_async_stream(items, fmt) if hasattr(items, '__aiter__') else encode_stream(items, fmt)
+    return StreamingResponse(body, media_type=content_type(fmt, stream=True))
+
+
+async def ensure_ee():
+    # The first call in a process initializes Earth Engine over the network
+    return EE.initialized or await run_in_threadpool(EE.ensure)
+
+
+async def request_area(request):
+    """The validated GeoJSON area posted with a metric request, or None for lat/lon/radius"""
+    if request.method != 'POST':
+        return None
+    if not hasattr(request.state, 'area'):
+        try:
+            payload = await request.json()
+        except ValueError:
+            payload = None
+        request.state.area = parse_area(payload)
+    return request.state.area
+
+
+async def local_raster(name, lat, lon, radius, quality, area=None):
+    """app.raster_metric, reduced off the event loop when a hot region has the layer"""
+    if RASTERS is None or name not in RASTER_LAYERS:
+        return None
+    return await run_in_threadpool(raster_metric, name, lat, lon, radius, quality, area)
+
+
+def location(request, area=None):
+    """(lat, lon, radius in meters) from the query string or a posted area, as app.py reads them"""
+    return parse_location(request.query_params, area)
+
+
+async def queue_job(request, kind, **extra):
+    """Queue a request as a job and answer 202 with where to poll for it"""
+    if JOBS is None:
+        return error('Asynchronous jobs are disabled', 400)
+    try:
+        priority = parse_priority(request.query_params.get('priority'))
+        body = await request.json() if request.method == 'POST' else None
+        params = job_params(request.query_params, body, **extra)
+        client = request.headers.get('x-client-id') or (request.client.host if request.client else 'unknown')
+        job = await run_in_threadpool(JOBS.submit, kind, params, client, priority)
+    except ValueError as e:
+        return error(str(e), 400)
+    except QueueFull as e:
+        return error(str(e), 429)
+
+    status_url = f"/jobs/{job['job_id']}"
+    return respond(request, {**job, 'status_url': status_url}, status_code=202, headers={'Location': status_url})
+
+
+async def get_job(request):
+    """Status of a queued job, with its result once done"""
+    if JOBS is None:
+        return error('Asynchronous jobs are disabled', 400)
+    job = await run_in_threadpool(JOBS.get, request.path_params['job_id'])
+    if job is None:
+        return error(f"Unknown job: {request.path_params['job_id']}", 404)
+    return respond(request, job)
+
+
+# Keys being refreshed in the background, and the tasks doing it (kept referenced until done)
+REFRESHING = set()
+REFRESH_TASKS = set()
+
+
+async def store(key, result, ttl, stale_ttl):
+    # The disk tier is SQLite; keep it off the event loop
+    if DISK_CACHE is not None:
+        await run_in_threadpool(cache_store, key, result, ttl, stale_ttl)
+    else:
+        cache_store(key, result, ttl, stale_ttl)
+
+
+def refresh_in_background(request, view, key, ttl, stale_ttl):
+    """Rerun a request after its stale response was sent, once per key at a time"""
+    if key in REFRESHING:
+        return
+    REFRESHING.add(key)
+    route = request.url.path
+
+    async def refresh():
+        stats = begin_task(f'refresh:{route}')
+        set_priority('background')
+        status = 500
+        try:
+            response = await view(request)
+            status = response.status_code
+            if status == 200 and hasattr(request.state, 'result'):
+                await store(key, request.state.result, ttl, stale_ttl)
+        except Exception as e:
+            log.warning('Background refresh failed', extra={'route': route, 'error': str(e)})
+        finally:
+            end_task(stats, status)
+            REFRESHING.discard(key)
+
+    task = asyncio.ensure_future(refresh())
+    REFRESH_TASKS.add(task)
+    task.add_done_callback(REFRESH_TASKS.discard)
+
+
+def cached(dataset):
+    """Async counterpart of app.cached, sharing its cache tiers and keys"""
+    ttl = DATASET_TTLS[dataset]
+    stale_ttl = DATASET_STALE_TTLS[dataset] if STALE_WHILE_REVALIDATE else 0
+
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request):
+            if not CACHE_ENABLED:
+                return await view(request)
+
+            try:
+                key = cache_key(request.url.path, request.query_params, await request_area(request))
+            except ValueError:
+                key = None
+            if key is None:
+                return await view(request)
+
+            entry = await run_in_threadpool(cache_entry, key) if DISK_CACHE is not None else cache_entry(key)
+            if entry is not None:
+                result, age, fresh = entry
+                if not fresh:
+                    refresh_in_background(request, view, key, ttl, stale_ttl)
+                return respond(
+                    request, result if fresh else {**result, 'stale': True}, headers={'X-Data-Age': str(int(age))}
+                )
+
+            response = await view(request)
+            if response.status_code == 200 and hasattr(request.state, 'result'):
+                await store(key, request.state.result, ttl, stale_ttl)
+                response.headers['X-Data-Age'] = '0'
+            return response
+        return wrapper
+    return decorator
+
+
+async def serve_metric(request, name, label):
+    """
+    Respond with one metric for the lat/lon/radius query params, or for a
+    GeoJSON area in a POST body, at the requested quality
+    """
+    try:
+        quality = parse_quality(request.query_params)
+        area = await request_area(request)
+    except ValueError as e:
+        return error(str(e), 400)
+
+    try:
+        lat, lon, radius = location(request, area)
+
+        # Hot regions' rasters, and static layers inside the precomputed grid, need no Earth Engine call
+        result = await local_raster(name, lat, lon, radius, quality, area)
+        if result is None and name in GRID_ROUTE_METRICS and area is None:
+            result = grid_metric(name, lat, lon, radius / 1000, quality)
+        if result is not None:
+            return respond(request, {**result, 'area': area.describe()} if area is not None else result)
+
+        if not await ensure_ee():
+            return error('Earth Engine not initialized')
+
+        point = ee.Geometry.Point([lon, lat])
+        region = request_region(area, point, radius, metric_params(name, radius, quality)['scale'])
+        geometry = area.hash if area is not None else None
+
+        key = (name, round(lat, 6), round(lon, 6), radius, quality, geometry)
+        if name in ROLLING and ROLLING_ENABLED and CACHE_ENABLED:
+            result = await IN_FLIGHT.do(
+                key, EE_CALLS.run, compute_rolling, name, lat, lon, radius, region, quality, geometry
+            )
+        else:
+            result = await IN_FLIGHT.do(key, EE_CALLS.run, compute_metric, name, point, region, radius, quality)
+        return respond(request, {**result, 'area': area.describe()} if area is not None else result)
+    except Exception as e:
+        log.error(f'{label} failed', extra={'error': str(e)})
+        return error_response(e)
+
+
+def metric_route(name):
+    """Cached endpoint for a registered metric (see datasets.py)"""
+    @cached(DATASETS[name]['dataset'])
+    async def endpoint(request):
+        return await serve_metric(request, name, DATASETS[name]['label'])
+    return endpoint
+
+
+async def health(request):
+    """Health check endpoint"""
+    initialized = await ensure_ee()
+    return JSONResponse({
+        'status': 'ok',
+        'earth_engine': 'initialized' if initialized else 'failed',
+        'earth_engine_init': EE.status(),
+        'cache': RESULT_CACHE.stats() if CACHE_ENABLED else 'disabled',
+        'disk_cache': await run_in_threadpool(DISK_CACHE.stats) if DISK_CACHE is not None else 'disabled',
+        'jobs': await run_in_threadpool(JOBS.stats) if JOBS is not None else 'disabled',
+        'coalescing': IN_FLIGHT.stats(),
+        'executor': EE_CALLS.stats(),
+        'scheduler': SCHEDULER.stats(),
+        'grid': {'path': GRID.path, 'layers': GRID.layers} if GRID else 'none',
+        'rasters': {'path': RASTERS.path, 'regions': RASTERS.regions} if RASTERS else 'none',
+        'timestamp': datetime.utcnow().isoformat()
+    })
+
+
+async def prometheus(request):
+    """Prometheus metrics for this worker process"""
+    return Response(REGISTRY.render(), media_type='text/plain; version=0.0.4')
+
+
+async def get_metrics(request):
+    """Get several metrics for one location in a single Earth Engine round trip"""
+    if not await ensure_ee():
+        return error('Earth Engine not initialized')
+
+    names = [n.strip() for n in request.query_params.get('names', '').split(',') if n.strip()]
+    unknown = [n for n in names if n not in METRICS]
+    if not names or unknown:
+        return error(
+            f"Unknown metrics: {', '.join(unknown)}" if unknown else 'No metrics requested', 400,
+            available=list(METRICS)
+        )
+
+    try:
+        quality = parse_quality(request.query_params)
+        area = await request_area(request)
+    except ValueError as e:
+        return error(str(e), 400)
+
+    try:
+        lat, lon, radius = location(request, area)
+        point = ee.Geometry.Point([lon, lat])
+        scale = min(metric_params(name, radius, quality)['scale'] for name in names)
+        region = request_region(area, point, radius, scale)
+        key = ('metrics', tuple(names), round(lat, 6), round(lon, 6), radius, quality, area and area.hash)
+
+        response = {
+            'coordinates': {'lat': lat, 'lon': lon},
+            'radius_km': radius / 1000,
+            'timestamp': datetime.utcnow().isoformat(),
+            'metrics': await IN_FLIGHT.do(
+                key, EE_CALLS.run, compute_metrics, names, point, region, radius, quality
+            )
+        }
+        if area is not None:
+            response['area'] = area.describe()
+        return respond(request, response)
+    except Exception as e:
+        log.error('Combined metrics failed', extra={'error': str(e), 'metrics': names})
+        return error_response(e)
+
+
+async def get_timeseries(request):
+    """Get a daily, weekly or monthly series of a metric in one Earth Engine job"""
+    metric = request.path_params['metric']
+    if metric not in SERIES:
+        return error(f'Unknown metric: {metric}', 404, available=list(SERIES))
+
+    try:
+        period, count, quality = parse_timeseries(request.query_params)
+        area = await request_area(request)
+    except ValueError as e:
+        return error(str(e), 400)
+
+    if not await ensure_ee():
+        return error('Earth Engine not initialized')
+
+    try:
+        lat, lon, radius = location(request, area)
+        point = ee.Geometry.Point([lon, lat])
+        region = request_region(area, point, radius, reduction_params(series_scale(metric), radius, quality)['scale'])
+        geometry = area.hash if area is not None else None
+        key = ('timeseries', metric, period, count, round(lat, 6), round(lon, 6), radius, quality, geometry)
+        result = await IN_FLIGHT.do(
+            key, EE_CALLS.run, compute_timeseries, metric, lat, lon, radius, period, count, region, quality, geometry
+        )
+        return respond(request, {**result, 'area': area.describe()} if area is not None else result)
+    except Exception as e:
+        log.error('Time series failed', extra={'error': str(e), 'metric': metric})
+        return error_response(e)
+
+
+async def post_batch(request):
+    """Get one metric for many sites, streamed back as newline-delimited JSON, msgpack or one columnar table"""
+    metric = request.path_params['metric']
+    if not await ensure_ee():
+        return error('Earth Engine not initialized')
+
+    if metric not in METRICS:
+        return error(f'Unknown metric: {metric}', 404, available=list(METRICS))
+
+    try:
+        payload = await request.json()
+    except ValueError:
+        payload = None
+    try:
+        sites = parse_sites(payload)
+        quality = parse_quality(request.query_params)
+    except ValueError as e:
+        return error(str(e), 400)
+
+    # Chunks share one reduction scale, so group sites of similar size
+    sites.sort(key=lambda s: s['radius'])
+    chunks = [sites[i:i + BATCH_CHUNK_SIZE] for i in range(0, len(sites), BATCH_CHUNK_SIZE)]
+    log.info('Batch started', extra={'metric': metric, 'sites': len(sites), 'chunks': len(chunks)})
+
+    # Per-batch limit on top of the global one, so one batch cannot take every slot
+    batch_slots = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def reduce_chunk(chunk):
+        async with batch_slots:
+            try:
+                return await EE_CALLS.run(compute_batch, metric, chunk, quality)
+            except Exception as e:
+                log.error('Batch chunk failed', extra={'metric': metric, 'error': str(e)})
+                return [{'id': s['id'], 'error': str(e)} for s in chunk]
+
+    async def generate():
+        tasks = [asyncio.ensure_future(reduce_chunk(chunk)) for chunk in chunks]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                for row in await next_done:
+                    yield row
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return stream_response(request, generate())
+
+
+async def assessment_metrics(lat, lon, radius, point, region, quality, area=None):
+    """Async counterpart of app.compute_assessment_metrics"""
+    results = {}
+    for _, metric, _ in ASSESSMENT_COMPONENTS.values():
+        result = await local_raster(metric, lat, lon, radius, quality, area)
+        if result is None and area is None:
+            result = grid_metric(metric, lat, lon, radius / 1000, quality)
+        if result is not None:
+            results[metric] = result
+
+    names = [metric for _, metric, _ in ASSESSMENT_COMPONENTS.values() if metric not in results]
+    if not names:
+        return results
+
+    try:
+        combined = await asyncio.wait_for(
+            EE_CALLS.run(compute_metrics, names, point, region, radius, quality), METRIC_TIMEOUT
+        )
+        return {**results, **combined}
+    except asyncio.TimeoutError:
+        timeout = TimeoutError(f'timed out after {METRIC_TIMEOUT:g}s')
+        return {**results, **{name: timeout for name in names}}
+    except Exception as e:
+        log.warning('Combined assessment query failed, retrying per metric', extra={'error': str(e)})
+
+    async def single(name):
+        try:
+            return await asyncio.wait_for(
+                EE_CALLS.run(compute_metric, name, point, region, radius, quality), METRIC_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            return TimeoutError(f'timed out after {METRIC_TIMEOUT:g}s')
+        except Exception as e:
+            return e
+
+    values = await asyncio.gather(*(single(name) for name in names))
+    return {**results, **dict(zip(names, values))}
+
+
+async def get_environmental_assessment(request):
+    """Get comprehensive environmental assessment with scoring"""
+    try:
+        quality = parse_quality(request.query_params)
+        weights = parse_weights(request.query_params.get('weights'), DEFAULT_WEIGHTS)
+        area = await request_area(request)
+    except ValueError as e:
+        return error(str(e), 400)
+
+    if wants_job(request.query_params):
+        return await queue_job(request, 'environmental-assessment')
+
+    if not await ensure_ee():
+        return error('Earth Engine not initialized')
+
+    try:
+        lat, lon, radius = location(request, area)
+        log.info('Environmental assessment', extra={'lat': lat, 'lon': lon})
+
+        point = ee.Geometry.Point([lon, lat])
+        region = request_region(area, point, radius, assessment_scale(radius, quality))
+
+        key = ('assessment', round(lat, 6), round(lon, 6), radius, quality, area and area.hash)
+        metric_results = await IN_FLIGHT.do(
+            key, assessment_metrics, lat, lon, radius, point, region, quality, area
+        )
+        response = assessment_response(lat, lon, radius, metric_results, weights)
+        if area is not None:
+            response['area'] = area.describe()
+        return respond(request, response)
+    except Exception as e:
+        log.error('Environmental assessment failed', extra={'error': str(e)})
+        return error_response(e)
+
+
+async def post_assessment_batch(request):
+    """Assess many sites, streamed back as newline-delimited JSON, msgpack or one columnar table"""
+    if not await ensure_ee():
+        return error('Earth Engine not initialized')
+
+    try:
+        payload = await request.json()
+    except ValueError:
+        payload = None
+    try:
+        sites = parse_sites(payload)
+        quality = parse_quality(request.query_params)
+        weights = parse_weights(request.query_params.get('weights'), DEFAULT_WEIGHTS)
+    except ValueError as e:
+        return error(str(e), 400)
+
+    # Chunks share one reduction scale per metric, so group sites of similar size
+    sites.sort(key=lambda s: s['radius'])
+    chunks = [sites[i:i + BATCH_CHUNK_SIZE] for i in range(0, len(sites), BATCH_CHUNK_SIZE)]
+    log.info('Batch assessment started', extra={'sites': len(sites), 'chunks': len(chunks)})
+
+    batch_slots = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def assess_chunk(chunk):
+        async with batch_slots:
+            try:
+                return await EE_CALLS.run(compute_assessment_batch, chunk, quality, weights)
+            except Exception as e:
+                log.error('Batch assessment chunk failed', extra={'error': str(e)})
+                return [{'id': s['id'], 'error': str(e)} for s in chunk]
+
+    async def generate():
+        tasks = [asyncio.ensure_future(assess_chunk(chunk)) for chunk in chunks]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                for row in await next_done:
+                    yield row
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return stream_response(request, generate())
+
+
+async def get_large_area(request):
+    """Reduce a metric over a large circle or posted area tile by tile, streaming progress as NDJSON or msgpack"""
+    metric = request.path_params['metric']
+    if metric not in METRICS:
+        return error(f'Unknown metric: {metric}', 404, available=list(METRICS))
+
+    try:
+        area = await request_area(request)
+        lat, lon, radius = location(request, area)
+    except ValueError as e:
+        return error(str(e), 400)
+
+    if wants_job(request.query_params):
+        return await queue_job(request, 'large-area', metric=metric)
+
+    # Progress events have no common columns
+    if request.state.format in COLUMNAR:
+        raise NotAcceptable('Large-area progress is streamed as JSON or msgpack')
+
+    if not await ensure_ee():
+        return error('Earth Engine not initialized')
+
+    ttl = DATASET_TTLS[DATASETS[metric]['dataset']]
+    key = cache_key(request.url.path, request.query_params, area) if CACHE_ENABLED else None
+    result = await run_in_threadpool(cache_lookup, key) if key is not None else None
+    if result is not None:
+        return stream_response(request, [stream_event('result', **result, cached=True)])
+
+    plan = plan_large_area(metric, lat, lon, radius, area)
+    total = len(plan['tiles'])
+    log.info('Large-area reduction started', extra={'metric': metric, 'tiles': total, 'scale_m': plan['scale']})
+
+    # Per-request limit on top of the global one, as for batches
+    tile_slots = asyncio.Semaphore(TILE_CONCURRENCY)
+
+    async def reduce(index, tile):
+        async with tile_slots:
+            try:
+                return index, await EE_CALLS.run(reduce_tile, plan, tile), None
+            except Exception as e:
+                log.warning('Large-area tile failed', extra={'metric': metric, 'error': str(e)})
+                return index, None, str(e)
+
+    async def generate():
+        yield stream_event('plan', metric=metric, tiles=total, scale_m=plan['scale'])
+        try:
+            context = await EE_CALLS.run(get_info, plan['context'], metric) if plan['context'] is not None else None
+        except Exception as e:
+            log.error('Large-area reduction failed', extra={'metric': metric, 'error': str(e)})
+            yield stream_event('error', error=str(e))
+            return
+
+        partials, failed = [], 0
+        tasks = [asyncio.ensure_future(reduce(i, tile)) for i, tile in enumerate(plan['tiles'])]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                index, partial, failure = await next_done
+                if failure is None:
+                    partials.append(partial)
+                else:
+                    failed += 1
+                    yield stream_event('tile_failed', tile=index, error=failure)
+                yield stream_event(
+                    'progress', done=len(partials) + failed, total=total,
+                    partial=large_area_result(plan, partials, context, failed)
+                )
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        result = large_area_result(plan, partials, context, failed)
+        if key is not None and not failed:
+            await run_in_threadpool(cache_store, key, result, ttl)
+        yield stream_event('result', **result)
+
+    return stream_response(request, generate())
+
+
+# Routes whose Earth Engine calls queue behind interactive map requests (see scheduler.py)
+BATCH_ROUTES = ('/batch/{metric}', '/environmental-assessment/batch', '/large-area/{metric}')
+
+routes = [
+    Route('/health', health),
+    Route('/prometheus', prometheus),
+    *[Route(f'/{name}', metric_route(name), methods=['GET', 'POST']) for name in METRICS],
+    Route('/metrics', get_metrics, methods=['GET', 'POST']),
+    Route('/timeseries/{metric}', get_timeseries, methods=['GET', 'POST']),
+    Route('/batch/{metric}', post_batch, methods=['POST']),
+    Route('/environmental-assessment', get_environmental_assessment, methods=['GET', 'POST']),
+    Route('/environmental-assessment/batch', post_assessment_batch, methods=['POST']),
+    Route('/large-area/{metric}', get_large_area, methods=['GET', 'POST']),
+    Route('/jobs/{job_id}', get_job),
+]
+
+
+class RequestMetrics:
+    """ASGI middleware recording per-route latency and EE usage, as app.py does with request hooks"""
+
+    def __init__(self, app):
+        self.app = app
+
+    def route_of(self, scope):
+        for route in routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return 'unmatched'
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        stats = begin_request(self.route_of(scope))
+        set_priority('batch' if stats.route in BATCH_ROUTES else 'interactive')
+        status = 500
+
+        async def send_and_record(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+            # Streamed responses (batch NDJSON) are timed until the last chunk is sent
+            if message['type'] == 'http.response.body' and not message.get('more_body', False):
+                duration = end_request(stats, status)
+                log.info('request', extra={
+                    'route': stats.route,
+                    'status': status,
+                    'duration_ms': round(duration * 1000, 1),
+                    'ee_calls': stats.ee_calls,
+                    'ee_ms': round(stats.ee_seconds * 1000, 1)
+                })
+
+        await self.app(scope, receive, send_and_record)
+
+
+class ResponseEncoding:
+    """
+    ASGI middleware negotiating the response format and compressing responses
+    with brotli or gzip, as app.py does with request hooks (see formats.py)
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        headers = Headers(scope=scope)
+        try:
+            fmt = negotiate(headers.get('accept'), QueryParams(scope['query_string']).get('format'))
+        except NotAcceptable as e:
+            return await error(str(e), 406, available=e.available)(scope, receive, send)
+        scope.setdefault('state', {})['format'] = fmt
+
+        encoding = choose_encoding(headers.get('accept-encoding'))
+        start, compressor = None, None
+
+        async def send_encoded(message):
+            nonlocal start, compressor
+            if message['type'] == 'http.response.start':
+                # Held back until the first body chunk shows whether the response is worth compressing
+                start = message
+                return
+            if message['type'] != 'http.response.body':
+                return await send(message)
+
+            body, more = message.get('body', b''), message.get('more_body', False)
+            if start is not None:
+                response_headers = MutableHeaders(raw=start['headers'])
+                response_headers.add_vary_header('Accept')
+                response_headers.add_vary_header('Accept-Encoding')
+                media_type = response_headers.get('content-type', '').split(';')[0]
+                if encoding is not None and compressible(media_type, response_headers.get('content-encoding')) \
+                        and (more or len(body) >= COMPRESS_MIN_BYTES):
+                    response_headers['Content-Encoding'] = encoding
+                    if more:
+                        compressor = Compressor(encoding)
+                        if 'content-length' in response_headers:
+                            del response_headers['Content-Length']
+                    else:
+                        body = compress(body, encoding)
+                        response_headers['Content-Length'] = str(len(body))
+                await send(start)
+                start = None
+
+            if compressor is not None:
+                body = compressor.compress(body) if body else b''
+                if not more:
+                    body += compressor.finish()
+            await send({**message, 'body': body})
+
+        await self.app(scope, receive, send_encoded)
+
+
+app = Starlette(
+    routes=routes,
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*']),
+        Middleware(RequestMetrics),
+        Middleware(ResponseEncoding),
+    ],
+    exception_handlers={NotAcceptable: not_acceptable}
+)
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run('asgi_app:app', host='0.0.0.0', port=int(os.getenv('PORT', 5002)))
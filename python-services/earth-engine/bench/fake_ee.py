@@ -0,0 +1,436 @@
+"""
+Deterministic local stand-in for the `ee` module
+Builds the same lazy object graphs as the real client, but getInfo() evaluates
+them locally against canned per-dataset results after a configurable delay.
+Only the subset of the API used by app.py is implemented.
+
+    import sys
+    import fake_ee
+    fake_ee.configure(latency_ms=250)
+    sys.modules['ee'] = fake_ee  # before importing app
+"""
+
+import time
+import random
+import threading
+from datetime import datetime
+
+import numpy as np
+
+# Canned results per dataset: the band reductions report on and the value of
+# each reducer output over any region
+DATASETS = {
+    'COPERNICUS/S2_SR_HARMONIZED': {
+        'band': 'NDVI',
+        'values': {'mean': 0.52, 'min': -0.08, 'max': 0.89, 'stdDev': 0.17, 'sum': 52.0, 'count': 100},
+        'images_per_day': 0.4,
+        'cloud_cover': 23.4,
+    },
+    'ESA/WorldCover/v200': {
+        'band': 'Map',
+        'values': {'histogram': {'10': 5120.0, '30': 1630.5, '40': 910.0, '50': 402.25, '80': 240.0}},
+    },
+    'MODIS/061/MOD11A1': {'band': 'LST_Day_1km', 'values': {'mean': 18.4, 'min': 11.2, 'max': 27.9, 'sum': 1840.0, 'count': 100}},
+    'NASA/SMAP/SPL4SMGP/007': {'band': 'sm_surface', 'values': {'mean': 0.241, 'min': 0.182, 'max': 0.305, 'sum': 24.1, 'count': 100}},
+    'NASA/GPM_L3/IMERG_V06': {'band': 'precipitation', 'values': {'mean': 61.37, 'sum': 6137.0, 'count': 100}},
+    'MODIS/061/MOD16A2GF': {'band': 'ET', 'values': {'mean': 14.62, 'sum': 1462.0, 'count': 100}},
+    'JRC/GSW1_4/GlobalSurfaceWater': {'band': 'occurrence', 'values': {'mean': 7.9, 'sum': 790.0, 'count': 100}},
+    'COPERNICUS/S5P/OFFL/L3_NO2': {'band': 'tropospheric_NO2_column_number_density', 'values': {'mean': 3.1e-5, 'sum': 3.1e-3, 'count': 100}},
+    'MODIS/061/MOD14A1': {'band': 'MaxFRP', 'values': {'max': 2}},
+}
+
+_config = {'latency_ms': 0.0, 'jitter_ms': 0.0, 'min_window_days': 0, 'error_rate': 0.0, 'quota_rate': 0.0,
+           'empty_sites': set()}
+_lock = threading.Lock()
+_random = random.Random(0)
+_calls = 0
+
+
+class EEException(Exception):
+    pass
+
+
+def configure(latency_ms=0.0, jitter_ms=0.0, min_window_days=0, error_rate=0.0, quota_rate=0.0, seed=0,
+              empty_sites=()):
+    """
+    Set the simulated getInfo() latency (plus uniform jitter), the shortest
+    look-back window that contains imagery (which drives the NDVI window
+    fallback), the fraction of getInfo() calls that fail, the fraction
+    rejected with a 429 quota error and the (lon, lat) points around which no
+    collection has imagery.
+    """
+    global _random
+    _config.update(latency_ms=latency_ms, jitter_ms=jitter_ms, min_window_days=min_window_days,
+                   error_rate=error_rate, quota_rate=quota_rate,
+                   empty_sites={tuple(site) for site in empty_sites})
+    _random = random.Random(seed)
+    reset_calls()
+
+
+def reset_calls():
+    global _calls
+    with _lock:
+        _calls = 0
+
+
+def call_count():
+    with _lock:
+        return _calls
+
+
+def _simulate_round_trip():
+    global _calls
+    with _lock:
+        _calls += 1
+        delay = _config['latency_ms'] + _random.uniform(0, _config['jitter_ms'])
+        failed = _random.random() < _config['error_rate']
+        throttled = _random.random() < _config['quota_rate']
+    if throttled:
+        # Rejected before any computation
+        raise EEException('Too Many Requests: Request was rejected because the request rate or concurrency '
+                          'limit was exceeded.')
+    if delay > 0:
+        time.sleep(delay / 1000)
+    if failed:
+        raise EEException('Simulated Earth Engine error')
+
+
+def _evaluate(value):
+    if isinstance(value, ComputedObject):
+        return value._evaluate()
+    if isinstance(value, dict):
+        return {k: _evaluate(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_evaluate(v) for v in value]
+    return value
+
+
+class ComputedObject:
+    """A lazily evaluated value; operations not modelled here pass it through"""
+
+    def __init__(self, evaluate=None):
+        self._evaluator = evaluate or (lambda: None)
+
+    def _evaluate(self):
+        return self._evaluator()
+
+    def getInfo(self):
+        _simulate_round_trip()
+        return self._evaluate()
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self
+
+    def gt(self, other):
+        return ComputedObject(lambda: _evaluate(self) > _evaluate(other))
+
+    def get(self, key):
+        def evaluate():
+            value = self._evaluate()
+            return value.get(key) if isinstance(value, dict) else value[key]
+        return ComputedObject(evaluate)
+
+
+class _Raster(ComputedObject):
+    """
+    An image or image collection from one dataset. Band math, selection and
+    compositing keep the dataset; filterDate and filterBounds record the
+    look-back window and bounds, which decide whether the collection is empty.
+    When built from ee.Algorithms.If the concrete raster is only chosen at
+    evaluation time.
+    """
+
+    def __init__(self, source=None):
+        super().__init__()
+        self.dataset = None
+        self.window_days = None
+        self.bounds = None
+        self._choose = None
+        if isinstance(source, str):
+            self.dataset = source
+        elif isinstance(source, _Branch):
+            self._choose = source.chosen
+        elif isinstance(source, _Raster):
+            self.dataset, self.window_days, self._choose = source.dataset, source.window_days, source._choose
+            self.bounds = source.bounds
+
+    def _concrete(self):
+        return self._choose()._concrete() if self._choose is not None else self
+
+    def _copy(self, **changes):
+        raster = _Raster(self)
+        for key, value in changes.items():
+            setattr(raster, key, value)
+        return raster
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self._copy()
+
+    @staticmethod
+    def constant(value):
+        return _Raster()
+
+    def filterDate(self, start, end=None):
+        start, end = _evaluate(start), _evaluate(end)
+        days = (datetime.strptime(end, '%Y-%m-%d') - datetime.strptime(start, '%Y-%m-%d')).days if end else None
+        return self._copy(window_days=days)
+
+    def filterBounds(self, bounds):
+        return self._copy(bounds=bounds)
+
+    def size(self):
+        def evaluate():
+            raster = self._concrete()
+            days = raster.window_days or 365
+            if raster.dataset is None or days < _config['min_window_days']:
+                return 0
+            if getattr(raster.bounds, 'coords', None) in _config['empty_sites']:
+                return 0
+            return max(1, int(days * DATASETS.get(raster.dataset, {}).get('images_per_day', 1)))
+        return ComputedObject(evaluate)
+
+    def aggregate_mean(self, prop):
+        return ComputedObject(lambda: DATASETS.get(self._concrete().dataset, {}).get('cloud_cover'))
+
+    def reduceRegion(self, reducer=None, geometry=None, scale=None, maxPixels=None, **kwargs):
+        return Dictionary(ComputedObject(lambda: _reduce(self._concrete().dataset, reducer)))
+
+    def reduceRegions(self, collection=None, reducer=None, scale=None, **kwargs):
+        def evaluate():
+            stats = _reduce_outputs(self._concrete().dataset, reducer)
+            return {
+                'type': 'FeatureCollection',
+                'features': [
+                    {'type': 'Feature', 'geometry': None, 'properties': {**f['properties'], **stats}}
+                    for f in _evaluate(collection)['features']
+                ]
+            }
+        return FeatureCollection(ComputedObject(evaluate))
+
+
+Image = ImageCollection = _Raster
+
+
+class Dictionary(ComputedObject):
+    def __init__(self, source=None):
+        if isinstance(source, ComputedObject):
+            super().__init__(source._evaluate)
+        else:
+            values = dict(source or {})
+            super().__init__(lambda: _evaluate(values))
+
+    def set(self, key, value):
+        return Dictionary(ComputedObject(lambda: {**self._evaluate(), key: _evaluate(value)}))
+
+    def combine(self, other):
+        return Dictionary(ComputedObject(lambda: {**self._evaluate(), **_evaluate(other)}))
+
+
+class List(ComputedObject):
+    def __init__(self, source=None):
+        if isinstance(source, ComputedObject):
+            super().__init__(source._evaluate)
+        else:
+            items = list(source or [])
+            super().__init__(lambda: _evaluate(items))
+
+    def map(self, fn):
+        # Items are constants here, so the mapped function can be built per item
+        return ComputedObject(lambda: [_evaluate(fn(ComputedObject(lambda v=v: v))) for v in self._evaluate()])
+
+
+class Feature(ComputedObject):
+    def __init__(self, geometry=None, properties=None):
+        self._geometry = geometry
+        self._properties = properties or {}
+        super().__init__(lambda: {'type': 'Feature', 'geometry': None, 'properties': _evaluate(self._properties)})
+
+    def geometry(self):
+        return self._geometry
+
+    def set(self, properties, value=None):
+        if not isinstance(properties, (dict, ComputedObject)):
+            properties = {properties: value}
+        own = self._properties
+        return Feature(self._geometry, ComputedObject(lambda: {**_evaluate(own), **_evaluate(properties)}))
+
+
+class FeatureCollection(ComputedObject):
+    def __init__(self, source=None):
+        self._features = None
+        if isinstance(source, list):
+            self._features = features = source
+            super().__init__(lambda: {'type': 'FeatureCollection', 'features': [_evaluate(f) for f in features]})
+        else:
+            super().__init__(source._evaluate if source is not None else None)
+
+    def map(self, fn):
+        # Only collections of ee.Feature objects built locally can be mapped
+        return FeatureCollection([fn(feature) for feature in self._features])
+
+    def select(self, *args, **kwargs):
+        return self
+
+
+class _Point(ComputedObject):
+    """A point geometry; buffering and other operations keep its coordinates"""
+
+    def __init__(self, coords):
+        super().__init__()
+        self.coords = tuple(coords)
+
+
+class Geometry:
+    @staticmethod
+    def Point(coords, *args, **kwargs):
+        return _Point(coords)
+
+    @staticmethod
+    def Rectangle(coords, *args, **kwargs):
+        return ComputedObject()
+
+    @staticmethod
+    def Polygon(coords, *args, **kwargs):
+        return ComputedObject()
+
+    @staticmethod
+    def MultiPolygon(coords, *args, **kwargs):
+        return ComputedObject()
+
+
+class _Reducer:
+    def __init__(self, outputs):
+        self.outputs = list(outputs)
+
+    def combine(self, other, prefix='', sharedInputs=False):
+        return _Reducer(self.outputs + other.outputs)
+
+    def unweighted(self):
+        return self
+
+    def setOutputs(self, outputs):
+        return _Reducer(outputs)
+
+
+class Reducer:
+    @staticmethod
+    def mean():
+        return _Reducer(['mean'])
+
+    @staticmethod
+    def minMax():
+        return _Reducer(['min', 'max'])
+
+    @staticmethod
+    def stdDev():
+        return _Reducer(['stdDev'])
+
+    @staticmethod
+    def max():
+        return _Reducer(['max'])
+
+    @staticmethod
+    def min():
+        return _Reducer(['min'])
+
+    @staticmethod
+    def sum():
+        return _Reducer(['sum'])
+
+    @staticmethod
+    def count():
+        return _Reducer(['count'])
+
+    @staticmethod
+    def median():
+        return _Reducer(['median'])
+
+    @staticmethod
+    def frequencyHistogram():
+        return _Reducer(['histogram'])
+
+
+def _reduce_outputs(dataset, reducer):
+    """reduceRegions-style outputs: one property per reducer output"""
+    values = DATASETS.get(dataset, {}).get('values', {})
+    return {output: values.get(output) for output in reducer.outputs}
+
+
+def _reduce(dataset, reducer):
+    """reduceRegion-style outputs: band name, prefixed when the reducer has several outputs"""
+    spec = DATASETS.get(dataset)
+    if spec is None:
+        # A constant or fully masked image reduces to nothing
+        return {}
+    outputs = _reduce_outputs(dataset, reducer)
+    if len(outputs) == 1:
+        return {spec['band']: next(iter(outputs.values()))}
+    return {f"{spec['band']}_{name}": value for name, value in outputs.items()}
+
+
+class data:
+    """ee.data; only computePixels, which fills the requested grid around each dataset's canned values"""
+
+    @staticmethod
+    def computePixels(params):
+        _simulate_round_trip()
+        spec = DATASETS.get(params['expression']._concrete().dataset, {})
+        grid = params['grid']
+        shape = (grid['dimensions']['height'], grid['dimensions']['width'])
+        transform = grid['affineTransform']
+        # The same block always gets the same pixels
+        rng = np.random.default_rng(abs(hash((transform['translateX'], transform['translateY']))) % 2 ** 32)
+
+        values = spec.get('values', {})
+        if 'histogram' in values:
+            classes = np.array([int(c) for c in values['histogram']], dtype=np.uint8)
+            weights = np.array(list(values['histogram'].values()))
+            pixels = rng.choice(classes, size=shape, p=weights / weights.sum())
+        else:
+            mean = values.get('mean', 0.0)
+            pixels = rng.normal(mean, values.get('stdDev', abs(mean) * 0.1), size=shape)
+            pixels = np.clip(pixels, values.get('min', -np.inf), values.get('max', np.inf)).astype(np.float32)
+
+        result = np.empty(shape, dtype=[(spec.get('band', 'constant'), pixels.dtype)])
+        result[spec.get('band', 'constant')] = pixels
+        return result
+
+
+class Filter:
+    @staticmethod
+    def lt(name, value):
+        return None
+
+    @staticmethod
+    def gt(name, value):
+        return None
+
+
+class Algorithms:
+    @staticmethod
+    def If(condition, true_case, false_case):
+        return _Branch(condition, true_case, false_case)
+
+
+class _Branch(ComputedObject):
+    """ee.Algorithms.If result; only the branch the condition picks is evaluated"""
+
+    def __init__(self, condition, true_case, false_case):
+        super().__init__(lambda: _evaluate(self.chosen()))
+        self._branches = (condition, true_case, false_case)
+
+    def chosen(self):
+        condition, true_case, false_case = self._branches
+        return true_case if _evaluate(condition) else false_case
+
+
+def ServiceAccountCredentials(email, key_file=None, key_data=None):
+    return {'email': email}
+
+
+def Initialize(credentials=None, **kwargs):
+    return None
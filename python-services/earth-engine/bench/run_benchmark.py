@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for the Earth Engine service
+Runs the service against fake_ee (no credentials or network needed) and drives
+each route at a fixed concurrency, in process, reporting latency percentiles,
+throughput and Earth Engine calls per request as JSON. --target picks the
+Flask app (app.py, through its WSGI test client) or the ASGI variant
+(asgi_app.py, called directly on one event loop).
+
+Examples:
+    python3 bench/run_benchmark.py --latency-ms 300 --concurrency 16
+    python3 bench/run_benchmark.py --target asgi --concurrency 256
+    python3 bench/run_benchmark.py --scenarios ndvi,environmental-assessment --output run.json
+    python3 bench/run_benchmark.py --baseline run.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVICE_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, SERVICE_DIR)
+
+import fake_ee
+
+# Scenario name -> request to repeat. `fake` overrides fake_ee settings for the
+# scenario, e.g. making short NDVI windows empty to exercise the window fallback,
+# and `radius` (km) overrides --radius.
+SCENARIOS = {
+    'health': {'path': '/health', 'located': False},
+    'ndvi': {'path': '/ndvi'},
+    'ndvi-window-fallback': {'path': '/ndvi', 'fake': {'min_window_days': 180}},
+    'ndvi-no-imagery': {'path': '/ndvi', 'fake': {'min_window_days': 1000}},
+    'landcover': {'path': '/landcover'},
+    'temperature': {'path': '/temperature'},
+    'soil-moisture': {'path': '/soil-moisture'},
+    'precipitation': {'path': '/precipitation'},
+    'evapotranspiration': {'path': '/evapotranspiration'},
+    'surface-water': {'path': '/surface-water'},
+    'air-quality': {'path': '/air-quality'},
+    'fire': {'path': '/fire'},
+    'metrics': {'path': '/metrics', 'params': {'names': 'ndvi,landcover,temperature,precipitation'}},
+    'timeseries-ndvi': {'path': '/timeseries/ndvi', 'params': {'period': 'weekly', 'periods': 26}},
+    'timeseries-ndvi-npy': {'path': '/timeseries/ndvi', 'params': {'period': 'weekly', 'periods': 26, 'format': 'npy'}},
+    'batch-ndvi': {'method': 'POST', 'path': '/batch/ndvi', 'sites': 250},
+    'batch-ndvi-msgpack': {'method': 'POST', 'path': '/batch/ndvi', 'sites': 250, 'params': {'format': 'msgpack'}},
+    'environmental-assessment': {'path': '/environmental-assessment'},
+    'environmental-assessment-degraded': {'path': '/environmental-assessment', 'fake': {'error_rate': 0.3}},
+    'ndvi-quota-throttled': {'path': '/ndvi', 'fake': {'quota_rate': 0.2}},
+    'batch-assessment': {'method': 'POST', 'path': '/environmental-assessment/batch', 'sites': 250},
+    'large-area-ndvi': {'path': '/large-area/ndvi', 'radius': 50},
+}
+
+
+def percentile(values, pct):
+    """Linearly interpolated percentile of a sorted list"""
+    if not values:
+        return None
+    rank = (len(values) - 1) * pct / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (rank - lower)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=SERVICE_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_app(args):
+    """Import app.py with fake_ee in place of the Earth Engine client"""
+    os.environ.setdefault('GOOGLE_EARTH_ENGINE_KEY', json.dumps({'client_email': 'bench@example.com'}))
+    os.environ['EE_CACHE_ENABLED'] = 'true' if args.cache else 'false'
+    os.environ['EE_DISK_CACHE_ENABLED'] = 'false'
+    os.environ['EE_GRID_PATH'] = args.grid or os.path.join(BENCH_DIR, 'no-grid')
+    os.environ['EE_RASTER_PATH'] = args.rasters or os.path.join(BENCH_DIR, 'no-rasters')
+    os.environ.setdefault('EE_LOG_LEVEL', 'WARNING')
+
+    sys.modules['ee'] = fake_ee
+    import app as service
+
+    # Keep stdout for the report
+    for handler in service.log.handlers:
+        handler.setStream(sys.stderr)
+
+    if args.target == 'asgi':
+        import asgi_app
+        return asgi_app.app
+    return service.app
+
+
+async def asgi_call(app, method, url, body):
+    """Send one HTTP request straight to an ASGI app and return its status code"""
+    path, _, query = url.partition('?')
+    payload = json.dumps(body).encode() if body is not None else b''
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': method, 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+        'query_string': query.encode(), 'root_path': '',
+        'headers': [(b'content-type', b'application/json')] if body is not None else [],
+        'client': ('127.0.0.1', 0), 'server': ('bench', 80),
+    }
+    received = False
+    status = None
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {'type': 'http.request', 'body': payload, 'more_body': False}
+        # The client never disconnects; streaming responses wait here until done
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+
+    await app(scope, receive, send)
+    return status
+
+
+def drive_wsgi(app, requests, warmup, concurrency):
+    """Return ([(seconds, status)], elapsed) for the requests after the warmup ones"""
+    def send(spec):
+        method, url, body = spec
+        client = app.test_client()
+        started = time.perf_counter()
+        response = client.open(url, method=method, json=body)
+        response.get_data()  # drain streamed responses
+        return time.perf_counter() - started, response.status_code
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, requests[:warmup]))
+        fake_ee.reset_calls()
+        started = time.perf_counter()
+        results = list(pool.map(send, requests[warmup:]))
+        return results, time.perf_counter() - started
+
+
+async def drive_asgi(app, requests, warmup, concurrency):
+    slots = asyncio.Semaphore(concurrency)
+
+    async def send(spec):
+        async with slots:
+            started = time.perf_counter()
+            status = await asgi_call(app, *spec)
+            return time.perf_counter() - started, status
+
+    await asyncio.gather(*(send(spec) for spec in requests[:warmup]))
+    fake_ee.reset_calls()
+    started = time.perf_counter()
+    results = await asyncio.gather(*(send(spec) for spec in requests[warmup:]))
+    return results, time.perf_counter() - started
+
+
+def make_request(scenario, rng, args):
+    """Return (method, url, json body) for one request of a scenario"""
+    def location():
+        if args.same_location:
+            return args.lat, args.lon
+        # Spread requests over ~1 degree so they neither coalesce nor share cache cells
+        return round(args.lat + rng.uniform(-0.5, 0.5), 5), round(args.lon + rng.uniform(-0.5, 0.5), 5)
+
+    params = dict(scenario.get('params', {}))
+    body = None
+    if 'sites' in scenario:
+        body = {'sites': [
+            dict(zip(('lat', 'lon'), location()), id=i, radius=args.radius) for i in range(scenario['sites'])
+        ]}
+    elif scenario.get('located', True):
+        lat, lon = location()
+        params.update(lat=lat, lon=lon, radius=scenario.get('radius', args.radius))
+
+    query = '&'.join(f'{k}={v}' for k, v in params.items())
+    return scenario.get('method', 'GET'), scenario['path'] + (f'?{query}' if query else ''), body
+
+
+def run_scenario(app, loop, name, scenario, args):
+    fake_ee.configure(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        seed=args.seed,
+        **{'min_window_days': 0, 'error_rate': args.error_rate, **scenario.get('fake', {})}
+    )
+    rng = random.Random(f'{args.seed}:{name}')
+    requests = [make_request(scenario, rng, args) for _ in range(args.warmup + args.requests)]
+
+    if args.target == 'asgi':
+        results, elapsed = loop.run_until_complete(drive_asgi(app, requests, args.warmup, args.concurrency))
+    else:
+        results, elapsed = drive_wsgi(app, requests, args.warmup, args.concurrency)
+
+    latencies = sorted(duration * 1000 for duration, _ in results)
+    errors = sum(1 for _, status in results if status >= 400)
+    return {
+        'path': scenario['path'],
+        'requests': len(results),
+        'errors': errors,
+        'duration_s': round(elapsed, 3),
+        'requests_per_sec': round(len(results) / elapsed, 2) if elapsed else None,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50), 2),
+            'p95': round(percentile(latencies, 95), 2),
+            'p99': round(percentile(latencies, 99), 2),
+            'mean': round(sum(latencies) / len(latencies), 2),
+            'max': round(latencies[-1], 2),
+        },
+        'ee_calls_per_request': round(fake_ee.call_count() / len(results), 3),
+    }
+
+
+def compare(report, baseline):
+    """Relative change (%) of the headline numbers against a previous report"""
+    def change(new, old):
+        return round((new - old) / old * 100, 1) if old else None
+
+    deltas = {}
+    for name, result in report['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if not previous:
+            continue
+        deltas[name] = {
+            'p50_pct': change(result['latency_ms']['p50'], previous['latency_ms']['p50']),
+            'p95_pct': change(result['latency_ms']['p95'], previous['latency_ms']['p95']),
+            'p99_pct': change(result['latency_ms']['p99'], previous['latency_ms']['p99']),
+            'requests_per_sec_pct': change(result['requests_per_sec'], previous['requests_per_sec']),
+            'ee_calls_per_request_pct': change(result['ee_calls_per_request'], previous['ee_calls_per_request']),
+        }
+    return {'commit': baseline.get('commit'), 'timestamp': baseline.get('timestamp'), 'scenarios': deltas}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', choices=['wsgi', 'asgi'], default='wsgi',
+                        help='Flask app (app.py) or ASGI variant (asgi_app.py)')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='comma-separated scenarios to run')
+    parser.add_argument('--requests', type=int, default=100, help='measured requests per scenario')
+    parser.add_argument('--warmup', type=int, default=5, help='unmeasured requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=8, help='requests in flight at once')
+    parser.add_argument('--latency-ms', type=float, default=200, help='simulated getInfo() latency')
+    parser.add_argument('--jitter-ms', type=float, default=50, help='extra uniform random latency')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of getInfo() calls that fail')
+    parser.add_argument('--lat', type=float, default=48.43)
+    parser.add_argument('--lon', type=float, default=-123.37)
+    parser.add_argument('--radius', type=float, default=5, help='query radius in km')
+    parser.add_argument('--same-location', action='store_true',
+                        help='query one location so coalescing (and --cache) take effect')
+    parser.add_argument('--cache', action='store_true', help='enable the in-memory result cache')
+    parser.add_argument('--grid', help='precomputed grid directory to serve static layers from')
+    parser.add_argument('--rasters', help='hot-region raster directory to reduce metrics from')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    parser.add_argument('--baseline', help='previous JSON report to compare against')
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)} (available: {', '.join(SCENARIOS)})")
+
+    app = load_app(args)
+    # One loop for the whole run; the ASGI app's limiters bind to the first loop they run on
+    loop = asyncio.new_event_loop()
+    report = {
+        'timestamp': datetime.utcnow().isoformat(),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'config': {
+            key: getattr(args, key) for key in (
+                'target', 'requests', 'warmup', 'concurrency', 'latency_ms', 'jitter_ms', 'error_rate',
+                'radius', 'same_location', 'cache', 'grid', 'rasters', 'seed'
+            )
+        },
+        'scenarios': {},
+    }
+
+    for name in names:
+        print(f"[INFO] {name}...", file=sys.stderr)
+        report['scenarios'][name] = run_scenario(app, loop, name, SCENARIOS[name], args)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            report['baseline'] = compare(report, json.load(f))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+        print(f"[SUCCESS] Report written to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,343 @@
+"""
+Result cache for Earth Engine metric responses
+Coordinates are snapped to a geohash cell so repeat map requests share entries.
+An in-process LRU (ResultCache) sits in front of an optional SQLite tier
+(DiskCache) shared by all workers and kept across restarts.
+
+Entries are fresh for a TTL derived from how often their dataset gains new
+data, then remain servable as stale for one more cadence while a background
+refresh replaces them (stale-while-revalidate, see app.cached).
+"""
+
+import os
+import json
+import time
+import zlib
+import sqlite3
+import threading
+from collections import OrderedDict
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+# Seconds between new data in each dataset (None = static layer)
+DATASET_CADENCES = {
+    'COPERNICUS/S2_SR_HARMONIZED': 2 * DAY,  # Sentinel-2A/B revisit
+    'ESA/WorldCover/v200': None,
+    'MODIS/061/MOD11A1': DAY,
+    'NASA/SMAP/SPL4SMGP/007': 3 * HOUR,
+    'NASA/GPM_L3/IMERG_V06': DAY,
+    'MODIS/061/MOD16A2GF': 8 * DAY,  # 8-day composites
+    'JRC/GSW1_4/GlobalSurfaceWater': None,
+    'COPERNICUS/S5P/OFFL/L3_NO2': DAY,
+    'MODIS/061/MOD14A1': DAY,
+}
+
+# Results are fresh for half a cadence, so they trail the data by at most
+# half a period, but for at least MIN_TTL
+MIN_TTL = 3 * HOUR
+
+# Seconds each dataset's results stay fresh (None = static layer, never expires),
+# and how much longer they may be served stale while they are refreshed
+DATASET_TTLS = {
+    dataset: max(cadence // 2, MIN_TTL) if cadence is not None else None
+    for dataset, cadence in DATASET_CADENCES.items()
+}
+DATASET_STALE_TTLS = {dataset: cadence or 0 for dataset, cadence in DATASET_CADENCES.items()}
+
+_GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def geohash(lat, lon, precision=7):
+    """Encode a coordinate as a geohash string (precision 7 is ~150 m)"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+
+    while len(chars) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits = bits << 1
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+
+        if bit_count == 5:
+            chars.append(_GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+
+    return ''.join(chars)
+
+
+class ResultCache:
+    """Thread-safe LRU cache with per-entry TTL and an approximate memory cap"""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, precision=7):
+        self.max_bytes = max_bytes
+        self.precision = precision
+        self._entries = OrderedDict()  # key -> (expires_at, stale_until, stored_at, size, value)
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def make_key(self, endpoint, lat, lon, params=None, window=None):
+        """Build a cache key from the endpoint, snapped location and remaining params"""
+        extra = tuple(sorted((params or {}).items()))
+        return (endpoint, geohash(lat, lon, self.precision), extra, window)
+
+    def get(self, key):
+        """Return a fresh value, or None"""
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None and entry[2] else None
+
+    def get_entry(self, key):
+        """Return (value, age in seconds, fresh) for a fresh or stale entry, or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, stale_until, stored_at, size, value = entry
+            fresh = expires_at is None or expires_at > now
+            if not fresh and stale_until <= now:
+                self._remove(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            if fresh:
+                self.hits += 1
+            else:
+                self.stale_hits += 1
+            return value, now - stored_at, fresh
+
+    def set(self, key, value, ttl=None, stale_ttl=0, stored_at=None):
+        size = len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return
+
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        stale_until = expires_at + stale_ttl if expires_at is not None else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (expires_at, stale_until, stored_at or now, size, value)
+            self.total_bytes += size
+
+            while self.total_bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else 0,
+            }
+
+    def _remove(self, key):
+        size = self._entries.pop(key)[3]
+        self.total_bytes -= size
+
+
+def cache_from_env():
+    """Create the shared result cache from EE_CACHE_* environment variables"""
+    max_mb = float(os.getenv('EE_CACHE_MAX_MB', 64))
+    precision = int(os.getenv('EE_CACHE_GEOHASH_PRECISION', 7))
+    return ResultCache(max_bytes=int(max_mb * 1024 * 1024), precision=precision)
+
+
+def _encode_key(key):
+    return json.dumps(key, separators=(',', ':'))
+
+
+def _decode_key(data):
+    """Rebuild the tuple key a ResultCache uses from its JSON form"""
+    def to_tuple(value):
+        return tuple(to_tuple(v) for v in value) if isinstance(value, list) else value
+    return to_tuple(json.loads(data))
+
+
+class DiskCache:
+    """
+    Persistent result cache in a local SQLite database (WAL mode), shared by all
+    worker processes and surviving restarts. Values are stored as zlib-compressed
+    compact JSON; rows expire by TTL and the least recently used are evicted once
+    the database grows past max_bytes.
+    """
+
+    def __init__(self, path, max_bytes=512 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    expires_at REAL,
+                    accessed_at REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed_at)")
+            # Databases written before stale serving lack these columns
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(results)")}
+            for column in ('stale_until', 'stored_at'):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE results ADD COLUMN {column} REAL")
+
+    def _connect(self):
+        # One connection per thread, reopened after a fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        """Return (value, expires_at, stale_until, stored_at) for a fresh or stale row, or None"""
+        conn = self._connect()
+        encoded = _encode_key(key)
+        row = conn.execute(
+            "SELECT value, expires_at, stale_until, stored_at FROM results WHERE key = ?", (encoded,)
+        ).fetchone()
+
+        now = time.time()
+        fresh = row is not None and (row[1] is None or row[1] > now)
+        if row is None or (not fresh and (row[2] or row[1]) <= now):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        conn.execute(
+            "UPDATE results SET accessed_at = ?, hits = hits + 1 WHERE key = ?", (now, encoded)
+        )
+        with self._lock:
+            if fresh:
+                self.hits += 1
+            else:
+                self.stale_hits += 1
+        return json.loads(zlib.decompress(row[0])), row[1], row[2] or row[1], row[3] or now
+
+    def set(self, key, value, ttl=None, stale_ttl=0):
+        blob = zlib.compress(json.dumps(value, separators=(',', ':'), default=str).encode())
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        stale_until = expires_at + stale_ttl if expires_at is not None else None
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO results (key, value, size, expires_at, stale_until, stored_at, accessed_at, hits) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+            (_encode_key(key), blob, len(blob), expires_at, stale_until, now, now)
+        )
+
+        with self._lock:
+            self._writes += 1
+            check = self._writes % 100 == 0
+        if check:
+            self.evict()
+
+    def evict(self):
+        """Drop expired rows, then least recently used rows while over max_bytes"""
+        conn = self._connect()
+        conn.execute(
+            "DELETE FROM results WHERE expires_at IS NOT NULL AND COALESCE(stale_until, expires_at) <= ?",
+            (time.time(),)
+        )
+
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        # Trim to 90% so eviction does not run on every write near the cap
+        target = total - int(self.max_bytes * 0.9)
+        freed = 0
+        stale = []
+        for key, size in conn.execute("SELECT key, size FROM results ORDER BY accessed_at"):
+            stale.append((key,))
+            freed += size
+            if freed >= target:
+                break
+        conn.executemany("DELETE FROM results WHERE key = ?", stale)
+
+    def warm(self, memory_cache, limit=500):
+        """Load the most frequently hit live (fresh or stale) entries into a ResultCache"""
+        now = time.time()
+        rows = self._connect().execute(
+            "SELECT key, value, expires_at, stale_until, stored_at FROM results "
+            "WHERE expires_at IS NULL OR COALESCE(stale_until, expires_at) > ? "
+            "ORDER BY hits DESC, accessed_at DESC LIMIT ?",
+            (now, limit)
+        ).fetchall()
+
+        for key, blob, expires_at, stale_until, stored_at in rows:
+            ttl = expires_at - now if expires_at is not None else None
+            stale_ttl = (stale_until - expires_at) if stale_until is not None else 0
+            memory_cache.set(_decode_key(key), json.loads(zlib.decompress(blob)), ttl, stale_ttl, stored_at)
+        return len(rows)
+
+    def stats(self):
+        entries, total = self._connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results"
+        ).fetchone()
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                'path': self.path,
+                'entries': entries,
+                'bytes': total,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else 0,
+            }
+
+
+def disk_cache_from_env():
+    """Create the persistent cache tier from EE_DISK_CACHE_* environment variables, or None"""
+    if os.getenv('EE_DISK_CACHE_ENABLED', 'true').lower() == 'false':
+        return None
+    default_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache_data', 'results.sqlite3')
+    path = os.getenv('EE_DISK_CACHE_PATH', default_path)
+    max_mb = float(os.getenv('EE_DISK_CACHE_MAX_MB', 512))
+    return DiskCache(path, max_bytes=int(max_mb * 1024 * 1024))
@@ -0,0 +1,216 @@
+"""
+Dataset registry for the metric endpoints
+Each metric is declared once: the Earth Engine dataset its pixels come from,
+how a window of images is composited and scaled, and how the composite is
+reduced. The builders below turn a declaration into an Earth Engine graph, so
+the metric routes, /metrics, /batch, /timeseries and the rolling windows all
+share one definition per dataset.
+
+Between requests only the geometry and the date window change. Parts of a
+graph that depend on neither (reducers, static layers, filters) are built once
+per process, and date-filtered collections once per day, so a request only
+constructs the few nodes that bind the shared graph to its region.
+"""
+
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+import ee
+
+
+def date_window(days):
+    """Return (start, end) date strings covering the last `days` days"""
+    end_date = datetime.utcnow()
+    start_date = end_date - timedelta(days=days)
+    return start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')
+
+
+def ndvi_band(image):
+    """Sentinel-2 NDVI of one image"""
+    return image.normalizedDifference(['B8', 'B4']).rename('NDVI')
+
+
+# Reducer kind -> (builder, output names). The outputs map reduceRegions
+# properties back to the band-prefixed keys reduceRegion produces.
+REDUCERS = {
+    'mean': (lambda: ee.Reducer.mean(), ['mean']),
+    'max': (lambda: ee.Reducer.max(), ['max']),
+    'histogram': (lambda: ee.Reducer.frequencyHistogram(), ['histogram']),
+    'mean_min_max': (
+        lambda: ee.Reducer.mean().combine(ee.Reducer.minMax(), '', True),
+        ['mean', 'min', 'max']
+    ),
+    'mean_min_max_std': (
+        lambda: ee.Reducer.mean().combine(ee.Reducer.minMax(), '', True).combine(ee.Reducer.stdDev(), '', True),
+        ['mean', 'min', 'max', 'stdDev']
+    ),
+}
+
+# Metric name -> dataset declaration:
+#   dataset      Earth Engine asset ID (also keys DATASET_TTLS)
+#   static       'image' or 'first' for layers without a time dimension
+#   band         band the reduction reports on
+#   bands        bands to select before `prepare`, when it derives `band`
+#   prepare      per-image function applied before compositing
+#   max_cloud    CLOUDY_PIXEL_PERCENTAGE filter
+#   window_days  look-back window of the composite
+#   windows      look-back windows tried in order until one has imagery
+#   composite    ImageCollection method combining the window
+#   multiply/add scale factor and offset applied to the composite
+#   scale        native reduction scale in metres (see scale_policy.py)
+#   reducer      key into REDUCERS
+#   label        name used in error logs
+DATASETS = {
+    'ndvi': {
+        'dataset': 'COPERNICUS/S2_SR_HARMONIZED', 'band': 'NDVI', 'bands': ['B8', 'B4'], 'prepare': ndvi_band,
+        'max_cloud': 80, 'windows': [30, 90, 180, 365], 'composite': 'median',
+        'scale': 10, 'reducer': 'mean_min_max_std', 'label': 'NDVI calculation',
+    },
+    'landcover': {
+        'dataset': 'ESA/WorldCover/v200', 'static': 'first', 'band': 'Map',
+        'scale': 10, 'reducer': 'histogram', 'label': 'Land cover calculation',
+    },
+    'temperature': {
+        # Kelvin * 0.02; the scaling commutes with the median, so it is applied once to the composite
+        'dataset': 'MODIS/061/MOD11A1', 'band': 'LST_Day_1km',
+        'window_days': 30, 'composite': 'median', 'multiply': 0.02, 'add': -273.15,
+        'scale': 1000, 'reducer': 'mean_min_max', 'label': 'Temperature calculation',
+    },
+    'soil-moisture': {
+        'dataset': 'NASA/SMAP/SPL4SMGP/007', 'band': 'sm_surface',
+        'window_days': 30, 'composite': 'median',
+        'scale': 11000, 'reducer': 'mean_min_max', 'label': 'Soil moisture calculation',
+    },
+    'precipitation': {
+        'dataset': 'NASA/GPM_L3/IMERG_V06', 'band': 'precipitation',
+        'window_days': 30, 'composite': 'sum',
+        'scale': 11000, 'reducer': 'mean', 'label': 'Precipitation calculation',
+    },
+    'evapotranspiration': {
+        # MOD16A2 is an 8-day composite
+        'dataset': 'MODIS/061/MOD16A2GF', 'band': 'ET',
+        'window_days': 60, 'composite': 'median', 'multiply': 0.1,
+        'scale': 500, 'reducer': 'mean', 'label': 'Evapotranspiration calculation',
+    },
+    'surface-water': {
+        'dataset': 'JRC/GSW1_4/GlobalSurfaceWater', 'static': 'image', 'band': 'occurrence',
+        'scale': 30, 'reducer': 'mean', 'label': 'Surface water calculation',
+    },
+    'air-quality': {
+        'dataset': 'COPERNICUS/S5P/OFFL/L3_NO2', 'band': 'tropospheric_NO2_column_number_density',
+        'window_days': 7, 'composite': 'median',
+        'scale': 1113, 'reducer': 'mean', 'label': 'Air quality calculation',
+    },
+    'fire': {
+        # Per-pixel count of fire detections
+        'dataset': 'MODIS/061/MOD14A1', 'band': 'MaxFRP',
+        'window_days': 7, 'composite': 'count',
+        'scale': 1000, 'reducer': 'max', 'label': 'Fire detection',
+    },
+}
+
+
+@lru_cache(maxsize=None)
+def reducer(kind):
+    """The shared ee.Reducer for a REDUCERS kind"""
+    return REDUCERS[kind][0]()
+
+
+def outputs(name):
+    """Output names of a metric's reducer"""
+    return REDUCERS[DATASETS[name]['reducer']][1]
+
+
+@lru_cache(maxsize=None)
+def _cloud_filter(max_cloud):
+    return ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', max_cloud)
+
+
+@lru_cache(maxsize=None)
+def _static_image(name):
+    spec = DATASETS[name]
+    if spec['static'] == 'image':
+        return ee.Image(spec['dataset']).select(spec['band'])
+    return ee.ImageCollection(spec['dataset']).first().select(spec['band'])
+
+
+@lru_cache(maxsize=64)
+def _dated(dataset, start, end):
+    # Every request on the same day filters to the same window
+    return ee.ImageCollection(dataset).filterDate(start, end)
+
+
+def filtered(name, bounds, window=None, cloud_filtered=True):
+    """A metric's raw collection over `bounds`, limited to a (start, end) window if given"""
+    spec = DATASETS[name]
+    images = _dated(spec['dataset'], *window) if window else ee.ImageCollection(spec['dataset'])
+    images = images.filterBounds(bounds)
+    if cloud_filtered and 'max_cloud' in spec:
+        images = images.filter(_cloud_filter(spec['max_cloud']))
+    return images
+
+
+def prepared(name, images):
+    """Select a collection's bands and apply the per-image preparation"""
+    spec = DATASETS[name]
+    images = images.select(spec.get('bands', [spec['band']]))
+    return images.map(spec['prepare']) if 'prepare' in spec else images
+
+
+def composite(name, images, how=None):
+    """Composite a prepared collection (by `how`, default the metric's) and apply its scale factor"""
+    spec = DATASETS[name]
+    image = getattr(images, how or spec['composite'])()
+    if 'multiply' in spec:
+        image = image.multiply(spec['multiply'])
+    if 'add' in spec:
+        image = image.add(spec['add'])
+    return image
+
+
+def _fallback_source(name, bounds):
+    """Composite over the shortest of the metric's windows with cloud-filtered imagery"""
+    spec = DATASETS[name]
+    windows = spec['windows']
+
+    # Last resort: the longest window with no cloud filter
+    images = filtered(name, bounds, date_window(windows[-1]), cloud_filtered=False)
+    window = ee.Dictionary({'window_days': windows[-1], 'cloud_filtered': False})
+
+    # Fold the candidates from longest to shortest so the first non-empty window
+    # wins; ee.Algorithms.If only evaluates the branch it picks, so the whole
+    # selection happens server-side in the same request as the reduction
+    for days_back in reversed(windows):
+        candidate = filtered(name, bounds, date_window(days_back))
+        has_images = candidate.size().gt(0)
+        images = ee.ImageCollection(ee.Algorithms.If(has_images, candidate, images))
+        window = ee.Dictionary(ee.Algorithms.If(
+            has_images,
+            {'window_days': days_back, 'cloud_filtered': True},
+            window
+        ))
+
+    image_count = images.size()
+
+    # An empty collection has no bands to reduce, so substitute a fully masked image
+    empty = ee.Image.constant(0).rename(spec['band']).updateMask(0)
+    image = ee.Image(ee.Algorithms.If(image_count.gt(0), composite(name, prepared(name, images)), empty))
+
+    context = window.combine({
+        'image_count': image_count,
+        'cloud_cover': images.aggregate_mean('CLOUDY_PIXEL_PERCENTAGE')
+    })
+    return image, context
+
+
+def source(name, bounds):
+    """
+    The image a metric reduces, filtered to `bounds`, as (image, context), where
+    context is an optional ee.Dictionary of extra values the formatter needs
+    """
+    spec = DATASETS[name]
+    if 'static' in spec:
+        return _static_image(name), None
+    if 'windows' in spec:
+        return _fallback_source(name, bounds)
+    return composite(name, prepared(name, filtered(name, bounds, date_window(spec['window_days'])))), None
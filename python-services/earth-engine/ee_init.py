@@ -0,0 +1,108 @@
+"""
+Earth Engine initialization manager
+Initializes lazily in each worker process (after any fork), keeps the service
+account key in memory, and retries failed attempts with exponential backoff
+"""
+
+import os
+import json
+import time
+import random
+import threading
+import ee
+
+from instrumentation import get_logger
+
+log = get_logger()
+
+
+class EarthEngineInitializer:
+    """Per-process Earth Engine session that initializes on first use"""
+
+    def __init__(self, credentials_env='GOOGLE_EARTH_ENGINE_KEY', base_delay=1.0, max_delay=300.0):
+        self.credentials_env = credentials_env
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._reset()
+        # A forked child inherits the parent's state but not its connections
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self.state = 'uninitialized'
+        self.service_account = None
+        self.attempts = 0
+        self.failures = 0
+        self.last_error = None
+        self.init_latency_ms = None
+        self.initialized_at = None
+        self.next_retry_at = 0
+
+    @property
+    def initialized(self):
+        return self.state == 'initialized'
+
+    def ensure(self):
+        """Initialize if needed; returns False while failed and backing off"""
+        if self.state == 'initialized':
+            return True
+
+        with self._lock:
+            if self.state == 'initialized':
+                return True
+            if time.time() < self.next_retry_at:
+                return False
+            return self._initialize()
+
+    def warm_up(self):
+        """Start initialization in the background so the first request does not pay for it"""
+        threading.Thread(target=self.ensure, name='ee-init', daemon=True).start()
+
+    def _initialize(self):
+        self.attempts += 1
+        started = time.monotonic()
+        try:
+            # Load credentials from environment
+            credentials_json = os.getenv(self.credentials_env)
+            if not credentials_json:
+                raise RuntimeError(f'{self.credentials_env} not found in environment')
+
+            self.service_account = json.loads(credentials_json)['client_email']
+
+            # Initialize Earth Engine straight from the key, without a temp file
+            credentials = ee.ServiceAccountCredentials(self.service_account, key_data=credentials_json)
+            ee.Initialize(credentials)
+        except Exception as e:
+            self.failures += 1
+            self.state = 'failed'
+            self.last_error = str(e)
+            delay = min(self.max_delay, self.base_delay * 2 ** (self.failures - 1))
+            delay *= random.uniform(0.5, 1.0)
+            self.next_retry_at = time.time() + delay
+            log.error('Failed to initialize Earth Engine', extra={
+                'attempt': self.attempts,
+                'retry_in_s': round(delay, 1),
+                'error': str(e)
+            })
+            return False
+
+        self.state = 'initialized'
+        self.failures = 0
+        self.last_error = None
+        self.init_latency_ms = round((time.monotonic() - started) * 1000, 1)
+        self.initialized_at = time.time()
+        log.info('Earth Engine initialized', extra={
+            'service_account': self.service_account,
+            'init_latency_ms': self.init_latency_ms
+        })
+        return True
+
+    def status(self):
+        return {
+            'state': self.state,
+            'pid': os.getpid(),
+            'attempts': self.attempts,
+            'init_latency_ms': self.init_latency_ms,
+            'last_error': self.last_error,
+            'retry_in_s': round(max(0, self.next_retry_at - time.time()), 1) if self.state == 'failed' else None,
+        }
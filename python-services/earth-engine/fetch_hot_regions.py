@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Fetch local rasters for a hot region
+Downloads the pixels of the NDVI, land cover and surface water layers over a
+bounding box with computePixels, block by block, into memory-mapped arrays
+for RasterStore (see raster_store.py), so metric requests inside the box are
+reduced locally instead of by Earth Engine.
+
+Land cover and surface water are static; NDVI is the same composite the /ndvi
+route reduces and is only used while it is as fresh as a cached result would
+be, so rerun this (e.g. daily from cron) for regions that should keep it.
+
+Example:
+    python3 fetch_hot_regions.py --name seattle --bbox -122.45 47.48 -122.22 47.74
+"""
+
+import os
+import sys
+import json
+import math
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+import ee
+from dotenv import load_dotenv
+
+from raster_store import DEFAULT_RASTER_PATH, METADATA_FILE, METERS_PER_DEGREE, RASTER_LAYERS
+from ee_init import EarthEngineInitializer
+from datasets import DATASETS, source
+
+# Fill value for masked pixels of float layers while in transit (stored as NaN)
+FLOAT_NODATA = -9999
+
+# Largest raster fetched per layer, in pixels
+MAX_PIXELS = int(os.getenv('EE_RASTER_MAX_PIXELS', 4e8))
+
+
+def layer_expression(layer, bounds):
+    """The single-band image computePixels fetches for a layer, with masked pixels filled, and its context"""
+    spec = DATASETS[layer]
+    image, context = source(layer, bounds)
+    band = image.select([spec['band']])
+    if RASTER_LAYERS[layer]['dtype'] == 'uint8':
+        expression = band.unmask(RASTER_LAYERS[layer]['nodata']).toUint8()
+    else:
+        expression = band.toFloat().unmask(FLOAT_NODATA)
+    return expression, context
+
+
+def fetch_block(layer, expression, transform, row0, col0, height, width):
+    """Pixels of one block of the region's grid"""
+    west, north, dx, dy = transform
+    pixels = ee.data.computePixels({
+        'expression': expression,
+        'fileFormat': 'NUMPY_NDARRAY',
+        'grid': {
+            'dimensions': {'width': width, 'height': height},
+            'affineTransform': {
+                'scaleX': dx, 'shearX': 0, 'translateX': west + col0 * dx,
+                'shearY': 0, 'scaleY': -dy, 'translateY': north - row0 * dy,
+            },
+            'crsCode': 'EPSG:4326',
+        },
+    })
+    values = pixels[DATASETS[layer]['band']]
+    if RASTER_LAYERS[layer]['dtype'] != 'uint8':
+        values = values.astype(np.float32)
+        values[values == FLOAT_NODATA] = np.nan
+    return row0, col0, values
+
+
+def fetch_layer(layer, out_dir, region, bbox, block, concurrency):
+    spec = DATASETS[layer]
+    west, south, east, north = bbox
+    # Pixels of about the native scale in metres, at the region's mid latitude
+    dy = spec['scale'] / METERS_PER_DEGREE
+    dx = dy / max(math.cos(math.radians((south + north) / 2)), 0.01)
+    rows, cols = int(math.ceil((north - south) / dy)), int(math.ceil((east - west) / dx))
+    if rows * cols > MAX_PIXELS:
+        raise ValueError(f'{layer}: {rows}x{cols} pixels exceeds EE_RASTER_MAX_PIXELS ({MAX_PIXELS}); '
+                         f'use a smaller bbox')
+    transform = [west, north, dx, dy]
+
+    expression, context = layer_expression(layer, ee.Geometry.Rectangle(list(bbox), None, False))
+    filename = os.path.join(region, f'{layer}.npy')
+    # Written beside the current raster and swapped in when complete; workers
+    # that mapped the old file keep reading it until they reload
+    partial = os.path.join(out_dir, filename + '.partial')
+    values = np.lib.format.open_memmap(partial, mode='w+', dtype=RASTER_LAYERS[layer]['dtype'], shape=(rows, cols))
+
+    blocks = [(r, c) for r in range(0, rows, block) for c in range(0, cols, block)]
+    print(f"[INFO] {layer}: {rows}x{cols} pixels in {len(blocks)} blocks")
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [
+            pool.submit(fetch_block, layer, expression, transform, r, c, min(block, rows - r), min(block, cols - c))
+            for r, c in blocks
+        ]
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                r, c, pixels = future.result()
+                values[r:r + pixels.shape[0], c:c + pixels.shape[1]] = pixels
+            except Exception as e:
+                failed += 1
+                print(f"[ERROR] {layer} block failed: {e}")
+            if done % 10 == 0 or done == len(blocks):
+                print(f"[INFO] {layer}: {done}/{len(blocks)} blocks")
+
+    values.flush()
+    del values
+    if failed:
+        # A partial raster would give wrong statistics; leave the layer to Earth Engine
+        os.remove(partial)
+        raise RuntimeError(f'{layer}: {failed} of {len(blocks)} blocks failed')
+    os.replace(partial, os.path.join(out_dir, filename))
+
+    return {
+        'file': filename,
+        'band': spec['band'],
+        'reducer': spec['reducer'],
+        'scale': spec['scale'],
+        'transform': transform,
+        'rows': rows,
+        'cols': cols,
+        'nodata': RASTER_LAYERS[layer]['nodata'],
+        'context': context.getInfo() if context is not None else None,
+        'created': datetime.utcnow().isoformat(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--name', required=True, help='region name')
+    parser.add_argument('--bbox', nargs=4, type=float, required=True, metavar=('WEST', 'SOUTH', 'EAST', 'NORTH'))
+    parser.add_argument('--layers', default=','.join(RASTER_LAYERS), help='comma-separated layers to fetch')
+    parser.add_argument('--out', default=DEFAULT_RASTER_PATH, help='output directory')
+    parser.add_argument('--block', type=int, default=1024, help='pixels per side of each computePixels request')
+    parser.add_argument('--concurrency', type=int, default=4, help='parallel Earth Engine requests')
+    args = parser.parse_args()
+
+    west, south, east, north = args.bbox
+    if west >= east or south >= north:
+        parser.error('bbox must be WEST SOUTH EAST NORTH with WEST < EAST and SOUTH < NORTH')
+
+    layers = [name.strip() for name in args.layers.split(',') if name.strip()]
+    unknown = [name for name in layers if name not in RASTER_LAYERS]
+    if unknown:
+        parser.error(f"unknown layers: {', '.join(unknown)}")
+
+    load_dotenv()
+    if not EarthEngineInitializer().ensure():
+        print("[ERROR] Earth Engine not initialized")
+        return 1
+
+    os.makedirs(os.path.join(args.out, args.name), exist_ok=True)
+    metadata_path = os.path.join(args.out, METADATA_FILE)
+    metadata = {'regions': {}}
+    if os.path.exists(metadata_path):
+        with open(metadata_path) as f:
+            metadata = json.load(f)
+
+    # Refetching a region keeps its other layers if the bbox matches
+    region = metadata['regions'].get(args.name)
+    if region is None or region['bbox'] != args.bbox:
+        region = {'bbox': args.bbox, 'layers': {}}
+    metadata['regions'][args.name] = region
+
+    status = 0
+    for layer in layers:
+        try:
+            region['layers'][layer] = fetch_layer(layer, args.out, args.name, args.bbox, args.block, args.concurrency)
+        except Exception as e:
+            # Any previous raster of the layer stays in place
+            print(f"[ERROR] {e}")
+            status = 1
+        # Written after every layer; running workers reload it within RELOAD_INTERVAL
+        with open(metadata_path + '.tmp', 'w') as f:
+            json.dump(metadata, f, indent=2)
+        os.replace(metadata_path + '.tmp', metadata_path)
+
+    print(f"[SUCCESS] Rasters for {args.name} written to {args.out}" if status == 0 else
+          f"[ERROR] Some layers of {args.name} could not be fetched")
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
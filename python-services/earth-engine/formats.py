@@ -0,0 +1,303 @@
+"""
+Response formats and compression
+Routes answer in the format named by ?format= or, failing that, the best
+match in the Accept header; JSON stays the default:
+
+    json      application/json (NDJSON, application/x-ndjson, for streams)
+    msgpack   application/msgpack, the same objects in a compact binary
+              encoding; streams are a sequence of concatenated objects
+    npy       application/x-npy, a NumPy structured array with one row per
+              location or time step (np.load reads it)
+    arrow     application/vnd.apache.arrow.stream, the same table as an Arrow
+              IPC stream, with any series metadata in the schema metadata;
+              only offered when pyarrow is installed
+
+Columnar formats flatten nested objects into dotted column names
+("scores.overall"), store lists as JSON strings, and fill gaps with NaN or ""
+(nulls in Arrow). Streamed routes collect every row before sending a table.
+Errors are always JSON.
+
+Responses of at least COMPRESS_MIN_BYTES are compressed with brotli or gzip,
+whichever the client accepts (brotli first); streams are flushed chunk by
+chunk so progress still arrives as it is produced.
+"""
+
+import io
+import os
+import re
+import json
+import zlib
+
+import brotli
+import msgpack
+import numpy as np
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+FORMATS = {
+    'json': 'application/json',
+    'msgpack': 'application/msgpack',
+    'npy': 'application/x-npy',
+    'arrow': 'application/vnd.apache.arrow.stream',
+}
+STREAM_TYPES = {**FORMATS, 'json': 'application/x-ndjson'}
+ALIASES = {'application/x-msgpack': 'msgpack', 'application/vnd.msgpack': 'msgpack', 'application/x-ndjson': 'json'}
+COLUMNAR = ('npy', 'arrow')
+
+COMPRESS_MIN_BYTES = int(os.getenv('EE_COMPRESS_MIN_BYTES', 1024))
+GZIP_LEVEL = int(os.getenv('EE_GZIP_LEVEL', 6))
+# Brotli's default quality (11) is far too slow for responses built per request
+BROTLI_QUALITY = int(os.getenv('EE_BROTLI_QUALITY', 5))
+# Media types that are already compact or compressed
+INCOMPRESSIBLE = re.compile(r'^(image|video|audio)/|zip|gzip|brotli')
+
+DATE = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+
+class NotAcceptable(Exception):
+    """No format the client accepts can be produced; answered with 406"""
+
+    def __init__(self, message):
+        super().__init__(message)
+        self.available = available()
+
+
+def available():
+    return [name for name in FORMATS if name != 'arrow' or pa is not None]
+
+
+def _accepted(header):
+    """(media type, q) pairs of an Accept or Accept-Encoding header, most preferred first"""
+    entries = []
+    for i, part in enumerate((header or '').split(',')):
+        value, *params = [p.strip() for p in part.split(';')]
+        if not value:
+            continue
+        q = 1.0
+        for param in params:
+            if param.startswith('q='):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        # Stable sort: equal weights keep the client's order
+        entries.append((-q, i, value.lower(), q))
+    return [(value, q) for _, _, value, q in sorted(entries)]
+
+
+def negotiate(accept, requested=None):
+    """
+    Format name for a request's Accept header and ?format= param, raising
+    NotAcceptable for an unknown or unavailable format. An Accept header with
+    nothing this service produces gets JSON, as browsers and curl expect.
+    """
+    if requested:
+        name = requested.lower()
+        if name not in FORMATS:
+            raise NotAcceptable(f"format must be one of: {', '.join(available())}")
+        if name not in available():
+            raise NotAcceptable(f'{name} responses are not available on this server')
+        return name
+
+    for media_type, q in _accepted(accept):
+        if q <= 0:
+            continue
+        if media_type in ('*/*', 'application/*'):
+            return 'json'
+        name = ALIASES.get(media_type) or next((n for n, t in FORMATS.items() if t == media_type), None)
+        if name in available():
+            return name
+    return 'json'
+
+
+def content_type(fmt, stream=False):
+    return (STREAM_TYPES if stream else FORMATS)[fmt]
+
+
+def _flatten(value, prefix, row):
+    for key, item in value.items():
+        name = f'{prefix}{key}'
+        if isinstance(item, dict):
+            _flatten(item, f'{name}.', row)
+        elif isinstance(item, (list, tuple)):
+            row[name] = json.dumps(item, separators=(',', ':'), default=str)
+        else:
+            row[name] = item
+    return row
+
+
+def _column(values):
+    """(kind, values) of a column: bool, int, float, date or str"""
+    present = [v for v in values if v is not None]
+    if present and all(isinstance(v, bool) for v in present):
+        return ('bool', values) if len(present) == len(values) else ('float', values)
+    if present and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in present):
+        whole = len(present) == len(values) and all(isinstance(v, int) for v in present)
+        return ('int' if whole else 'float'), values
+    if present and all(isinstance(v, str) and DATE.match(v) for v in present):
+        return 'date', values
+    return 'str', [None if v is None else v if isinstance(v, str) else str(v) for v in values]
+
+
+def table(data, rows=None):
+    """
+    (columns as {name: (kind, values)}, metadata) for a columnar response:
+    the given rows, a time series' points with the rest of the result as
+    metadata, or the result itself as a single row
+    """
+    metadata = None
+    if rows is None:
+        if isinstance(data.get('points'), list):
+            rows = data['points']
+            metadata = {k: v for k, v in data.items() if k != 'points'}
+        else:
+            rows = [data]
+
+    flat = [_flatten(row, '', {}) for row in rows]
+    names = list(dict.fromkeys(name for row in flat for name in row))
+    return {name: _column([row.get(name) for row in flat]) for name in names}, metadata
+
+
+def _npy_array(kind, values):
+    if kind == 'bool':
+        return np.array(values, dtype=bool)
+    if kind == 'int':
+        return np.array(values, dtype=np.int64)
+    if kind == 'float':
+        return np.array([np.nan if v is None else float(v) for v in values], dtype=np.float64)
+    if kind == 'date':
+        return np.array(['NaT' if v is None else v for v in values], dtype='datetime64[D]')
+    return np.array(['' if v is None else v for v in values], dtype=str)
+
+
+def encode_npy(columns):
+    arrays = {name: _npy_array(kind, values) for name, (kind, values) in columns.items()}
+    length = len(next(iter(arrays.values()))) if arrays else 0
+    records = np.empty(length, dtype=[(name, array.dtype) for name, array in arrays.items()])
+    for name, array in arrays.items():
+        records[name] = array
+    buffer = io.BytesIO()
+    np.save(buffer, records, allow_pickle=False)
+    return buffer.getvalue()
+
+
+ARROW_TYPES = {'bool': 'bool_', 'int': 'int64', 'float': 'float64', 'date': 'date32', 'str': 'string'}
+
+
+def encode_arrow(columns, metadata=None):
+    arrays, names = [], []
+    for name, (kind, values) in columns.items():
+        if kind == 'date':
+            values = [None if v is None else np.datetime64(v, 'D').item() for v in values]
+        arrays.append(pa.array(values, type=getattr(pa, ARROW_TYPES[kind])()))
+        names.append(name)
+    batch = pa.RecordBatch.from_arrays(arrays, names=names)
+    if metadata is not None:
+        batch = batch.replace_schema_metadata({'metadata': json.dumps(metadata, default=str)})
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+def encode_msgpack(data):
+    return msgpack.packb(data, use_bin_type=True, default=str)
+
+
+def encode(data, fmt, rows=None):
+    """Body of a non-JSON response (see table for which rows columnar formats use)"""
+    if fmt == 'msgpack':
+        return encode_msgpack(data)
+    columns, metadata = table(data, rows)
+    return encode_npy(columns) if fmt == 'npy' else encode_arrow(columns, metadata)
+
+
+def encode_item(item, fmt):
+    """One object of a streamed response: an NDJSON line or a msgpack object"""
+    if fmt == 'msgpack':
+        return encode_msgpack(item)
+    return json.dumps(item) + '\n'
+
+
+def encode_stream(items, fmt):
+    """Encode the objects of a streamed response as they come, or as one table at the end"""
+    if fmt in COLUMNAR:
+        rows = list(items)
+        yield encode({}, fmt, rows)
+        return
+    for item in items:
+        yield encode_item(item, fmt)
+
+
+async def encode_async_stream(items, fmt):
+    """encode_stream for an async iterable"""
+    if fmt in COLUMNAR:
+        rows = [item async for item in items]
+        yield encode({}, fmt, rows)
+        return
+    async for item in items:
+        yield encode_item(item, fmt)
+
+
+def choose_encoding(accept_encoding):
+    """'br', 'gzip' or None for a request's Accept-Encoding header"""
+    weights = dict(_accepted(accept_encoding))
+    wildcard = weights.get('*', 0)
+    for encoding in ('br', 'gzip'):
+        if weights.get(encoding, wildcard) > 0:
+            return encoding
+    return None
+
+
+def compressible(media_type, encoded):
+    """Whether a response of this media type may be compressed; `encoded` is its existing Content-Encoding"""
+    return not encoded and not (media_type and INCOMPRESSIBLE.search(media_type))
+
+
+class Compressor:
+    """Incremental brotli or gzip compression; every chunk is flushed so it can be sent at once"""
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._brotli = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._zlib = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, chunk):
+        if self.encoding == 'br':
+            return self._brotli.process(chunk) + self._brotli.flush()
+        return self._zlib.compress(chunk) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.encoding == 'br':
+            return self._brotli.finish()
+        return self._zlib.flush()
+
+
+def compress(body, encoding):
+    """Compress a whole response body"""
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(body) + compressor.flush()
+
+
+def compress_chunks(chunks, encoding):
+    """Compress a streamed body, one flushed block per chunk"""
+    compressor = Compressor(encoding)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            if chunk:
+                yield compressor.compress(chunk)
+        yield compressor.finish()
+    finally:
+        # Let the wrapped stream clean up (e.g. cancel pending batch chunks) if the client goes away
+        if hasattr(chunks, 'close'):
+            chunks.close()
@@ -0,0 +1,177 @@
+"""
+GeoJSON areas of interest
+Metric routes accept a GeoJSON Polygon or MultiPolygon (bare, as a Feature, or
+as {"geometry": ...}) in place of lat/lon/radius. Areas are validated here and
+simplified before they are sent to Earth Engine: vertices that deviate from
+the simplified outline by less than half a reduction pixel cannot change the
+result noticeably, but every one of them is serialized and evaluated.
+
+The hash of the (unsimplified) coordinates keys cached results, while the
+centroid stands in for lat/lon where a single location is needed and the
+radius of the circle of equal area drives the scale policy.
+"""
+
+import os
+import json
+import math
+import hashlib
+
+import numpy as np
+import ee
+
+# Largest area accepted, in vertices over all rings
+MAX_VERTICES = int(os.getenv('EE_MAX_VERTICES', 50000))
+
+# Simplification tolerance as a fraction of the reduction scale
+SIMPLIFY_FRACTION = 0.5
+
+# Metres per degree of latitude, and of longitude at the equator
+METERS_PER_DEGREE = 111320.0
+
+
+def _ring(ring, where):
+    """Validate a linear ring, returning it as an (n, 2) array of lon/lat"""
+    if not isinstance(ring, list) or len(ring) < 4:
+        raise ValueError(f'{where} must be a closed ring of at least 4 positions')
+    try:
+        coords = np.array([position[:2] for position in ring], dtype=float)
+    except (TypeError, ValueError, IndexError):
+        raise ValueError(f'{where} must contain [lon, lat] positions')
+    if coords.shape != (len(ring), 2) or not np.isfinite(coords).all():
+        raise ValueError(f'{where} must contain [lon, lat] positions')
+    if not ((-180 <= coords[:, 0]).all() and (coords[:, 0] <= 180).all()
+            and (-90 <= coords[:, 1]).all() and (coords[:, 1] <= 90).all()):
+        raise ValueError(f'{where} has positions outside lon -180..180, lat -90..90')
+    if not (coords[0] == coords[-1]).all():
+        raise ValueError(f'{where} is not closed (first and last positions differ)')
+    return coords
+
+
+def _polygon(rings, where):
+    if not isinstance(rings, list) or not rings:
+        raise ValueError(f'{where} must be a list of rings')
+    return [_ring(ring, f'{where} ring {i}') for i, ring in enumerate(rings)]
+
+
+def parse_area(payload):
+    """Validate a GeoJSON Polygon/MultiPolygon request body, raising ValueError if it is not one"""
+    if isinstance(payload, dict) and payload.get('type') == 'Feature':
+        payload = payload.get('geometry')
+    elif isinstance(payload, dict) and 'geometry' in payload:
+        payload = payload['geometry']
+    if not isinstance(payload, dict):
+        raise ValueError('Expected a GeoJSON Polygon or MultiPolygon')
+
+    kind, coordinates = payload.get('type'), payload.get('coordinates')
+    if kind == 'Polygon':
+        polygons = [_polygon(coordinates, 'Polygon')]
+    elif kind == 'MultiPolygon':
+        if not isinstance(coordinates, list) or not coordinates:
+            raise ValueError('MultiPolygon must be a list of polygons')
+        polygons = [_polygon(rings, f'Polygon {i}') for i, rings in enumerate(coordinates)]
+    else:
+        raise ValueError('Expected a GeoJSON Polygon or MultiPolygon')
+
+    vertices = sum(len(ring) for rings in polygons for ring in rings)
+    if vertices > MAX_VERTICES:
+        raise ValueError(f'At most {MAX_VERTICES} vertices per area')
+    return Area(polygons)
+
+
+def _simplify(points, tolerance):
+    """Douglas-Peucker: mask of the points of a projected polyline to keep"""
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        start, end = points[first], points[last]
+        inner = points[first + 1:last]
+        segment = end - start
+        length = np.hypot(*segment)
+        if length == 0:
+            # A closed ring starts and ends on the same point
+            distances = np.hypot(*(inner - start).T)
+        else:
+            offsets = inner - start
+            distances = np.abs(segment[0] * offsets[:, 1] - segment[1] * offsets[:, 0]) / length
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            index = first + 1 + farthest
+            keep[index] = True
+            stack.extend([(first, index), (index, last)])
+    return keep
+
+
+class Area:
+    """A validated area of interest: a list of polygons, each a list of (n, 2) lon/lat rings"""
+
+    def __init__(self, polygons):
+        self.polygons = polygons
+        self.vertices = sum(len(ring) for rings in polygons for ring in rings)
+
+        # Coordinates rounded to ~1 cm, so re-serialized copies of a shape share a key
+        canonical = [[np.round(ring, 7).tolist() for ring in rings] for rings in polygons]
+        self.hash = hashlib.sha256(json.dumps(canonical, separators=(',', ':')).encode()).hexdigest()[:16]
+
+        # Project onto a local plane in metres around the bounding box centre
+        points = np.concatenate([ring for rings in polygons for ring in rings])
+        west, south = points.min(axis=0)
+        east, north = points.max(axis=0)
+        self.bounds = (float(west), float(south), float(east), float(north))
+        self._origin = (points.min(axis=0) + points.max(axis=0)) / 2
+        self._factor = np.array([METERS_PER_DEGREE * math.cos(math.radians(self._origin[1])), METERS_PER_DEGREE])
+
+        # Area and area-weighted centroid from the shoelace formula; holes subtract
+        total, moment = 0.0, np.zeros(2)
+        for rings in polygons:
+            for i, ring in enumerate(rings):
+                xy = self._project(ring)
+                cross = xy[:-1, 0] * xy[1:, 1] - xy[1:, 0] * xy[:-1, 1]
+                signed = abs(cross.sum()) / 2 * (1 if i == 0 else -1)
+                centre = ((xy[:-1] + xy[1:]) * cross[:, None]).sum(axis=0) / (3 * cross.sum()) \
+                    if cross.sum() else xy.mean(axis=0)
+                total += signed
+                moment += centre * signed
+        self.area_m2 = max(total, 0.0)
+        lon, lat = self._unproject(moment / total if total > 0 else np.zeros(2))
+        self.centroid = (float(lat), float(lon))
+        # Radius of the circle with the same area, for the scale policy
+        self.radius_m = math.sqrt(self.area_m2 / math.pi)
+
+    def _project(self, ring):
+        return (ring - self._origin) * self._factor
+
+    def _unproject(self, xy):
+        return xy / self._factor + self._origin
+
+    def simplified(self, tolerance_m):
+        """Polygon coordinates with vertices within `tolerance_m` of the outline dropped"""
+        polygons = []
+        for rings in self.polygons:
+            kept = []
+            for ring in rings:
+                keep = _simplify(self._project(ring), tolerance_m)
+                # A ring thinner than the tolerance would collapse; keep it as is
+                kept.append((ring[keep] if keep.sum() >= 4 else ring).tolist())
+            polygons.append(kept)
+        return polygons
+
+    def region(self, scale):
+        """The area as an ee.Geometry, simplified for a reduction at `scale` metres"""
+        polygons = self.simplified(scale * SIMPLIFY_FRACTION)
+        # GeoJSON edges are straight lines in lon/lat
+        if len(polygons) == 1:
+            return ee.Geometry.Polygon(polygons[0], None, False)
+        return ee.Geometry.MultiPolygon(polygons, None, False)
+
+    def describe(self):
+        """Summary for responses, in place of the lat/lon coordinates"""
+        return {
+            'centroid': {'lat': self.centroid[0], 'lon': self.centroid[1]},
+            'area_km2': round(float(self.area_m2) / 1e6, 4),
+            'vertices': self.vertices,
+            'geometry_hash': self.hash,
+        }
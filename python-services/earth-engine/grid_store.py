@@ -0,0 +1,147 @@
+"""
+Precomputed metric grid for static and slow-changing layers
+Per-cell partial statistics (sums, counts, class histograms) are stored as
+memory-mapped NumPy arrays, so any circle covering enough cells can be answered
+locally by adding the partials of the cells whose centres fall inside it.
+Grids are produced by precompute_grid.py.
+"""
+
+import os
+import json
+import math
+from datetime import datetime
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+
+# WorldCover class ids stored as histogram channels, in this order
+LANDCOVER_CLASS_IDS = [10, 20, 30, 40, 50, 60, 70, 80, 90, 95, 100]
+
+# Layer name (a metric in datasets.py, which sets its scale) -> per-cell channels stored for it
+GRID_LAYERS = {
+    'surface-water': {'channels': ['sum', 'count']},
+    'landcover': {'channels': [str(c) for c in LANDCOVER_CLASS_IDS]},
+    'ndvi': {'channels': ['sum', 'sum_sq', 'count', 'min', 'max']},
+}
+
+METADATA_FILE = 'grid.json'
+DEFAULT_GRID_PATH = os.getenv('EE_GRID_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'grid_data'))
+
+
+class GridStore:
+    """Read-only view over a precomputed grid directory"""
+
+    def __init__(self, path, metadata):
+        self.path = path
+        self.metadata = metadata
+        self.west, self.south, self.east, self.north = metadata['bbox']
+        self.resolution = metadata['resolution']
+        self.rows = metadata['rows']
+        self.cols = metadata['cols']
+        # A circle must span this many cells for the cell approximation to be used
+        self.min_cells = float(os.getenv('EE_GRID_MIN_CELLS', 3))
+        self._arrays = {}
+
+    @classmethod
+    def open(cls, path):
+        """Open a grid directory, or return None if there is no grid there"""
+        metadata_path = os.path.join(path, METADATA_FILE)
+        if not os.path.exists(metadata_path):
+            return None
+        with open(metadata_path) as f:
+            return cls(path, json.load(f))
+
+    @property
+    def layers(self):
+        return list(self.metadata.get('layers', {}))
+
+    def layer_info(self, layer):
+        return self.metadata['layers'][layer]
+
+    def array(self, layer):
+        if layer not in self._arrays:
+            filename = self.metadata['layers'][layer]['file']
+            self._arrays[layer] = np.load(os.path.join(self.path, filename), mmap_mode='r')
+        return self._arrays[layer]
+
+    def cell_mask(self, lat, lon, radius_km):
+        """
+        Return (row slice, col slice, boolean mask) of cells whose centres lie
+        within the circle, or None if the grid cannot answer for it.
+        """
+        lat_deg = math.degrees(radius_km / EARTH_RADIUS_KM)
+        lon_deg = lat_deg / max(math.cos(math.radians(lat)), 1e-6)
+
+        # The whole circle must be inside the grid
+        if (lat - lat_deg < self.south or lat + lat_deg > self.north or
+                lon - lon_deg < self.west or lon + lon_deg > self.east):
+            return None
+        # ...and wide enough that cell boundaries are a small error
+        if 2 * lat_deg < self.min_cells * self.resolution:
+            return None
+
+        row0 = max(0, int((self.north - (lat + lat_deg)) / self.resolution))
+        row1 = min(self.rows, int(math.ceil((self.north - (lat - lat_deg)) / self.resolution)))
+        col0 = max(0, int((lon - lon_deg - self.west) / self.resolution))
+        col1 = min(self.cols, int(math.ceil((lon + lon_deg - self.west) / self.resolution)))
+
+        centre_lats = self.north - (np.arange(row0, row1) + 0.5) * self.resolution
+        centre_lons = self.west + (np.arange(col0, col1) + 0.5) * self.resolution
+        dlat = np.radians(centre_lats - lat)[:, None]
+        dlon = np.radians(centre_lons - lon)[None, :]
+
+        # Haversine distance from the query point to every candidate cell centre
+        a = np.sin(dlat / 2) ** 2 + \
+            np.cos(math.radians(lat)) * np.cos(np.radians(centre_lats))[:, None] * np.sin(dlon / 2) ** 2
+        distance = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+        mask = distance <= radius_km
+        if not mask.any():
+            return None
+        return slice(row0, row1), slice(col0, col1), mask
+
+    def stats(self, layer, lat, lon, radius_km, max_age=None):
+        """
+        Combine the cells inside the circle into reduceRegion-style statistics
+        (the same keys the live Earth Engine reduction returns), or None,
+        including when the layer was computed more than max_age seconds ago.
+        """
+        info = self.metadata.get('layers', {}).get(layer)
+        if info is None:
+            return None
+        if max_age is not None and (datetime.utcnow() - datetime.fromisoformat(info['created'])).total_seconds() > max_age:
+            return None
+
+        selection = self.cell_mask(lat, lon, radius_km)
+        if selection is None:
+            return None
+
+        rows, cols, mask = selection
+        cells = np.asarray(self.array(layer)[rows, cols])[mask]  # (n_cells, channels)
+
+        if layer == 'surface-water':
+            total, count = np.nansum(cells[:, 0]), np.nansum(cells[:, 1])
+            return {'occurrence': float(total / count) if count > 0 else None}
+
+        if layer == 'landcover':
+            counts = np.nansum(cells, axis=0)
+            return {'Map': {
+                str(class_id): float(count)
+                for class_id, count in zip(LANDCOVER_CLASS_IDS, counts) if count > 0
+            }}
+
+        if layer == 'ndvi':
+            total, total_sq, count = (np.nansum(cells[:, i]) for i in range(3))
+            if count <= 0:
+                return {}
+            mean = total / count
+            variance = max(0.0, total_sq / count - mean ** 2)
+            return {
+                'NDVI_mean': float(mean),
+                'NDVI_min': float(np.nanmin(cells[:, 3])),
+                'NDVI_max': float(np.nanmax(cells[:, 4])),
+                'NDVI_stdDev': float(math.sqrt(variance)),
+            }
+
+        return None
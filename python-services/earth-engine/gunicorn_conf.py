@@ -0,0 +1,43 @@
+"""
+Gunicorn configuration for the Earth Engine service
+Requests spend almost all of their time blocked on getInfo(), so each worker
+process runs many threads instead of the Flask debug server's single thread
+"""
+
+import os
+import multiprocessing
+
+bind = f"0.0.0.0:{os.getenv('PORT', 5001)}"
+
+# gthread by default; set GUNICORN_WORKER_CLASS=gevent if gevent is installed
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.getenv('GUNICORN_WORKERS', min(multiprocessing.cpu_count(), 4)))
+threads = int(os.getenv('GUNICORN_THREADS', 32))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 256))  # gevent only
+
+# Earth Engine quotas are per project; each worker's scheduler takes an equal share
+os.environ.setdefault('EE_SCHEDULER_SHARES', str(workers))
+
+# Earth Engine aborts interactive computations after about five minutes,
+# so give a request slightly longer than that before the worker is recycled
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 310))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+
+# Load app.py (and the ee client library) once in the master before forking
+preload_app = True
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+
+def post_fork(server, worker):
+    """
+    Start each worker's own Earth Engine session without blocking its first
+    request, and its job queue workers (threads do not survive the fork)
+    """
+    import app
+    app.EE.warm_up()
+    if app.JOBS is not None:
+        app.JOBS.start()
@@ -0,0 +1,254 @@
+"""
+Instrumentation for the Earth Engine service
+Per-route and per-dataset latency histograms, getInfo() call and error counts
+exported in Prometheus text format, plus structured JSON logging. Work done off
+the request path (queued jobs, background refreshes) is timed separately, so it
+does not skew HTTP latency.
+Metrics are kept per process, so each gunicorn worker reports its own series.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import threading
+import contextvars
+
+from scheduler import SCHEDULER
+
+# Seconds; Earth Engine calls range from tens of milliseconds to minutes
+DEFAULT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 100)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + list(extra or [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labels, key)} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    labels = _format_labels(self.labels, key, [('le', f'{bound:g}')])
+                    lines.append(f'{self.name}_bucket{labels} {count}')
+                labels = _format_labels(self.labels, key, [('le', '+Inf')])
+                lines.append(f'{self.name}_bucket{labels} {series[-1]}')
+                lines.append(f'{self.name}_sum{_format_labels(self.labels, key)} {series[-2]:.6f}')
+                lines.append(f'{self.name}_count{_format_labels(self.labels, key)} {series[-1]}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._gauges = []
+
+    def counter(self, name, help_text, labels=()):
+        metric = Counter(name, help_text, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help_text, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name, help_text, labels, collect):
+        """Register a gauge read at scrape time; collect() returns {label values: value}"""
+        self._gauges.append((name, help_text, tuple(labels), collect))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for name, help_text, labels, collect in self._gauges:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} gauge')
+            for key, value in sorted(collect().items()):
+                lines.append(f'{name}{_format_labels(labels, key)} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+HTTP_LATENCY = REGISTRY.histogram(
+    'ee_service_request_duration_seconds', 'HTTP request latency by route', ['route', 'status'])
+REQUEST_EE_SECONDS = REGISTRY.histogram(
+    'ee_service_request_ee_seconds', 'Time each request spent waiting on Earth Engine', ['route'])
+REQUEST_EE_CALLS = REGISTRY.histogram(
+    'ee_service_request_getinfo_calls', 'getInfo() calls made per request', ['route'], COUNT_BUCKETS)
+TASK_LATENCY = REGISTRY.histogram(
+    'ee_service_task_duration_seconds', 'Queued job and background refresh duration by task', ['task', 'status'])
+TASK_EE_SECONDS = REGISTRY.histogram(
+    'ee_service_task_ee_seconds', 'Time each job or background refresh spent waiting on Earth Engine', ['task'])
+EE_LATENCY = REGISTRY.histogram(
+    'ee_getinfo_duration_seconds', 'Earth Engine getInfo() latency', ['route', 'dataset'])
+EE_ERRORS = REGISTRY.counter(
+    'ee_getinfo_errors_total', 'Earth Engine getInfo() failures', ['route', 'dataset'])
+
+
+class RequestStats:
+    """Earth Engine usage accumulated over one request, across worker threads"""
+
+    def __init__(self, route):
+        self.route = route
+        self.started = time.perf_counter()
+        self.ee_calls = 0
+        self.ee_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, elapsed):
+        with self._lock:
+            self.ee_calls += 1
+            self.ee_seconds += elapsed
+
+
+_current_request = contextvars.ContextVar('ee_request_stats', default=None)
+
+
+def begin_request(route):
+    stats = RequestStats(route)
+    _current_request.set(stats)
+    return stats
+
+
+def current_request():
+    return _current_request.get()
+
+
+def end_request(stats, status):
+    """Record a finished request and return its duration in seconds"""
+    duration = time.perf_counter() - stats.started
+    HTTP_LATENCY.observe(duration, route=stats.route, status=status)
+    REQUEST_EE_SECONDS.observe(stats.ee_seconds, route=stats.route)
+    REQUEST_EE_CALLS.observe(stats.ee_calls, route=stats.route)
+    return duration
+
+
+def begin_task(task):
+    """Start timing a job or background refresh; its getInfo() calls are labelled with `task` as the route"""
+    return begin_request(task)
+
+
+def end_task(stats, status):
+    """Record a finished job or refresh in the task histograms and return its duration in seconds"""
+    duration = time.perf_counter() - stats.started
+    TASK_LATENCY.observe(duration, task=stats.route, status=status)
+    TASK_EE_SECONDS.observe(stats.ee_seconds, task=stats.route)
+    return duration
+
+
+def submit(executor, fn, *args, **kwargs):
+    """executor.submit() that carries the current request's stats into the worker thread"""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def get_info(obj, dataset):
+    """
+    Evaluate an Earth Engine object through the scheduler (see scheduler.py),
+    recording latency, call and error counts for every attempt
+    """
+    stats = _current_request.get()
+    route = stats.route if stats is not None else 'background'
+
+    def evaluate():
+        started = time.perf_counter()
+        try:
+            return obj.getInfo()
+        except Exception:
+            EE_ERRORS.inc(route=route, dataset=dataset)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            EE_LATENCY.observe(elapsed, route=route, dataset=dataset)
+            if stats is not None:
+                stats.record(elapsed)
+
+    return SCHEDULER.call(evaluate)
+
+
+# Attributes every LogRecord has; anything else was passed via `extra`
+_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'pid': record.process,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and not key.startswith('_'):
+                entry[key] = value
+        stats = _current_request.get()
+        if stats is not None and 'route' not in entry:
+            entry['route'] = stats.route
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def get_logger(name='earth-engine'):
+    """Logger writing one JSON object per line to stdout"""
+    logger = logging.getLogger(name)
+    if not logger.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(JsonFormatter())
+        logger.addHandler(handler)
+        logger.setLevel(os.getenv('EE_LOG_LEVEL', 'INFO').upper())
+        logger.propagate = False
+    return logger
@@ -0,0 +1,307 @@
+"""
+Local job queue for long-running requests
+Assessments and large-area reductions can take longer than a client is
+willing to hold a connection open. With ?async=true they are stored as jobs in
+a SQLite table (WAL mode, like the disk cache) and answered at once with a job
+ID; a small pool of worker threads in each process claims and runs them, and
+/jobs/<id> reports status and, once done, the result.
+
+The number of workers bounds the Earth Engine load jobs can generate. Workers
+take the highest priority first and, within a priority, the client with the
+fewest running jobs, then the one served least recently, so one client's
+backlog cannot starve the others.
+"""
+
+import os
+import json
+import time
+import uuid
+import zlib
+import sqlite3
+import threading
+from datetime import datetime
+
+from instrumentation import begin_task, end_task, get_logger
+from scheduler import set_priority
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+PRIORITIES = {'high': 0, 'normal': 1, 'low': 2}
+STATUSES = ('queued', 'running', 'done', 'failed')
+
+# Seconds an idle worker waits before looking for jobs submitted by other processes,
+# and between purges of expired jobs
+POLL_INTERVAL = 1.0
+PURGE_INTERVAL = 60.0
+
+log = get_logger()
+
+
+class QueueFull(Exception):
+    """A client already has as many pending jobs as it may"""
+
+
+def parse_priority(value, default='normal'):
+    """Validate a priority name, raising ValueError for unknown ones"""
+    value = value or default
+    if value not in PRIORITIES:
+        raise ValueError(f"priority must be one of: {', '.join(PRIORITIES)}")
+    return value
+
+
+def _timestamp(value):
+    return datetime.utcfromtimestamp(value).isoformat() if value is not None else None
+
+
+class JobQueue:
+    """
+    SQLite-backed job queue shared by all worker processes. Handlers are
+    registered per job kind and called as handler(params) in a worker thread,
+    returning a JSON-serializable result.
+    """
+
+    def __init__(self, path, workers=4, retention=DAY, timeout=900, max_pending=20):
+        self.path = path
+        self.workers = workers
+        self.retention = retention
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self._handlers = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._started_pid = None
+        self._purged_at = 0.0
+        self.completed = 0
+        self.failed = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    client TEXT NOT NULL,
+                    priority INTEGER NOT NULL,
+                    params TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    result BLOB,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_queued ON jobs (status, priority, created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_client ON jobs (client, status, started_at)")
+
+    def _connect(self):
+        # One connection per thread, reopened after a fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def register(self, kind, handler):
+        self._handlers[kind] = handler
+
+    def start(self):
+        """Start this process's workers; safe to call repeatedly, and again after a fork"""
+        with self._lock:
+            if self._started_pid == os.getpid():
+                return
+            self._started_pid = os.getpid()
+        for i in range(self.workers):
+            threading.Thread(target=self._work, name=f'ee-job-{i}', daemon=True).start()
+
+    def submit(self, kind, params, client, priority='normal'):
+        """Queue a job and return its status, raising QueueFull if the client has too many pending"""
+        if kind not in self._handlers:
+            raise ValueError(f'Unknown job kind: {kind}')
+        self.start()
+
+        conn = self._connect()
+        pending = conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE client = ? AND status IN ('queued', 'running')", (client,)
+        ).fetchone()[0]
+        if pending >= self.max_pending:
+            raise QueueFull(f'At most {self.max_pending} pending jobs per client')
+
+        job_id = uuid.uuid4().hex
+        conn.execute(
+            "INSERT INTO jobs (id, kind, client, priority, params, status, created_at) "
+            "VALUES (?, ?, ?, ?, ?, 'queued', ?)",
+            (job_id, kind, client, PRIORITIES[priority], json.dumps(params, separators=(',', ':')), time.time())
+        )
+        self._wake.set()
+        log.info('Job queued', extra={'job': job_id, 'kind': kind, 'client': client, 'priority': priority})
+        return self.get(job_id)
+
+    def get(self, job_id):
+        """Status of a job (with its result once done), or None if it is unknown or expired"""
+        self.start()
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT kind, priority, status, result, error, created_at, started_at, finished_at "
+            "FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        kind, priority, status, result, error, created_at, started_at, finished_at = row
+        job = {
+            'job_id': job_id,
+            'kind': kind,
+            'status': status,
+            'priority': next(name for name, value in PRIORITIES.items() if value == priority),
+            'created_at': _timestamp(created_at),
+            'started_at': _timestamp(started_at),
+            'finished_at': _timestamp(finished_at),
+        }
+        if status == 'queued':
+            job['queued_ahead'] = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' "
+                "AND (priority < ? OR (priority = ? AND created_at < ?))",
+                (priority, priority, created_at)
+            ).fetchone()[0]
+        if result is not None:
+            job['result'] = json.loads(zlib.decompress(result))
+        if error is not None:
+            job['error'] = error
+        return job
+
+    def _claim(self):
+        """Mark the next job running and return (id, kind, params), or None if none is queued"""
+        conn = self._connect()
+        # BEGIN IMMEDIATE takes the write lock, so workers in other processes cannot claim the same job
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("""
+                SELECT id, kind, params FROM jobs AS j WHERE status = 'queued'
+                ORDER BY priority,
+                    (SELECT COUNT(*) FROM jobs WHERE client = j.client AND status = 'running'),
+                    (SELECT MAX(started_at) FROM jobs WHERE client = j.client),
+                    created_at
+                LIMIT 1
+            """).fetchone()
+            if row is not None:
+                conn.execute("UPDATE jobs SET status = 'running', started_at = ? WHERE id = ?", (time.time(), row[0]))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return row
+
+    def _finish(self, job_id, result=None, error=None):
+        """Store a job's result or error; returns False if only the failure of storing it could be recorded"""
+        try:
+            blob = zlib.compress(json.dumps(result, separators=(',', ':'), default=str).encode()) \
+                if error is None else None
+            self._connect().execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? "
+                "WHERE id = ? AND status = 'running'",
+                ('done' if error is None else 'failed', blob, error, time.time(), job_id)
+            )
+            return error is None
+        except Exception as e:
+            # An unencodable result or a locked database; mark the job failed rather than leave it running
+            log.error('Storing job result failed', extra={'job': job_id, 'error': str(e)})
+            self._connect().execute(
+                "UPDATE jobs SET status = 'failed', result = NULL, error = ?, finished_at = ? "
+                "WHERE id = ? AND status = 'running'",
+                (f'Storing the job result failed: {e}', time.time(), job_id)
+            )
+            return False
+
+    def _run(self, job_id, kind, params):
+        stats = begin_task(f'job:{kind}')
+        set_priority('batch')
+        status = 'ok'
+        try:
+            result = self._handlers[kind](json.loads(params))
+        except Exception as e:
+            status = 'error'
+            log.error('Job failed', extra={'job': job_id, 'kind': kind, 'error': str(e)})
+            self._finish(job_id, error=str(e))
+        else:
+            # Counted as a failure unless the result is stored
+            status = 'error'
+            if self._finish(job_id, result):
+                status = 'ok'
+        finally:
+            with self._lock:
+                if status == 'ok':
+                    self.completed += 1
+                else:
+                    self.failed += 1
+            duration = end_task(stats, status)
+            log.info('Job finished', extra={
+                'job': job_id, 'kind': kind, 'status': status, 'duration_ms': round(duration * 1000, 1),
+                'ee_calls': stats.ee_calls
+            })
+
+    def _work(self):
+        while True:
+            try:
+                job = self._claim()
+            except sqlite3.Error as e:
+                log.warning('Job claim failed', extra={'error': str(e)})
+                job = None
+
+            if job is not None:
+                try:
+                    self._run(*job)
+                except Exception as e:
+                    # Keep the worker alive; purge() fails the job once it times out
+                    log.error('Job worker error', extra={'job': job[0], 'error': str(e)})
+                continue
+
+            self._wake.clear()
+            if time.time() - self._purged_at > PURGE_INTERVAL:
+                self._purged_at = time.time()
+                try:
+                    self.purge()
+                except sqlite3.Error as e:
+                    log.warning('Job purge failed', extra={'error': str(e)})
+            self._wake.wait(POLL_INTERVAL)
+
+    def purge(self):
+        """Drop finished jobs past their retention and fail jobs whose worker died or overran"""
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            "UPDATE jobs SET status = 'failed', error = 'Job timed out or its worker exited', finished_at = ? "
+            "WHERE status = 'running' AND started_at < ?",
+            (now, now - self.timeout)
+        )
+        conn.execute("DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (now - self.retention,))
+
+    def stats(self):
+        counts = dict(self._connect().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        with self._lock:
+            return {
+                'path': self.path,
+                'workers': self.workers,
+                **{status: counts.get(status, 0) for status in STATUSES},
+                'completed_here': self.completed,
+                'failed_here': self.failed,
+            }
+
+
+def jobs_from_env():
+    """Create the job queue from EE_JOB_* environment variables, or None if disabled"""
+    if os.getenv('EE_JOBS_ENABLED', 'true').lower() == 'false':
+        return None
+    default_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache_data', 'jobs.sqlite3')
+    return JobQueue(
+        os.getenv('EE_JOBS_PATH', default_path),
+        workers=int(os.getenv('EE_JOB_WORKERS', 4)),
+        retention=float(os.getenv('EE_JOB_RETENTION', DAY)),
+        timeout=float(os.getenv('EE_JOB_TIMEOUT', 900)),
+        max_pending=int(os.getenv('EE_JOB_MAX_PENDING', 20)),
+    )
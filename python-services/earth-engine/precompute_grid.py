@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Precompute static Earth Engine layers over a bounding box
+Writes per-cell partial statistics for GridStore (see grid_store.py) so that
+/surface-water, /landcover and the environmental assessment can answer
+locally inside the box.
+
+Example:
+    python3 precompute_grid.py --bbox -124.0 48.0 -123.0 49.0 --resolution 0.01
+"""
+
+import os
+import sys
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+import ee
+from dotenv import load_dotenv
+
+from grid_store import DEFAULT_GRID_PATH, GRID_LAYERS, LANDCOVER_CLASS_IDS, METADATA_FILE
+from ee_init import EarthEngineInitializer
+from datasets import DATASETS, composite, date_window, filtered, prepared, source
+
+# Long-term NDVI median window
+NDVI_GRID_DAYS = 365
+
+
+def layer_reduction(layer, bounds):
+    """Return (image, reducer) for a grid layer, plus extra metadata"""
+    if layer == 'surface-water':
+        image, _ = source('surface-water', None)
+        reducer = ee.Reducer.sum().combine(ee.Reducer.count(), '', True).unweighted()
+        return image, reducer, {}
+
+    if layer == 'landcover':
+        image, _ = source('landcover', None)
+        return image, ee.Reducer.frequencyHistogram(), {}
+
+    if layer == 'ndvi':
+        # The /ndvi composite (dataset, cloud filter, band), over a long-term window
+        collection = filtered('ndvi', bounds, date_window(NDVI_GRID_DAYS))
+        ndvi = composite('ndvi', prepared('ndvi', collection))
+        band = DATASETS['ndvi']['band']
+        image = ndvi.addBands(ndvi.multiply(ndvi).rename(f'{band}_sq'))
+        reducer = ee.Reducer.sum() \
+            .combine(ee.Reducer.count(), '', True) \
+            .combine(ee.Reducer.minMax(), '', True) \
+            .unweighted()
+        # Collection-level cloud cover for the NDVI response
+        extra = {'window_days': NDVI_GRID_DAYS, 'cloud_cover': collection.aggregate_mean('CLOUDY_PIXEL_PERCENTAGE')}
+        return image, reducer, extra
+
+    raise ValueError(f'Unknown layer: {layer}')
+
+
+def cell_values(layer, props):
+    """Extract a cell's channel values from reduceRegions output properties"""
+    if layer == 'surface-water':
+        return [props.get('sum'), props.get('count')]
+    if layer == 'landcover':
+        histogram = props.get('histogram') or {}
+        return [histogram.get(str(c), 0) for c in LANDCOVER_CLASS_IDS]
+    if layer == 'ndvi':
+        band = DATASETS['ndvi']['band']
+        return [props.get(f'{band}_{channel}') for channel in ('sum', 'sq_sum', 'count', 'min', 'max')]
+
+
+def reduce_cells(layer, image, reducer, cells, bbox, resolution):
+    """Reduce one chunk of cells with a single reduceRegions call"""
+    west, _, _, north = bbox
+    features = ee.FeatureCollection([
+        ee.Feature(
+            ee.Geometry.Rectangle(
+                [west + c * resolution, north - (r + 1) * resolution,
+                 west + (c + 1) * resolution, north - r * resolution],
+                None, False
+            ),
+            {'r': r, 'c': c}
+        )
+        for r, c in cells
+    ])
+    reduced = image.reduceRegions(
+        collection=features,
+        reducer=reducer,
+        scale=DATASETS[layer]['scale'],
+        tileScale=4
+    ).select(['.*'], None, False)
+
+    return [
+        (f['properties']['r'], f['properties']['c'], cell_values(layer, f['properties']))
+        for f in reduced.getInfo()['features']
+    ]
+
+
+def precompute_layer(layer, out_dir, bbox, resolution, rows, cols, chunk_size, concurrency):
+    image, reducer, extra = layer_reduction(layer, ee.Geometry.Rectangle(list(bbox), None, False))
+    channels = len(GRID_LAYERS[layer]['channels'])
+    filename = f'{layer}.npy'
+
+    # Written beside the current grid and swapped in when complete, so workers
+    # reading the old file never see it half-rewritten
+    partial = os.path.join(out_dir, filename + '.partial')
+    values = np.lib.format.open_memmap(partial, mode='w+', dtype=np.float64, shape=(rows, cols, channels))
+    values[:] = np.nan
+
+    cells = [(r, c) for r in range(rows) for c in range(cols)]
+    chunks = [cells[i:i + chunk_size] for i in range(0, len(cells), chunk_size)]
+    print(f"[INFO] {layer}: {len(cells)} cells in {len(chunks)} chunks")
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(reduce_cells, layer, image, reducer, chunk, bbox, resolution) for chunk in chunks]
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                for r, c, cell in future.result():
+                    values[r, c] = [np.nan if v is None else v for v in cell]
+            except Exception as e:
+                failed += 1
+                print(f"[ERROR] {layer} chunk failed: {e}")
+            if done % 10 == 0 or done == len(chunks):
+                print(f"[INFO] {layer}: {done}/{len(chunks)} chunks")
+
+    values.flush()
+    del values
+    os.replace(partial, os.path.join(out_dir, filename))
+
+    if 'cloud_cover' in extra:
+        extra['cloud_cover'] = extra['cloud_cover'].getInfo()
+
+    return {
+        'file': filename,
+        'scale': DATASETS[layer]['scale'],
+        'created': datetime.utcnow().isoformat(),
+        'failed_chunks': failed,
+        **extra
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bbox', nargs=4, type=float, required=True, metavar=('WEST', 'SOUTH', 'EAST', 'NORTH'))
+    parser.add_argument('--resolution', type=float, default=0.01, help='cell size in degrees (default 0.01)')
+    parser.add_argument('--layers', default=','.join(GRID_LAYERS), help='comma-separated layers to compute')
+    parser.add_argument('--out', default=DEFAULT_GRID_PATH, help='output directory')
+    parser.add_argument('--chunk-size', type=int, default=250, help='cells per reduceRegions call')
+    parser.add_argument('--concurrency', type=int, default=4, help='parallel Earth Engine requests')
+    args = parser.parse_args()
+
+    west, south, east, north = args.bbox
+    if west >= east or south >= north:
+        parser.error('bbox must be WEST SOUTH EAST NORTH with WEST < EAST and SOUTH < NORTH')
+
+    layers = [name.strip() for name in args.layers.split(',') if name.strip()]
+    unknown = [name for name in layers if name not in GRID_LAYERS]
+    if unknown:
+        parser.error(f"unknown layers: {', '.join(unknown)}")
+
+    load_dotenv()
+    if not EarthEngineInitializer().ensure():
+        print("[ERROR] Earth Engine not initialized")
+        return 1
+
+    rows = int(round((north - south) / args.resolution))
+    cols = int(round((east - west) / args.resolution))
+    bbox = [west, north - rows * args.resolution, west + cols * args.resolution, north]
+
+    os.makedirs(args.out, exist_ok=True)
+    metadata_path = os.path.join(args.out, METADATA_FILE)
+    metadata = {'bbox': bbox, 'resolution': args.resolution, 'rows': rows, 'cols': cols, 'layers': {}}
+
+    # Adding layers to an existing grid keeps its other layers if the grid matches
+    if os.path.exists(metadata_path):
+        with open(metadata_path) as f:
+            existing = json.load(f)
+        if existing['bbox'] == bbox and existing['resolution'] == args.resolution:
+            metadata['layers'] = existing.get('layers', {})
+
+    for layer in layers:
+        metadata['layers'][layer] = precompute_layer(
+            layer, args.out, bbox, args.resolution, rows, cols, args.chunk_size, args.concurrency
+        )
+        with open(metadata_path + '.tmp', 'w') as f:
+            json.dump(metadata, f, indent=2)
+        os.replace(metadata_path + '.tmp', metadata_path)
+
+    print(f"[SUCCESS] Grid written to {args.out} ({rows}x{cols} cells)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,208 @@
+"""
+Local rasters for hot regions
+Pixels of a few layers are fetched for heavily queried regions with
+computePixels and kept as memory-mapped NumPy arrays, so any circle or
+polygon inside a region is reduced locally: pixels whose centres fall inside
+are selected with vectorized masks and reduced into the same keys
+reduceRegion returns. Rasters are produced by fetch_hot_regions.py.
+
+Each region stores a layer at its metric's native scale, on a lat/lon grid.
+Float layers hold NaN for masked pixels; integer layers (land cover classes)
+hold their `nodata` value instead.
+"""
+
+import os
+import json
+import math
+import time
+from datetime import datetime
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE = 111320.0
+
+# Layer name (a metric in datasets.py) -> stored dtype, and the value marking
+# masked pixels in integer layers
+RASTER_LAYERS = {
+    'ndvi': {'dtype': 'float32', 'nodata': None},
+    'landcover': {'dtype': 'uint8', 'nodata': 0},
+    'surface-water': {'dtype': 'float32', 'nodata': None},
+}
+
+# Seconds between checks for rasters refetched while the service runs
+RELOAD_INTERVAL = 60
+
+METADATA_FILE = 'regions.json'
+DEFAULT_RASTER_PATH = os.getenv(
+    'EE_RASTER_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'raster_data')
+)
+
+
+def circle_mask(lats, lons, lat, lon, radius_m):
+    """Mask of the pixel centres (lats per row, lons per column) within radius_m of a point"""
+    dlat = np.radians(lats - lat)[:, None]
+    dlon = np.radians(lons - lon)[None, :]
+    # Haversine, as grid_store.py measures cells
+    a = np.sin(dlat / 2) ** 2 + \
+        math.cos(math.radians(lat)) * np.cos(np.radians(lats))[:, None] * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1))) <= radius_m
+
+
+def polygon_mask(lats, lons, polygons):
+    """
+    Mask of the pixel centres inside polygons given as lists of (n, 2) lon/lat
+    rings, scanline by scanline: the edges crossing a row's latitude toggle
+    inside/outside (even-odd, so holes subtract), and polygons are unioned
+    """
+    mask = np.zeros((len(lats), len(lons)), dtype=bool)
+    for rings in polygons:
+        edges = np.concatenate([np.stack([ring[:-1], ring[1:]], axis=1) for ring in rings])
+        (x0, y0), (x1, y1) = edges[:, 0].T, edges[:, 1].T
+        for row, lat in enumerate(lats):
+            crossing = (y0 <= lat) != (y1 <= lat)
+            if not crossing.any():
+                continue
+            xs = x0[crossing] + (lat - y0[crossing]) * (x1[crossing] - x0[crossing]) / (y1[crossing] - y0[crossing])
+            toggles = np.zeros(len(lons) + 1, dtype=np.int32)
+            np.add.at(toggles, np.searchsorted(lons, xs), 1)
+            mask[row] |= np.cumsum(toggles[:-1]) % 2 == 1
+    return mask
+
+
+def reduce_pixels(kind, band, values, nodata=None):
+    """reduceRegion-style statistics of the selected pixels for a datasets.REDUCERS kind"""
+    if kind == 'histogram':
+        valid = values[values != nodata] if nodata is not None else values
+        counts = np.bincount(valid.astype(np.int64))
+        return {band: {str(value): float(count) for value, count in enumerate(counts) if count}}
+
+    valid = values[~np.isnan(values)] if nodata is None else values[values != nodata].astype(np.float64)
+    if kind == 'max':
+        return {band: float(valid.max()) if valid.size else None}
+
+    mean = float(valid.mean(dtype=np.float64)) if valid.size else None
+    if kind == 'mean':
+        return {band: mean}
+
+    stats = {
+        f'{band}_mean': mean,
+        f'{band}_min': float(valid.min()) if valid.size else None,
+        f'{band}_max': float(valid.max()) if valid.size else None,
+    }
+    if kind == 'mean_min_max_std':
+        stats[f'{band}_stdDev'] = float(valid.std(dtype=np.float64)) if valid.size else None
+    return stats
+
+
+class RasterStore:
+    """Read-only view over a directory of hot-region rasters"""
+
+    def __init__(self, path, metadata, mtime=None):
+        self.path = path
+        self.metadata = metadata
+        self._arrays = {}
+        self._mtime = mtime
+        self._checked_at = time.monotonic()
+
+    @classmethod
+    def open(cls, path):
+        """Open a raster directory, or return None if there are no rasters there"""
+        metadata_path = os.path.join(path, METADATA_FILE)
+        if not os.path.exists(metadata_path):
+            return None
+        with open(metadata_path) as f:
+            return cls(path, json.load(f), os.path.getmtime(metadata_path))
+
+    def _reload_if_changed(self):
+        """Pick up regions and layers refetched by fetch_hot_regions.py since the metadata was read"""
+        now = time.monotonic()
+        if now - self._checked_at < RELOAD_INTERVAL:
+            return
+        self._checked_at = now
+        metadata_path = os.path.join(self.path, METADATA_FILE)
+        try:
+            mtime = os.path.getmtime(metadata_path)
+            if mtime == self._mtime:
+                return
+            with open(metadata_path) as f:
+                self.metadata = json.load(f)
+        except (OSError, ValueError):
+            return
+        self._mtime = mtime
+        self._arrays = {}
+
+    @property
+    def regions(self):
+        self._reload_if_changed()
+        return {name: list(region['layers']) for name, region in self.metadata.get('regions', {}).items()}
+
+    @property
+    def layers(self):
+        return {layer for layers in self.regions.values() for layer in layers}
+
+    def array(self, region, layer):
+        key = (region, layer)
+        if key not in self._arrays:
+            filename = self.metadata['regions'][region]['layers'][layer]['file']
+            self._arrays[key] = np.load(os.path.join(self.path, filename), mmap_mode='r')
+        return self._arrays[key]
+
+    def find(self, layer, bounds, max_age=None):
+        """(region name, layer info) of a region whose raster of the layer covers the bounds, or None"""
+        self._reload_if_changed()
+        west, south, east, north = bounds
+        now = datetime.utcnow()
+        for name, region in self.metadata.get('regions', {}).items():
+            info = region['layers'].get(layer)
+            if info is None:
+                continue
+            r_west, r_north, dx, dy = info['transform']
+            r_east, r_south = r_west + info['cols'] * dx, r_north - info['rows'] * dy
+            if west < r_west or east > r_east or south < r_south or north > r_north:
+                continue
+            if max_age is not None and (now - datetime.fromisoformat(info['created'])).total_seconds() > max_age:
+                continue
+            return name, info
+        return None
+
+    def stats(self, layer, lat, lon, radius_m, polygons=None, scale=None, max_age=None):
+        """
+        Reduce the pixels of a circle, or of polygons (lists of (n, 2) lon/lat
+        rings) when given, as reduceRegion would at `scale` metres (pixels are
+        subsampled to it). Returns (statistics, region name, layer info), or
+        None if no region covers the query with a raster younger than max_age
+        seconds, or no pixel centre falls inside it.
+        """
+        if polygons is not None:
+            points = np.concatenate([ring for rings in polygons for ring in rings])
+            (west, south), (east, north) = points.min(axis=0), points.max(axis=0)
+        else:
+            dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+            dlon = dlat / max(math.cos(math.radians(lat)), 1e-6)
+            west, south, east, north = lon - dlon, lat - dlat, lon + dlon, lat + dlat
+
+        found = self.find(layer, (west, south, east, north), max_age)
+        if found is None:
+            return None
+        region, info = found
+
+        r_west, r_north, dx, dy = info['transform']
+        step = max(1, int(round((scale or info['scale']) / info['scale'])))
+        row0 = max(0, int((r_north - north) / dy))
+        row1 = min(info['rows'], int(math.ceil((r_north - south) / dy)))
+        col0 = max(0, int((west - r_west) / dx))
+        col1 = min(info['cols'], int(math.ceil((east - r_west) / dx)))
+
+        rows, cols = np.arange(row0, row1, step), np.arange(col0, col1, step)
+        lats = r_north - (rows + 0.5) * dy
+        lons = r_west + (cols + 0.5) * dx
+        if polygons is not None:
+            mask = polygon_mask(lats, lons, polygons)
+        else:
+            mask = circle_mask(lats, lons, lat, lon, radius_m)
+        if not mask.any():
+            return None
+
+        pixels = np.asarray(self.array(region, layer)[row0:row1:step, col0:col1:step])[mask]
+        return reduce_pixels(info['reducer'], info['band'], pixels, info.get('nodata')), region, info
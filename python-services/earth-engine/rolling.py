@@ -0,0 +1,57 @@
+"""
+Rolling-window metrics assembled from per-day partial aggregates
+Each day of a window is reduced once over the region and stored per location
+cell; a refresh fetches only the days not stored yet, then combines the daily
+statistics locally. Only sums combine exactly (the regional mean of a per-pixel
+sum is the sum of the daily regional means), so only sum-composited metrics are
+assembled this way; a median of daily regional values is not the statistics of
+a per-pixel median composite.
+"""
+
+import ee
+
+from instrumentation import get_info
+
+
+def daily_reduction(collection, composite, reducer, region, params, days):
+    """
+    Build one unevaluated ee.List with a {images, stats} dictionary per (start,
+    end) day, compositing each day's images with composite(images)
+    """
+    def reduce_day(item):
+        item = ee.List(item)
+        images = collection.filterDate(item.get(0), item.get(1))
+        count = images.size()
+        stats = composite(images).reduceRegion(reducer=reducer, geometry=region, **params)
+        # A day without images has no bands to reduce
+        return ee.Dictionary({'images': count, 'stats': ee.Algorithms.If(count.gt(0), stats, None)})
+
+    return ee.List([[start.isoformat(), end.isoformat()] for start, end in days]).map(reduce_day)
+
+
+def fetch_days(collection, composite, reducer, region, params, days, dataset):
+    """Fetch the daily statistics for the given days with a single getInfo(), reducing with `params`"""
+    if not days:
+        return []
+    info = get_info(daily_reduction(collection, composite, reducer, region, params, days), dataset)
+    return [
+        {'date': start.isoformat(), 'end': end.isoformat(), 'images': entry.get('images', 0),
+         'stats': entry.get('stats')}
+        for (start, end), entry in zip(days, info)
+    ]
+
+
+def combine(days, how):
+    """
+    Combine daily reduceRegion outputs into statistics for the whole window.
+    'sum' adds the daily values, which equals reducing the per-pixel sum.
+    """
+    values = {}
+    for day in days:
+        for key, value in (day.get('stats') or {}).items():
+            if value is not None:
+                values.setdefault(key, []).append(value)
+
+    if how == 'sum':
+        return {key: sum(v) for key, v in values.items()}
+    raise ValueError(f'Unknown combination: {how}')
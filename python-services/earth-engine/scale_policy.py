@@ -0,0 +1,63 @@
+"""
+Reduction scale policy
+Picks reduceRegion parameters (scale, bestEffort, tileScale, maxPixels) from the
+area of the region and a client-chosen quality tier, so that large regions are
+reduced at a coarser scale in bounded time instead of hitting Earth Engine's
+pixel and memory limits.
+
+    fast      ~1M pixels: coarsest, for previews and map hovers
+    balanced  ~4M pixels: the default; a 10 km radius stays at 10 m
+    exact     native scale at any size, with tiling instead of coarsening
+"""
+
+import math
+
+QUALITY_TIERS = {
+    'fast': {'pixel_budget': 1e6, 'best_effort': True},
+    'balanced': {'pixel_budget': 4e6, 'best_effort': True},
+    'exact': {'pixel_budget': None, 'best_effort': False},
+}
+DEFAULT_QUALITY = 'balanced'
+
+
+def parse_quality(args):
+    """Read the quality query param, raising ValueError for an unknown tier"""
+    quality = args.get('quality', DEFAULT_QUALITY)
+    if quality not in QUALITY_TIERS:
+        raise ValueError(f"quality must be one of: {', '.join(QUALITY_TIERS)}")
+    return quality
+
+
+def tile_scale(pixels):
+    """Split big reductions into smaller tiles so they fit in EE worker memory"""
+    if pixels > 5e7:
+        return 16
+    if pixels > 5e6:
+        return 4
+    if pixels > 1e6:
+        return 2
+    return 1
+
+
+def reduction_params(native_scale, radius_m, quality=DEFAULT_QUALITY):
+    """
+    reduceRegion keyword arguments for a circle of `radius_m` metres. Coarser
+    scales are the native scale times a power of two, which matches Earth
+    Engine's image pyramids and keeps cache keys stable across nearby radii.
+    """
+    tier = QUALITY_TIERS[quality]
+    area = math.pi * radius_m ** 2
+
+    scale = native_scale
+    if tier['pixel_budget'] is not None:
+        while area / scale ** 2 > tier['pixel_budget']:
+            scale *= 2
+
+    pixels = area / scale ** 2
+    return {
+        'scale': scale,
+        'bestEffort': tier['best_effort'],
+        'tileScale': tile_scale(pixels),
+        # bestEffort only coarsens further past this; exact must never give up
+        'maxPixels': tier['pixel_budget'] * 4 if tier['pixel_budget'] is not None else 1e13,
+    }
@@ -0,0 +1,205 @@
+"""
+Earth Engine call scheduler
+Every getInfo() goes through one scheduler per process (see
+instrumentation.get_info), so a traffic spike queues here instead of reaching
+Earth Engine as a burst of concurrent requests that trips its quotas.
+
+    concurrency   at most this many calls in flight
+    rate / burst  token bucket on call starts (rate 0 disables it)
+    priorities    waiting calls start in class order, then arrival order:
+                  interactive (map requests), batch (batches, tiles, jobs),
+                  background (refreshes, warm-up)
+    retries       calls rejected with a quota or 429 error are retried after
+                  a jittered exponential backoff, without holding a slot
+    max_queue     callers beyond this many waiting, or waiting longer than
+                  queue_timeout, fail fast with Overloaded (a 503 with
+                  Retry-After at the routes)
+
+Earth Engine's limits apply per project, so the limits given are divided
+between the EE_SCHEDULER_SHARES processes serving it (gunicorn_conf.py and,
+for uvicorn, start.sh set this to the worker count).
+"""
+
+import os
+import re
+import time
+import heapq
+import random
+import itertools
+import threading
+import contextvars
+
+PRIORITY_CLASSES = {'interactive': 0, 'batch': 1, 'background': 2}
+
+# Earth Engine's wording for rejected requests: HTTP 429 ("Too Many Requests"),
+# "Too many concurrent aggregations", "Quota exceeded", "rate limit exceeded".
+# Other "too many" errors ("Too many pixels in the region") are permanent.
+QUOTA_ERROR = re.compile(
+    r'\b429\b|too many requests|too many concurrent aggregations|quota|rate limit', re.IGNORECASE
+)
+
+_priority = contextvars.ContextVar('ee_priority', default='interactive')
+
+
+class Overloaded(Exception):
+    """Earth Engine capacity is exhausted; the client should retry after `retry_after` seconds"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def set_priority(name):
+    """Priority class of the Earth Engine calls made from the current context on"""
+    if name not in PRIORITY_CLASSES:
+        raise ValueError(f"priority class must be one of: {', '.join(PRIORITY_CLASSES)}")
+    _priority.set(name)
+
+
+def is_quota_error(error):
+    """Whether an Earth Engine error is a rate or quota rejection worth retrying"""
+    # HTTP errors from the API client carry the status (googleapiclient's HttpError.resp)
+    status = getattr(getattr(error, 'resp', None), 'status', None) or getattr(error, 'status_code', None)
+    if status is not None:
+        try:
+            return int(status) == 429
+        except (TypeError, ValueError):
+            pass
+    return QUOTA_ERROR.search(str(error)) is not None
+
+
+class Scheduler:
+    """Admits calls under a concurrency cap and token bucket, in priority order"""
+
+    def __init__(self, concurrency=40, rate=0.0, burst=None, max_queue=512, queue_timeout=30.0,
+                 retries=3, backoff=0.5, retry_after=5):
+        self.concurrency = concurrency
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.retry_after = retry_after
+
+        self._cond = threading.Condition()
+        self._waiting = []  # heap of (priority, arrival)
+        self._arrivals = itertools.count()
+        self._tokens = self.burst
+        self._refilled_at = time.monotonic()
+        self.running = 0
+        self.rejected = 0
+        self.quota_retries = 0
+        self.quota_failures = 0
+
+    def _take_token(self):
+        """Take a token and return 0, or return the seconds until one is available"""
+        if not self.rate:
+            return 0
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+        return (1 - self._tokens) / self.rate
+
+    def _reject(self, message):
+        self.rejected += 1
+        raise Overloaded(message, self.retry_after)
+
+    def acquire(self, priority='interactive'):
+        """Wait for a slot, raising Overloaded if the queue is full or the wait too long"""
+        with self._cond:
+            if len(self._waiting) >= self.max_queue:
+                self._reject('Earth Engine request queue is full')
+
+            entry = (PRIORITY_CLASSES[priority], next(self._arrivals))
+            heapq.heappush(self._waiting, entry)
+            deadline = time.monotonic() + self.queue_timeout
+            try:
+                while True:
+                    wait = None
+                    if self._waiting[0] == entry and self.running < self.concurrency:
+                        wait = self._take_token()
+                        if not wait:
+                            heapq.heappop(self._waiting)
+                            self.running += 1
+                            # The next waiter may be able to start too
+                            self._cond.notify_all()
+                            return
+
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._reject(f'Timed out after {self.queue_timeout:g}s waiting for Earth Engine capacity')
+                    self._cond.wait(min(wait, remaining) if wait else remaining)
+            except BaseException:
+                if entry in self._waiting:
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+                    self._cond.notify_all()
+                raise
+
+    def release(self):
+        with self._cond:
+            self.running -= 1
+            self._cond.notify_all()
+
+    def call(self, fn):
+        """Run fn() in a slot at the current context's priority, retrying quota errors"""
+        priority = _priority.get()
+        for attempt in range(self.retries + 1):
+            self.acquire(priority)
+            try:
+                return fn()
+            except Exception as e:
+                if not is_quota_error(e):
+                    raise
+                error = e
+            finally:
+                self.release()
+
+            if attempt < self.retries:
+                with self._cond:
+                    self.quota_retries += 1
+                time.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+        with self._cond:
+            self.quota_failures += 1
+        raise Overloaded(f'Earth Engine quota exceeded: {error}', self.retry_after)
+
+    def stats(self):
+        with self._cond:
+            waiting = {name: 0 for name in PRIORITY_CLASSES}
+            names = {value: name for name, value in PRIORITY_CLASSES.items()}
+            for priority, _ in self._waiting:
+                waiting[names[priority]] += 1
+            return {
+                'concurrency': self.concurrency,
+                'rate': self.rate,
+                'running': self.running,
+                'waiting': waiting,
+                'rejected': self.rejected,
+                'quota_retries': self.quota_retries,
+                'quota_failures': self.quota_failures,
+            }
+
+
+def scheduler_from_env():
+    """Create the scheduler from EE_SCHEDULER_* / EE_MAX_CONCURRENT / EE_RATE_LIMIT environment variables"""
+    shares = max(1, int(os.getenv('EE_SCHEDULER_SHARES', 1)))
+    rate = float(os.getenv('EE_RATE_LIMIT', 0)) / shares
+    burst = os.getenv('EE_RATE_BURST')
+    return Scheduler(
+        concurrency=max(1, int(os.getenv('EE_MAX_CONCURRENT', 40)) // shares),
+        rate=rate,
+        burst=float(burst) / shares if burst else None,
+        max_queue=int(os.getenv('EE_SCHEDULER_MAX_QUEUE', 512)),
+        queue_timeout=float(os.getenv('EE_SCHEDULER_QUEUE_TIMEOUT', 30)),
+        retries=int(os.getenv('EE_QUOTA_RETRIES', 3)),
+        backoff=float(os.getenv('EE_QUOTA_BACKOFF', 0.5)),
+        retry_after=int(os.getenv('EE_RETRY_AFTER', 5)),
+    )
+
+
+SCHEDULER = scheduler_from_env()
@@ -0,0 +1,115 @@
+"""
+Environmental assessment scoring
+Scores any number of locations at once from an (n, 3) array of their metric
+values, one column per component:
+
+    vegetation  NDVI mean
+    landcover   natural land cover share (%)
+    water       surface water occurrence (%)
+
+Component scores are piecewise linear, the overall score is their weighted
+average and grades and recommendations follow from it. NaN marks a value that
+is not available (no imagery), which leaves the component out of the
+weighting; a metric that failed to fetch scores NEUTRAL_SCORE instead.
+"""
+
+import os
+import math
+
+import numpy as np
+
+COMPONENTS = ('vegetation', 'landcover', 'water')
+NEUTRAL_SCORE = 50
+
+# NDVI: 0.2 -> 20, 0.4 -> 40, 0.6 -> 60, 0.8 and above -> 100
+NDVI_POINTS = ([0.0, 0.2, 0.4, 0.6, 0.8], [0, 20, 40, 60, 100])
+# Water occurrence: 5-15% is balanced, falling to a floor of 20 at 1% and at 100%
+WATER_POINTS = ([1, 5, 15, 100], [20, 100, 100, 20])
+
+# Overall score thresholds between GRADES, which run from worst to best
+GRADE_THRESHOLDS = [40, 60, 75, 90]
+GRADES = [
+    ('Critical', 'Immediate conservation and restoration required'),
+    ('Poor', 'Ecosystem under stress - restoration efforts needed'),
+    ('Fair', 'Monitor environmental indicators and reduce human impact'),
+    ('Good', 'Healthy ecosystem with room for improvement'),
+    ('Excellent', 'Ecosystem is thriving - continue conservation efforts'),
+]
+
+# Component recommendations, given when its score is below 60 (or, for
+# water, when occurrence is below 3%)
+RECOMMENDATIONS = (
+    'Increase vegetation cover through reforestation',
+    'Reduce urban sprawl and preserve natural habitats',
+    'Improve water retention and watershed management',
+)
+
+
+def parse_weights(value, default):
+    """
+    Parse component weights such as 'vegetation:0.5,water:0.2' over `default`,
+    raising ValueError for unknown components or invalid weights
+    """
+    weights = dict(default)
+    if not value:
+        return weights
+
+    for item in value.split(','):
+        component, _, weight = item.partition(':')
+        component = component.strip()
+        if component not in COMPONENTS:
+            raise ValueError(f"weights must be component:weight pairs, components: {', '.join(COMPONENTS)}")
+        try:
+            weights[component] = float(weight)
+        except ValueError:
+            raise ValueError(f'weight for {component} must be a number')
+        if not math.isfinite(weights[component]) or weights[component] < 0:
+            raise ValueError(f'weight for {component} must be a non-negative number')
+
+    if not any(weights.values()):
+        raise ValueError('at least one weight must be positive')
+    return weights
+
+
+DEFAULT_WEIGHTS = parse_weights(
+    os.getenv('EE_SCORE_WEIGHTS'), {'vegetation': 0.4, 'landcover': 0.35, 'water': 0.25}
+)
+
+
+def assess(values, failed=None, weights=DEFAULT_WEIGHTS):
+    """
+    Score an (n, 3) array of component values (see module docstring). `failed`
+    is an optional (n, 3) bool array of components whose metric could not be
+    fetched. Returns a dict of arrays: 'scores' (n, 3, NaN for components left
+    out), 'overall' (n,) and 'grade' (n,) indices into GRADES.
+    """
+    values = np.asarray(values, dtype=float).reshape(-1, len(COMPONENTS))
+    scores = np.column_stack([
+        np.interp(values[:, 0], *NDVI_POINTS),
+        np.minimum(values[:, 1], 100),
+        np.interp(values[:, 2], *WATER_POINTS),
+    ])
+    if failed is not None:
+        scores[np.asarray(failed, dtype=bool)] = NEUTRAL_SCORE
+
+    # Weighted average over the components each location has
+    w = np.array([weights[c] for c in COMPONENTS], dtype=float)
+    present = ~np.isnan(scores)
+    total = present @ w
+    weighted = np.where(present, scores, 0) @ w
+    overall = np.round(np.divide(weighted, total, out=np.zeros(len(scores)), where=total > 0), 1)
+
+    return {'scores': scores, 'overall': overall, 'grade': np.digitize(overall, GRADE_THRESHOLDS)}
+
+
+def recommendations(assessed, values):
+    """Recommendation lists for assessed locations, the grade's first"""
+    # A component left out counts as neutral, like a failed one
+    scores = np.where(np.isnan(assessed['scores']), NEUTRAL_SCORE, assessed['scores'])
+    water = np.asarray(values, dtype=float).reshape(-1, len(COMPONENTS))[:, 2]
+    flags = np.column_stack([scores[:, 0] < 60, scores[:, 1] < 60, np.round(water, 1) < 3])
+
+    return [
+        [GRADES[grade][1]] + [text for text, flag in zip(RECOMMENDATIONS, row) if flag]
+        for grade, row in zip(assessed['grade'], flags)
+    ]
@@ -0,0 +1,94 @@
+"""
+Request coalescing for identical in-flight Earth Engine queries
+Concurrent callers with the same key share one execution and all receive its result
+"""
+
+import asyncio
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Collapse concurrent calls with the same key into a single execution"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executed = 0
+        self.shared = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'in_flight': len(self._calls),
+                'executed': self.executed,
+                'shared': self.shared,
+            }
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines; all callers must run on the same event loop"""
+
+    def __init__(self):
+        self._calls = {}
+        self.executed = 0
+        self.shared = 0
+
+    async def do(self, key, fn, *args, **kwargs):
+        call = self._calls.get(key)
+        if call is not None:
+            self.shared += 1
+            # A caller giving up (e.g. client disconnect) must not cancel the shared call
+            return await asyncio.shield(call)
+
+        self.executed += 1
+        call = self._calls[key] = asyncio.ensure_future(fn(*args, **kwargs))
+        call.add_done_callback(lambda _: self._finished(key, call))
+        return await asyncio.shield(call)
+
+    def _finished(self, key, call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        # Mark the error as retrieved even if every caller has gone away
+        if not call.cancelled():
+            call.exception()
+
+    def stats(self):
+        return {
+            'in_flight': len(self._calls),
+            'executed': self.executed,
+            'shared': self.shared,
+        }
@@ -9,6 +9,19 @@ fi
 # Activate virtual environment
 source venv/bin/activate
 
-# Start Flask app
-echo "[EARTH ENGINE SERVICE] Starting on port 5001..."
-python3 app.py
+PORT=${PORT:-5001}
+
+# EE_SERVER_MODE=development runs the Flask debug server with the reloader,
+# EE_SERVER_MODE=asgi runs the async variant (asgi_app.py) under uvicorn
+if [ "${EE_SERVER_MODE:-production}" = "development" ]; then
+    echo "[EARTH ENGINE SERVICE] Starting development server on port $PORT..."
+    FLASK_DEBUG=true python3 app.py
+elif [ "$EE_SERVER_MODE" = "asgi" ]; then
+    echo "[EARTH ENGINE SERVICE] Starting uvicorn (ASGI) on port $PORT..."
+    # Earth Engine quotas are per project; each worker's scheduler takes an equal share
+    export EE_SCHEDULER_SHARES="${EE_SCHEDULER_SHARES:-${UVICORN_WORKERS:-1}}"
+    exec uvicorn asgi_app:app --host 0.0.0.0 --port "$PORT" --workers "${UVICORN_WORKERS:-1}"
+else
+    echo "[EARTH ENGINE SERVICE] Starting gunicorn on port $PORT..."
+    exec gunicorn -c gunicorn_conf.py app:app
+fi
@@ -0,0 +1,99 @@
+"""
+Test setup
+The service is imported with bench/fake_ee.py in place of the Earth Engine
+client, with the result caches off and jobs in a temporary database, and the
+route tests run against both the Flask app and the ASGI variant.
+"""
+
+import os
+import sys
+import gzip
+import json
+import tempfile
+
+import brotli
+import pytest
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [SERVICE_DIR, os.path.join(SERVICE_DIR, 'bench')]
+
+os.environ.update({
+    'GOOGLE_EARTH_ENGINE_KEY': json.dumps({'client_email': 'tests@example.com'}),
+    'EE_CACHE_ENABLED': 'false',
+    'EE_DISK_CACHE_ENABLED': 'false',
+    'EE_JOBS_PATH': os.path.join(tempfile.mkdtemp(prefix='ee-tests-'), 'jobs.sqlite3'),
+    'EE_GRID_PATH': os.path.join(SERVICE_DIR, 'tests', 'no-grid'),
+    'EE_RASTER_PATH': os.path.join(SERVICE_DIR, 'tests', 'no-rasters'),
+    'EE_LOG_LEVEL': 'WARNING',
+})
+
+import fake_ee  # noqa: E402
+
+sys.modules['ee'] = fake_ee
+
+
+class Response:
+    """Status, lower-cased headers and decompressed body of a test response"""
+
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body)
+
+    def lines(self):
+        return [json.loads(line) for line in self.body.decode().splitlines()]
+
+
+class FlaskClient:
+    def __init__(self):
+        import app
+        self._client = app.app.test_client()
+
+    def request(self, method, path, body=None, headers=None):
+        response = self._client.open(
+            path, method=method, data=json.dumps(body) if body is not None else None,
+            headers=headers or {}, content_type='application/json'
+        )
+        headers = {k.lower(): v for k, v in response.headers.items()}
+        data = response.get_data()
+        # The Starlette client decompresses; do the same here
+        if headers.get('content-encoding') == 'gzip':
+            data = gzip.decompress(data)
+        elif headers.get('content-encoding') == 'br':
+            data = brotli.decompress(data)
+        return Response(response.status_code, headers, data)
+
+
+class StarletteClient:
+    def __init__(self, client):
+        self._client = client
+
+    def request(self, method, path, body=None, headers=None):
+        response = self._client.request(
+            method, path, content=json.dumps(body) if body is not None else None,
+            headers={'content-type': 'application/json', 'accept-encoding': 'identity', **(headers or {})}
+        )
+        return Response(response.status_code, {k.lower(): v for k, v in response.headers.items()}, response.content)
+
+
+@pytest.fixture(scope='session')
+def flask_client():
+    return FlaskClient()
+
+
+@pytest.fixture(scope='session')
+def asgi_client():
+    from starlette.testclient import TestClient
+    import asgi_app
+    # One client, so the app's limiters see a single event loop
+    with TestClient(asgi_app.app) as client:
+        yield StarletteClient(client)
+
+
+@pytest.fixture(params=['flask', 'asgi'])
+def client(request):
+    """Each route test runs against the Flask app and the ASGI app"""
+    return request.getfixturevalue(f'{request.param}_client')
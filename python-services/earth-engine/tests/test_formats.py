@@ -0,0 +1,139 @@
+import io
+import gzip
+import json
+import zlib
+
+import brotli
+import msgpack
+import numpy as np
+import pytest
+
+import formats
+from formats import (
+    Compressor, NotAcceptable, choose_encoding, compress, compress_chunks, compressible, encode, encode_stream,
+    negotiate
+)
+
+SERIES = {
+    'metric': 'ndvi',
+    'unit': 'index',
+    'points': [
+        {'date': '2026-01-01', 'value': 0.41, 'images': 3, 'stats': {'min': 0.1, 'max': 0.7}},
+        {'date': '2026-02-01', 'value': None, 'images': 0, 'stats': {'min': None, 'max': None}},
+        {'date': '2026-03-01', 'value': 0.52, 'images': 2, 'stats': {'min': 0.2, 'max': 0.8}},
+    ],
+}
+ROWS = [
+    {'id': 'a', 'ok': True, 'scores': {'overall': 71.5}, 'recommendations': ['x', 'y']},
+    {'id': 'b', 'ok': False, 'scores': {'overall': None}, 'recommendations': []},
+]
+
+
+@pytest.mark.parametrize('accept, requested, expected', [
+    (None, None, 'json'),
+    ('text/html, */*;q=0.8', None, 'json'),
+    ('application/msgpack', None, 'msgpack'),
+    ('application/x-msgpack', None, 'msgpack'),
+    ('application/json;q=0.5, application/x-npy', None, 'npy'),
+    ('application/x-npy;q=0, application/msgpack;q=0.1', None, 'msgpack'),
+    ('image/png', None, 'json'),
+    ('application/msgpack', 'NPY', 'npy'),
+])
+def test_negotiate(accept, requested, expected):
+    assert negotiate(accept, requested) == expected
+
+
+def test_negotiate_rejects_unknown_format():
+    with pytest.raises(NotAcceptable) as error:
+        negotiate(None, 'xml')
+    assert 'json' in error.value.available
+
+
+def test_arrow_only_offered_with_pyarrow(monkeypatch):
+    monkeypatch.setattr(formats, 'pa', None)
+    assert negotiate('application/vnd.apache.arrow.stream', None) == 'json'
+    with pytest.raises(NotAcceptable):
+        negotiate(None, 'arrow')
+
+
+def test_msgpack_round_trip():
+    assert msgpack.unpackb(encode(SERIES, 'msgpack')) == SERIES
+
+
+def test_npy_series():
+    table = np.load(io.BytesIO(encode(SERIES, 'npy')))
+    assert table.dtype.names == ('date', 'value', 'images', 'stats.min', 'stats.max')
+    assert table['date'].dtype == np.dtype('datetime64[D]')
+    assert table['images'].dtype == np.int64
+    assert table['value'][0] == pytest.approx(0.41)
+    assert np.isnan(table['value'][1])
+
+
+def test_npy_rows():
+    table = np.load(io.BytesIO(encode({}, 'npy', ROWS)))
+    assert list(table['id']) == ['a', 'b']
+    assert table['ok'].dtype == bool
+    assert np.isnan(table['scores.overall'][1])
+    assert json.loads(table['recommendations'][0]) == ['x', 'y']
+
+
+def test_arrow_series():
+    pa = pytest.importorskip('pyarrow')
+    table = pa.ipc.open_stream(encode(SERIES, 'arrow')).read_all()
+    assert table.column_names == ['date', 'value', 'images', 'stats.min', 'stats.max']
+    assert table.column('value').to_pylist() == [0.41, None, 0.52]
+    metadata = json.loads(table.schema.metadata[b'metadata'])
+    assert metadata == {'metric': 'ndvi', 'unit': 'index'}
+
+
+def test_encode_stream():
+    assert ''.join(encode_stream(iter(ROWS), 'json')).splitlines() == [json.dumps(row) for row in ROWS]
+    assert list(msgpack.Unpacker(io.BytesIO(b''.join(encode_stream(iter(ROWS), 'msgpack'))))) == ROWS
+    [table] = list(encode_stream(iter(ROWS), 'npy'))
+    assert len(np.load(io.BytesIO(table))) == 2
+
+
+@pytest.mark.parametrize('header, expected', [
+    (None, None),
+    ('gzip', 'gzip'),
+    ('gzip, deflate, br', 'br'),
+    ('br;q=0, gzip', 'gzip'),
+    ('*', 'br'),
+    ('*, br;q=0', 'gzip'),
+    ('identity', None),
+])
+def test_choose_encoding(header, expected):
+    assert choose_encoding(header) == expected
+
+
+def test_compressible():
+    assert compressible('application/json', None)
+    assert not compressible('application/json', 'gzip')
+    assert not compressible('image/png', None)
+
+
+@pytest.mark.parametrize('encoding, decompress', [('gzip', gzip.decompress), ('br', brotli.decompress)])
+def test_compress(encoding, decompress):
+    body = json.dumps(ROWS * 100).encode()
+    assert decompress(compress(body, encoding)) == body
+
+
+@pytest.mark.parametrize('encoding, decompress', [('gzip', gzip.decompress), ('br', brotli.decompress)])
+def test_compressed_chunks_decode_as_they_arrive(encoding, decompress):
+    chunks = [json.dumps(row) + '\n' for row in ROWS]
+    compressed = list(compress_chunks(iter(chunks), encoding))
+    assert decompress(b''.join(compressed)).decode() == ''.join(chunks)
+
+    # Each flushed chunk decodes without the ones after it
+    decoder = brotli.Decompressor() if encoding == 'br' else zlib.decompressobj(31)
+    decode = decoder.process if encoding == 'br' else decoder.decompress
+    assert decode(compressed[0]).decode() == chunks[0]
+
+
+def test_compressor_flushes_every_chunk():
+    compressor = Compressor('gzip')
+    decoder = zlib.decompressobj(31)
+    for chunk in (b'first', b'second'):
+        assert decoder.decompress(compressor.compress(chunk)) == chunk
+    decoder.decompress(compressor.finish())
+    assert decoder.eof
@@ -0,0 +1,116 @@
+import math
+
+import numpy as np
+import pytest
+
+import geometry
+from geometry import parse_area
+
+SQUARE = [[2, 1], [2.05, 1], [2.05, 1.05], [2, 1.05], [2, 1]]
+
+
+def circle(lat, lon, radius_deg, points):
+    angles = np.linspace(0, 2 * math.pi, points, endpoint=False)
+    ring = [[lon + radius_deg * math.cos(a), lat + radius_deg * math.sin(a)] for a in angles]
+    return ring + [ring[0]]
+
+
+@pytest.mark.parametrize('payload', [
+    {'type': 'Polygon', 'coordinates': [SQUARE]},
+    {'type': 'Feature', 'properties': {}, 'geometry': {'type': 'Polygon', 'coordinates': [SQUARE]}},
+    {'geometry': {'type': 'Polygon', 'coordinates': [SQUARE]}},
+    {'type': 'MultiPolygon', 'coordinates': [[SQUARE]]},
+])
+def test_parse_area_forms(payload):
+    area = parse_area(payload)
+    assert area.vertices == 5
+    assert area.bounds == (2, 1, 2.05, 1.05)
+    assert area.centroid == pytest.approx((1.025, 2.025), abs=1e-6)
+
+
+@pytest.mark.parametrize('payload, message', [
+    (None, 'Expected a GeoJSON Polygon'),
+    ({'type': 'Point', 'coordinates': [2, 1]}, 'Expected a GeoJSON Polygon'),
+    ({'type': 'Polygon', 'coordinates': []}, 'list of rings'),
+    ({'type': 'Polygon', 'coordinates': [SQUARE[:3]]}, 'at least 4 positions'),
+    ({'type': 'Polygon', 'coordinates': [SQUARE[:4] + [[2, 1.01]]]}, 'not closed'),
+    ({'type': 'Polygon', 'coordinates': [[[2, 1], [200, 1], [2, 5], [2, 1]]]}, 'outside lon'),
+    ({'type': 'Polygon', 'coordinates': [[[2, 1], ['a', 1], [2, 5], [2, 1]]]}, '[lon, lat] positions'),
+    ({'type': 'Polygon', 'coordinates': [[[2, 1], [3, float('nan')], [2, 5], [2, 1]]]}, '[lon, lat] positions'),
+    ({'type': 'MultiPolygon', 'coordinates': []}, 'list of polygons'),
+])
+def test_parse_area_rejects(payload, message):
+    with pytest.raises(ValueError, match=message.replace('[', r'\[')):
+        parse_area(payload)
+
+
+def test_parse_area_vertex_limit(monkeypatch):
+    monkeypatch.setattr(geometry, 'MAX_VERTICES', 100)
+    parse_area({'type': 'Polygon', 'coordinates': [circle(1, 2, 0.1, 99)]})
+    with pytest.raises(ValueError, match='At most 100 vertices'):
+        parse_area({'type': 'Polygon', 'coordinates': [circle(1, 2, 0.1, 100)]})
+
+
+def test_area_and_radius():
+    area = parse_area({'type': 'Polygon', 'coordinates': [circle(0, 0, 0.1, 2000)]})
+    radius_m = 0.1 * geometry.METERS_PER_DEGREE
+    assert area.area_m2 == pytest.approx(math.pi * radius_m ** 2, rel=1e-3)
+    assert area.radius_m == pytest.approx(radius_m, rel=1e-3)
+
+
+def test_holes_subtract():
+    hole = [[2.01, 1.01], [2.01, 1.02], [2.02, 1.02], [2.02, 1.01], [2.01, 1.01]]
+    solid = parse_area({'type': 'Polygon', 'coordinates': [SQUARE]})
+    holed = parse_area({'type': 'Polygon', 'coordinates': [SQUARE, hole]})
+    assert holed.area_m2 == pytest.approx(solid.area_m2 * (1 - 1 / 25), rel=1e-6)
+
+
+def test_hash_ignores_serialization_noise():
+    noisy = [[lon + 1e-9, lat] for lon, lat in SQUARE[:-1]]
+    noisy.append(noisy[0])
+    first = parse_area({'type': 'Polygon', 'coordinates': [SQUARE]})
+    assert parse_area({'type': 'Feature', 'geometry': {'type': 'Polygon', 'coordinates': [noisy]}}).hash == first.hash
+    assert parse_area({'type': 'Polygon', 'coordinates': [SQUARE[::-1]]}).hash != first.hash
+
+
+def test_simplify_drops_collinear_vertices():
+    # Every edge of the square split into 10 collinear segments
+    ring = []
+    for (x0, y0), (x1, y1) in zip(SQUARE[:-1], SQUARE[1:]):
+        ring += [[x0 + (x1 - x0) * t / 10, y0 + (y1 - y0) * t / 10] for t in range(10)]
+    ring.append(ring[0])
+    area = parse_area({'type': 'Polygon', 'coordinates': [ring]})
+
+    [[simplified]] = area.simplified(1)
+    assert sorted(map(tuple, simplified[:-1])) == sorted(map(tuple, SQUARE[:-1]))
+    assert simplified[0] == simplified[-1]
+
+
+def test_simplify_stays_within_tolerance():
+    ring = circle(1, 2, 0.05, 5000)
+    area = parse_area({'type': 'Polygon', 'coordinates': [ring]})
+    tolerance_m = 10
+    [[simplified]] = area.simplified(tolerance_m)
+    assert 4 <= len(simplified) < len(ring) / 10
+
+    # Original vertices lie within the tolerance of the simplified outline
+    kept = area._project(np.array(simplified))
+    for point in area._project(np.array(ring))[::50]:
+        a, b = kept[:-1], kept[1:]
+        t = np.clip(((point - a) * (b - a)).sum(axis=1) / ((b - a) ** 2).sum(axis=1), 0, 1)
+        distance = np.hypot(*(a + t[:, None] * (b - a) - point).T).min()
+        assert distance <= tolerance_m + 1e-6
+
+
+def test_simplify_keeps_thin_rings():
+    sliver = [[2, 1], [2.001, 1], [2.002, 1.0000001], [2, 1]]
+    area = parse_area({'type': 'Polygon', 'coordinates': [sliver]})
+    [[simplified]] = area.simplified(1000)
+    assert simplified == sliver
+
+
+def test_describe():
+    summary = parse_area({'type': 'Polygon', 'coordinates': [SQUARE]}).describe()
+    assert summary['vertices'] == 5
+    assert summary['area_km2'] == pytest.approx(5.565 * 5.565 * math.cos(math.radians(1.025)), rel=1e-2)
+    assert len(summary['geometry_hash']) == 16
@@ -0,0 +1,51 @@
+import json
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+import app
+from grid_store import GRID_LAYERS, METADATA_FILE, GridStore
+
+
+def write_grid(path, created):
+    """A 1x1 degree NDVI grid at 0.01 degrees, every cell holding 4 pixels of 0.5"""
+    values = np.zeros((100, 100, len(GRID_LAYERS['ndvi']['channels'])))
+    values[:] = [2.0, 1.0, 4, 0.5, 0.5]
+    np.save(path / 'ndvi.npy', values)
+    metadata = {
+        'bbox': [0, 0, 1, 1], 'resolution': 0.01, 'rows': 100, 'cols': 100,
+        'layers': {'ndvi': {
+            'file': 'ndvi.npy', 'scale': 10, 'created': created.isoformat(),
+            'window_days': 365, 'cloud_cover': 12.5,
+        }},
+    }
+    (path / METADATA_FILE).write_text(json.dumps(metadata))
+    return GridStore.open(str(path))
+
+
+def test_stats(tmp_path):
+    grid = write_grid(tmp_path, datetime.utcnow())
+    stats = grid.stats('ndvi', 0.5, 0.5, 5)
+    assert stats['NDVI_mean'] == pytest.approx(0.5)
+    assert stats['NDVI_stdDev'] == pytest.approx(0)
+    assert grid.stats('landcover', 0.5, 0.5, 5) is None
+
+
+def test_stats_skip_old_layers(tmp_path):
+    grid = write_grid(tmp_path, datetime.utcnow() - timedelta(days=2))
+    assert grid.stats('ndvi', 0.5, 0.5, 5, max_age=86400) is None
+    assert grid.stats('ndvi', 0.5, 0.5, 5, max_age=3 * 86400) is not None
+
+
+def test_grid_metric_shape(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'GRID', write_grid(tmp_path, datetime.utcnow()))
+    result = app.grid_metric('ndvi', 0.5, 0.5, 5, 'fast')
+    assert result['precomputed']
+    assert result['mean'] == 0.5
+    assert (result['scale_m'], result['quality']) == (10, 'fast')
+    assert (result['window_days'], result['cloudCover']) == (365, 12.5)
+
+    # An NDVI grid older than a cached result could be falls back to Earth Engine
+    monkeypatch.setattr(app, 'GRID', write_grid(tmp_path, datetime.utcnow() - timedelta(days=365)))
+    assert app.grid_metric('ndvi', 0.5, 0.5, 5) is None
@@ -0,0 +1,29 @@
+import sys
+
+import pytest
+
+import app
+import fetch_hot_regions
+from raster_store import RasterStore
+
+
+@pytest.fixture
+def rasters(tmp_path, monkeypatch):
+    """NDVI and surface water rasters of a small region, fetched from the fake Earth Engine"""
+    monkeypatch.setattr(sys, 'argv', [
+        'fetch_hot_regions.py', '--name', 'test', '--bbox', '2', '1', '2.05', '1.05',
+        '--layers', 'ndvi,surface-water', '--out', str(tmp_path), '--block', '256'
+    ])
+    assert fetch_hot_regions.main() == 0
+    return RasterStore.open(str(tmp_path))
+
+
+@pytest.mark.parametrize('name, quality', [('ndvi', 'balanced'), ('surface-water', 'fast')])
+def test_raster_metric_shape(rasters, monkeypatch, name, quality):
+    monkeypatch.setattr(app, 'RASTERS', rasters)
+    radius = 2000
+    result = app.raster_metric(name, 1.025, 2.025, radius, quality)
+    assert result['precomputed'] and result['hot_region'] == 'test'
+    # The scale a live query would reduce at, as the raster is subsampled to it
+    assert result['scale_m'] == app.metric_params(name, radius, quality)['scale']
+    assert result['quality'] == quality
@@ -0,0 +1,26 @@
+import pytest
+
+from app import ROLLING
+from datasets import DATASETS
+from rolling import combine
+
+DAYS = [
+    {'images': 2, 'stats': {'precipitation': 1.5}},
+    {'images': 0, 'stats': None},
+    {'images': 1, 'stats': {'precipitation': 0.25}},
+]
+
+
+def test_combine_sum():
+    assert combine(DAYS, 'sum') == {'precipitation': pytest.approx(1.75)}
+
+
+def test_rolling_metrics_combine_like_their_composite():
+    # Warm cells (combined days) and cold cells (one composite) must agree
+    for name, spec in ROLLING.items():
+        assert spec['combine'] == DATASETS[name]['composite']
+
+
+def test_combine_rejects_unknown():
+    with pytest.raises(ValueError):
+        combine(DAYS, 'median')
@@ -0,0 +1,218 @@
+"""Route and response-shape checks, run against app.app and asgi_app.app"""
+
+import io
+import time
+
+import msgpack
+import numpy as np
+import pytest
+
+import fake_ee
+from scoring import COMPONENTS, GRADES
+
+SQUARE = {'type': 'Polygon', 'coordinates': [[[2, 1], [2.05, 1], [2.05, 1.05], [2, 1.05], [2, 1]]]}
+SITES = {'sites': [{'id': 'a', 'lat': 1, 'lon': 2, 'radius': 5}, {'id': 'b', 'lat': 3, 'lon': 4}]}
+
+METRIC_KEYS = {
+    'ndvi': {'mean', 'min', 'max', 'stdDev', 'cloudCover', 'window_days', 'source', 'scale_m', 'quality'},
+    'landcover': {'classes', 'source', 'scale_m', 'quality'},
+    'temperature': {'mean_celsius', 'min_celsius', 'max_celsius', 'source', 'scale_m', 'quality'},
+    'surface-water': {'source', 'scale_m', 'quality'},
+}
+ASSESSMENT_KEYS = {'coordinates', 'health_grade', 'metrics', 'overall_score', 'recommendations', 'scores', 'weights'}
+
+
+def check_assessment(result):
+    assert ASSESSMENT_KEYS <= set(result)
+    assert set(result['scores']) <= set(COMPONENTS)
+    assert result['health_grade'] in [name for name, _ in GRADES]
+    assert 0 <= result['overall_score'] <= 100
+    assert result['recommendations']
+
+
+def test_health(client):
+    response = client.request('GET', '/health')
+    assert response.status == 200
+    health = response.json()
+    assert {'status', 'scheduler', 'cache', 'grid', 'rasters', 'jobs'} <= set(health)
+
+
+@pytest.mark.parametrize('name', sorted(METRIC_KEYS))
+def test_metric(client, name):
+    response = client.request('GET', f'/{name}?lat=1&lon=2&radius=5')
+    assert response.status == 200
+    assert response.headers['content-type'].startswith('application/json')
+    assert METRIC_KEYS[name] <= set(response.json())
+
+
+def test_metric_for_polygon(client):
+    response = client.request('POST', '/ndvi', SQUARE)
+    assert response.status == 200
+    result = response.json()
+    assert METRIC_KEYS['ndvi'] <= set(result)
+    assert {'centroid', 'area_km2', 'vertices', 'geometry_hash'} <= set(result['area'])
+    assert result['area']['centroid']['lat'] == pytest.approx(1.025, abs=1e-3)
+
+
+@pytest.mark.parametrize('path, body', [
+    ('/ndvi?lat=1&lon=2&quality=bogus', None),
+    ('/ndvi', {'type': 'Point', 'coordinates': [2, 1]}),
+    ('/ndvi', {'type': 'Polygon', 'coordinates': [[[2, 1], [2.05, 1], [2.05, 1.05], [2, 1.05]]]}),
+    ('/metrics?lat=1&lon=2&names=nope', None),
+    ('/environmental-assessment?lat=1&lon=2&weights=vegetation:-1', None),
+])
+def test_bad_requests(client, path, body):
+    response = client.request('POST' if body is not None else 'GET', path, body)
+    assert response.status == 400
+    assert 'error' in response.json()
+
+
+def test_metrics(client):
+    response = client.request('GET', '/metrics?lat=1&lon=2&names=ndvi,temperature')
+    assert response.status == 200
+    result = response.json()
+    assert set(result['metrics']) == {'ndvi', 'temperature'}
+    assert METRIC_KEYS['temperature'] <= set(result['metrics']['temperature'])
+
+
+def test_assessment(client):
+    response = client.request('GET', '/environmental-assessment?lat=1&lon=2&radius=5')
+    assert response.status == 200
+    check_assessment(response.json())
+
+
+def test_assessment_for_polygon(client):
+    response = client.request('POST', '/environmental-assessment', SQUARE)
+    assert response.status == 200
+    check_assessment(response.json())
+
+
+def test_batch(client):
+    response = client.request('POST', '/batch/temperature', SITES)
+    assert response.status == 200
+    assert response.headers['content-type'].startswith('application/x-ndjson')
+    rows = response.lines()
+    assert [row['id'] for row in rows] == ['a', 'b']
+    assert all(METRIC_KEYS['temperature'] <= set(row) for row in rows)
+
+
+def test_batch_picks_ndvi_window_per_site(client, monkeypatch):
+    monkeypatch.setitem(fake_ee._config, 'empty_sites', {(4, 3)})
+    rows = {row['id']: row for row in client.request('POST', '/batch/ndvi', SITES).lines()}
+    assert rows['a']['mean'] == pytest.approx(0.52)
+    assert rows['a']['window_days'] == 30
+    # Site b has no imagery, which must not borrow site a's window
+    assert 'window_days' not in rows['b']
+    assert 'No satellite images' in rows['b']['info']
+
+    single = client.request('GET', '/ndvi?lat=3&lon=4').json()
+    assert {k: v for k, v in rows['b'].items() if k not in ('id', 'timestamp')} == \
+        {k: v for k, v in single.items() if k != 'timestamp'}
+
+
+def test_assessment_batch(client):
+    response = client.request('POST', '/environmental-assessment/batch', SITES)
+    assert response.status == 200
+    rows = response.lines()
+    assert sorted(row['id'] for row in rows) == ['a', 'b']
+    for row in rows:
+        check_assessment(row)
+
+
+@pytest.mark.parametrize('empty_sites', [set(), {(4, 3)}])
+def test_assessment_batch_matches_single(client, monkeypatch, empty_sites):
+    # Site b may have no imagery, which leaves vegetation out of its score
+    monkeypatch.setitem(fake_ee._config, 'empty_sites', empty_sites)
+    rows = {row['id']: row for row in client.request('POST', '/environmental-assessment/batch', SITES).lines()}
+    for site in SITES['sites']:
+        query = f"lat={site['lat']}&lon={site['lon']}&radius={site.get('radius', 10)}"
+        single = client.request('GET', f'/environmental-assessment?{query}').json()
+        batch = rows[site['id']]
+        for key in ('scores', 'overall_score', 'health_grade', 'recommendations', 'metrics'):
+            assert batch[key] == single[key], key
+    assert ('vegetation' in rows['b']['scores']) == (not empty_sites)
+
+
+def test_timeseries(client):
+    response = client.request('GET', '/timeseries/ndvi?lat=1&lon=2&periods=3')
+    assert response.status == 200
+    result = response.json()
+    assert result['metric'] == 'ndvi'
+    assert len(result['points']) == 3
+
+
+def test_large_area(client):
+    response = client.request('GET', '/large-area/temperature?lat=40&lon=20&radius=100')
+    assert response.status == 200
+    events = response.lines()
+    assert events[0]['event'] == 'plan'
+    assert events[-1]['event'] == 'result'
+    assert {'mean_celsius', 'min_celsius', 'max_celsius', 'tiles'} <= set(events[-1])
+
+
+def test_msgpack(client):
+    response = client.request('GET', '/temperature?lat=1&lon=2', headers={'accept': 'application/msgpack'})
+    assert response.status == 200
+    assert response.headers['content-type'] == 'application/msgpack'
+    assert METRIC_KEYS['temperature'] <= set(msgpack.unpackb(response.body))
+
+
+def test_npy_timeseries(client):
+    response = client.request('GET', '/timeseries/ndvi?lat=1&lon=2&periods=4&format=npy')
+    assert response.status == 200
+    table = np.load(io.BytesIO(response.body))
+    assert len(table) == 4
+    assert 'date' in table.dtype.names
+
+
+def test_not_acceptable(client):
+    response = client.request('GET', '/ndvi?lat=1&lon=2&format=xml')
+    assert response.status == 406
+    assert 'json' in response.json()['available']
+
+
+def test_compression(client):
+    response = client.request('POST', '/batch/temperature', SITES, headers={'accept-encoding': 'gzip'})
+    assert response.status == 200
+    assert response.headers.get('content-encoding') == 'gzip'
+    assert len(response.lines()) == 2
+
+
+def test_job(client):
+    response = client.request('GET', '/environmental-assessment?lat=5&lon=6&async=true')
+    assert response.status == 202
+    status_url = response.json()['status_url']
+
+    deadline = time.monotonic() + 10
+    while True:
+        job = client.request('GET', status_url).json()
+        if job['status'] in ('done', 'failed') or time.monotonic() > deadline:
+            break
+        time.sleep(0.05)
+    assert job['status'] == 'done'
+    check_assessment(job['result'])
+
+    # Jobs are timed apart from HTTP requests
+    metrics = client.request('GET', '/prometheus').body.decode()
+    assert 'ee_service_task_duration_seconds_count{task="job:environmental-assessment",status="ok"}' in metrics
+    assert 'route="job:environmental-assessment",status=' not in metrics
+
+
+@pytest.mark.parametrize('method, path, body', [
+    ('GET', '/ndvi?lat=1&lon=2', None),
+    ('POST', '/landcover', SQUARE),
+    ('GET', '/metrics?lat=1&lon=2&names=ndvi,soil-moisture', None),
+    ('GET', '/environmental-assessment?lat=1&lon=2', None),
+    ('GET', '/timeseries/temperature?lat=1&lon=2&periods=2', None),
+])
+def test_same_shape_on_both_apps(flask_client, asgi_client, method, path, body):
+    def shape(value):
+        if isinstance(value, dict):
+            return {key: shape(item) for key, item in value.items() if key != 'timestamp'}
+        if isinstance(value, list):
+            return [shape(item) for item in value[:1]]
+        return type(value).__name__
+
+    wsgi, asgi = flask_client.request(method, path, body), asgi_client.request(method, path, body)
+    assert wsgi.status == asgi.status == 200
+    assert shape(wsgi.json()) == shape(asgi.json())
@@ -0,0 +1,83 @@
+import pytest
+
+from scheduler import Overloaded, Scheduler, is_quota_error
+
+
+class HttpError(Exception):
+    """An API client error carrying its HTTP status, like googleapiclient's"""
+
+    def __init__(self, status, message=''):
+        super().__init__(message)
+        self.resp = type('Response', (), {'status': status})()
+
+
+@pytest.mark.parametrize('error', [
+    Exception('Too Many Requests: Request was rejected because the request rate or concurrency limit was exceeded.'),
+    Exception('Too many concurrent aggregations.'),
+    Exception('Quota exceeded for quota metric'),
+    Exception('User rate limit exceeded.'),
+    Exception('HTTP Error 429'),
+    HttpError(429),
+])
+def test_quota_errors(error):
+    assert is_quota_error(error)
+
+
+@pytest.mark.parametrize('error', [
+    Exception('Too many pixels in the region. Found 1429000000, but maxPixels allows only 1000000000.'),
+    Exception('Computation timed out.'),
+    Exception('Image.load: Image asset users/someone/a429 not found.'),
+    Exception('Collection query aborted after accumulating over 5000 elements.'),
+    HttpError(400, 'Too many requests were batched'),
+    HttpError(500),
+])
+def test_other_errors(error):
+    assert not is_quota_error(error)
+
+
+def test_call_retries_quota_errors():
+    scheduler = Scheduler(concurrency=2, retries=2, backoff=0)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise Exception('Too many concurrent aggregations.')
+        return 'ok'
+
+    assert scheduler.call(flaky) == 'ok'
+    assert len(attempts) == 3
+    assert scheduler.stats()['quota_retries'] == 2
+    assert scheduler.stats()['running'] == 0
+
+
+def test_call_gives_up_with_overloaded():
+    scheduler = Scheduler(retries=1, backoff=0, retry_after=7)
+
+    def throttled():
+        raise Exception('Quota exceeded')
+
+    with pytest.raises(Overloaded) as error:
+        scheduler.call(throttled)
+    assert error.value.retry_after == 7
+    assert scheduler.stats()['quota_failures'] == 1
+
+
+def test_call_surfaces_other_errors_unchanged():
+    scheduler = Scheduler(retries=3, backoff=0)
+    attempts = []
+
+    def too_big():
+        attempts.append(1)
+        raise ValueError('Too many pixels in the region.')
+
+    with pytest.raises(ValueError, match='Too many pixels'):
+        scheduler.call(too_big)
+    assert len(attempts) == 1
+    assert scheduler.stats()['quota_retries'] == 0
+
+
+def test_full_queue_rejects():
+    scheduler = Scheduler(concurrency=1, max_queue=0)
+    with pytest.raises(Overloaded, match='queue is full'):
+        scheduler.acquire()
@@ -0,0 +1,137 @@
+import numpy as np
+import pytest
+
+from scoring import COMPONENTS, DEFAULT_WEIGHTS, GRADES, assess, parse_weights, recommendations
+
+
+def legacy_scores(ndvi, natural, water, failed=()):
+    """The environmental assessment's original if/elif component scores, for one location"""
+    scores = {}
+    if 'vegetation' in failed:
+        scores['vegetation'] = 50
+    elif ndvi >= 0.8:
+        scores['vegetation'] = 100
+    elif ndvi >= 0.6:
+        scores['vegetation'] = 60 + ((ndvi - 0.6) / 0.2) * 40
+    elif ndvi >= 0.4:
+        scores['vegetation'] = 40 + ((ndvi - 0.4) / 0.2) * 20
+    elif ndvi >= 0.2:
+        scores['vegetation'] = 20 + ((ndvi - 0.2) / 0.2) * 20
+    else:
+        scores['vegetation'] = max(0, ndvi / 0.2 * 20)
+
+    scores['landcover'] = 50 if 'landcover' in failed else min(100, natural)
+
+    if 'water' in failed:
+        scores['water'] = 50
+    elif 5 <= water <= 15:
+        scores['water'] = 100
+    elif water < 5:
+        scores['water'] = max(20, water / 5 * 100)
+    else:
+        scores['water'] = max(20, 100 - ((water - 15) / 85 * 80))
+
+    # Weighted average, before the original rounded it to one decimal
+    weights = {'vegetation': 0.4, 'landcover': 0.35, 'water': 0.25}
+    return scores, sum(scores[k] * w for k, w in weights.items()) / sum(weights.values())
+
+
+def legacy_advice(overall, scores, water, failed=()):
+    """The original grade and recommendations for a rounded overall score"""
+    if overall >= 90:
+        grade, first = 'Excellent', 'Ecosystem is thriving - continue conservation efforts'
+    elif overall >= 75:
+        grade, first = 'Good', 'Healthy ecosystem with room for improvement'
+    elif overall >= 60:
+        grade, first = 'Fair', 'Monitor environmental indicators and reduce human impact'
+    elif overall >= 40:
+        grade, first = 'Poor', 'Ecosystem under stress - restoration efforts needed'
+    else:
+        grade, first = 'Critical', 'Immediate conservation and restoration required'
+
+    advice = [first]
+    if scores['vegetation'] < 60:
+        advice.append('Increase vegetation cover through reforestation')
+    if scores['landcover'] < 60:
+        advice.append('Reduce urban sprawl and preserve natural habitats')
+    if 'water' not in failed and round(water, 1) < 3:
+        advice.append('Improve water retention and watershed management')
+    return grade, advice
+
+
+def check_legacy(assessed, advice, i, values, failed=()):
+    scores, average = legacy_scores(*values, failed)
+    overall = float(assessed['overall'][i])
+    assert assessed['scores'][i] == pytest.approx([scores[c] for c in COMPONENTS])
+    # A rounding of the same average; the last bit may differ at ties (x.x5)
+    assert abs(overall - average) <= 0.05 + 1e-9
+    grade, expected_advice = legacy_advice(overall, scores, values[2], failed)
+    assert GRADES[assessed['grade'][i]][0] == grade
+    if advice is not None:
+        assert advice[i] == expected_advice
+
+
+NDVI = [-0.3, 0.0, 0.1, 0.2, 0.3, 0.4, 0.55, 0.6, 0.7, 0.8, 0.95]
+NATURAL = [0, 30, 59.9, 60, 85, 100]
+WATER = [0, 0.5, 1, 2.96, 3, 4.99, 5, 10, 15, 15.01, 50, 100]
+
+
+def test_matches_legacy_chains():
+    grid = np.array([(n, c, w) for n in NDVI for c in NATURAL for w in WATER])
+    assessed = assess(grid, weights={'vegetation': 0.4, 'landcover': 0.35, 'water': 0.25})
+    advice = recommendations(assessed, grid)
+
+    for i, values in enumerate(grid.tolist()):
+        check_legacy(assessed, advice, i, values)
+
+
+@pytest.mark.parametrize('failed', [('vegetation',), ('landcover', 'water'), COMPONENTS])
+def test_failed_components_score_neutral(failed):
+    values = np.array([[0.7, 80, 10]])
+    mask = np.array([[c in failed for c in COMPONENTS]])
+    assessed = assess(values, mask, weights={'vegetation': 0.4, 'landcover': 0.35, 'water': 0.25})
+    check_legacy(assessed, None, 0, [0.7, 80, 10], failed)
+
+
+def test_missing_components_are_left_out():
+    assessed = assess([[np.nan, 80, 10]], weights={'vegetation': 0.4, 'landcover': 0.35, 'water': 0.25})
+    assert np.isnan(assessed['scores'][0, 0])
+    assert assessed['overall'][0] == pytest.approx(round((80 * 0.35 + 100 * 0.25) / 0.6, 1))
+    # A component left out is treated as neutral when choosing recommendations
+    assert 'Increase vegetation cover through reforestation' in recommendations(assessed, [[np.nan, 80, 10]])[0]
+
+
+def test_parse_weights():
+    assert parse_weights(None, DEFAULT_WEIGHTS) == DEFAULT_WEIGHTS
+    weights = parse_weights('vegetation:1, water:0', DEFAULT_WEIGHTS)
+    assert weights == {**DEFAULT_WEIGHTS, 'vegetation': 1.0, 'water': 0.0}
+
+
+@pytest.mark.parametrize('value', ['forest:1', 'vegetation:x', 'vegetation:-1', 'vegetation:nan',
+                                   'vegetation:0,landcover:0,water:0'])
+def test_parse_weights_rejects(value):
+    with pytest.raises(ValueError):
+        parse_weights(value, DEFAULT_WEIGHTS)
+
+
+def test_natural_landcover_from_fractional_counts():
+    from app import format_landcover, landcover_value
+    # Grid cells and partially covered edge pixels give fractional counts
+    metrics, natural = landcover_value(format_landcover({'Map': {'10': 0.6, '50': 0.3, '80': 0.1}}))
+    assert natural == pytest.approx(70)
+    assert metrics['natural_landcover']['value'] == 70
+
+    assert landcover_value(format_landcover({'Map': {}})) == ({}, pytest.approx(np.nan, nan_ok=True))
+
+
+@pytest.mark.parametrize('info', [
+    {'image_count': 0},
+    {'image_count': 3, 'window_days': 30, 'stats': {'NDVI_mean': None, 'NDVI_min': None, 'NDVI_max': None}},
+    {'image_count': 3, 'window_days': 30, 'stats': None},
+])
+def test_missing_ndvi_is_left_out(info):
+    from app import format_ndvi, vegetation_value
+    ndvi = format_ndvi(info)
+    assert ndvi['info']
+    metrics, value = vegetation_value(ndvi)
+    assert metrics == {} and np.isnan(value)
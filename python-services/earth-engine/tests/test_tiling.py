@@ -0,0 +1,76 @@
+import math
+
+import numpy as np
+import pytest
+
+from tiling import MAX_TILES, circle_bounds, merge, plan_tiles, touches_circle
+
+
+def partials(kind, band, tiles):
+    """The per-tile output of tiling.partial_reducer, computed locally"""
+    result = []
+    for pixels in tiles:
+        if kind == 'histogram':
+            values, counts = np.unique(pixels, return_counts=True)
+            result.append({band: {str(int(v)): int(c) for v, c in zip(values, counts)}})
+        elif kind == 'max':
+            result.append({band: float(pixels.max())})
+        else:
+            partial = {f'{band}_sum': float(pixels.sum()), f'{band}_count': len(pixels)}
+            if kind != 'mean':
+                partial.update({f'{band}_min': float(pixels.min()), f'{band}_max': float(pixels.max())})
+                partial[f'{band}_sq_sum'] = float((pixels ** 2).sum())
+            result.append(partial)
+    return result
+
+
+@pytest.fixture
+def pixels():
+    return np.random.default_rng(0).normal(0.4, 0.2, 1000)
+
+
+@pytest.mark.parametrize('kind', ['mean', 'max', 'mean_min_max', 'mean_min_max_std'])
+def test_merge_matches_whole_region(pixels, kind):
+    tiles = np.split(pixels, [100, 350, 351, 800])
+    merged = merge(kind, 'NDVI', partials(kind, 'NDVI', tiles))
+
+    if kind == 'mean':
+        assert merged == {'NDVI': pytest.approx(pixels.mean())}
+    elif kind == 'max':
+        assert merged == {'NDVI': pytest.approx(pixels.max())}
+    else:
+        assert merged['NDVI_mean'] == pytest.approx(pixels.mean())
+        assert merged['NDVI_min'] == pytest.approx(pixels.min())
+        assert merged['NDVI_max'] == pytest.approx(pixels.max())
+        if kind == 'mean_min_max_std':
+            assert merged['NDVI_stdDev'] == pytest.approx(pixels.std())
+
+
+def test_merge_histogram():
+    classes = np.random.default_rng(1).choice([10, 20, 50, 80], 500)
+    merged = merge('histogram', 'Map', partials('histogram', 'Map', np.split(classes, 4)))
+    values, counts = np.unique(classes, return_counts=True)
+    assert merged == {'Map': {str(v): c for v, c in zip(values, counts)}}
+
+
+def test_merge_skips_empty_tiles(pixels):
+    merged = merge('mean', 'NDVI', [{}, None, *partials('mean', 'NDVI', [pixels]), {'NDVI_sum': None}])
+    assert merged == {'NDVI': pytest.approx(pixels.mean())}
+
+
+def test_merge_without_pixels():
+    assert merge('mean', 'NDVI', []) == {'NDVI': None}
+    assert merge('mean_min_max_std', 'NDVI', [{}]) == {
+        'NDVI_mean': None, 'NDVI_min': None, 'NDVI_max': None, 'NDVI_stdDev': None
+    }
+
+
+def test_plan_tiles_caps_tile_count():
+    bounds = circle_bounds(40, 20, 500000)
+    scale, tiles = plan_tiles(bounds, 10, lambda tile: touches_circle(tile, 40, 20, 500000))
+    assert 0 < len(tiles) <= MAX_TILES
+    assert scale >= 10 and math.log2(scale / 10).is_integer()
+
+    west, south, east, north = bounds
+    assert min(t[0] for t in tiles) == pytest.approx(west)
+    assert max(t[3] for t in tiles) == pytest.approx(north)
@@ -0,0 +1,127 @@
+"""
+Tiled reduction of large areas
+Regions too big for a single reduceRegion are split into a grid of tiles that
+are reduced separately, in parallel, into partial statistics which merge
+exactly, as the precomputed grid does per cell: sums and pixel counts for
+means, sums of squares for standard deviations, minima and maxima, and
+histogram counts. Partial reductions are unweighted, so pixels on a tile edge
+count once, in the tile containing their centre.
+"""
+
+import os
+import math
+from functools import lru_cache
+
+import ee
+
+# Pixels per tile at the reduction scale, and the most tiles one request may use
+TILE_PIXELS = float(os.getenv('EE_TILE_PIXELS', 4e6))
+MAX_TILES = int(os.getenv('EE_LARGE_AREA_MAX_TILES', 256))
+
+METERS_PER_DEGREE = 111320.0
+
+
+def circle_bounds(lat, lon, radius_m):
+    """(west, south, east, north) of a circle"""
+    dlat = radius_m / METERS_PER_DEGREE
+    dlon = radius_m / (METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+    return max(lon - dlon, -180), max(lat - dlat, -90), min(lon + dlon, 180), min(lat + dlat, 90)
+
+
+def touches_circle(tile, lat, lon, radius_m):
+    """Whether a (west, south, east, north) tile overlaps a circle"""
+    west, south, east, north = tile
+    # Nearest point of the tile to the centre, in local metres
+    dx = (min(max(lon, west), east) - lon) * METERS_PER_DEGREE * math.cos(math.radians(lat))
+    dy = (min(max(lat, south), north) - lat) * METERS_PER_DEGREE
+    return math.hypot(dx, dy) <= radius_m
+
+
+def plan_tiles(bounds, native_scale, keep=None):
+    """
+    Split (west, south, east, north) bounds into square tiles of about
+    TILE_PIXELS pixels, dropping tiles for which keep(tile) is false. The
+    scale starts at the native scale and doubles until at most MAX_TILES
+    tiles remain. Returns (scale, tiles as (west, south, east, north)).
+    """
+    west, south, east, north = bounds
+    cos_lat = max(math.cos(math.radians((south + north) / 2)), 0.01)
+
+    scale = native_scale
+    while True:
+        side = scale * math.sqrt(TILE_PIXELS)
+        dlat = side / METERS_PER_DEGREE
+        dlon = side / (METERS_PER_DEGREE * cos_lat)
+        rows = max(1, math.ceil((north - south) / dlat))
+        cols = max(1, math.ceil((east - west) / dlon))
+
+        # The region may cover only part of its bounds, so a somewhat larger
+        # grid can still leave few enough tiles once filtered
+        if rows * cols <= MAX_TILES * 2:
+            tiles = [
+                (west + c * dlon, south + r * dlat,
+                 min(east, west + (c + 1) * dlon), min(north, south + (r + 1) * dlat))
+                for r in range(rows) for c in range(cols)
+            ]
+            if keep is not None:
+                tiles = [tile for tile in tiles if keep(tile)]
+            if len(tiles) <= MAX_TILES:
+                return scale, tiles
+        scale *= 2
+
+
+def partial_image(kind, image, band):
+    """The image to reduce per tile; standard deviations also need the squared band"""
+    if kind == 'mean_min_max_std':
+        return image.addBands(image.multiply(image).rename(f'{band}_sq'))
+    return image
+
+
+@lru_cache(maxsize=None)
+def partial_reducer(kind):
+    """Reducer producing mergeable per-tile statistics for a datasets.REDUCERS kind"""
+    if kind == 'histogram':
+        return ee.Reducer.frequencyHistogram()
+    if kind == 'max':
+        return ee.Reducer.max()
+
+    partial = ee.Reducer.sum().combine(ee.Reducer.count(), '', True)
+    if kind != 'mean':
+        partial = partial.combine(ee.Reducer.minMax(), '', True)
+    return partial.unweighted()
+
+
+def _values(partials, key):
+    return [p[key] for p in partials if p.get(key) is not None]
+
+
+def merge(kind, band, partials):
+    """Merge per-tile partial statistics into the keys reduceRegion would return for the whole region"""
+    partials = [p for p in partials if p]
+
+    if kind == 'histogram':
+        histogram = {}
+        for partial in partials:
+            for value, count in (partial.get(band) or {}).items():
+                histogram[value] = histogram.get(value, 0) + count
+        return {band: histogram}
+
+    if kind == 'max':
+        values = _values(partials, band)
+        return {band: max(values) if values else None}
+
+    count = sum(_values(partials, f'{band}_count'))
+    mean = sum(_values(partials, f'{band}_sum')) / count if count else None
+    if kind == 'mean':
+        return {band: mean}
+
+    minima, maxima = _values(partials, f'{band}_min'), _values(partials, f'{band}_max')
+    stats = {
+        f'{band}_mean': mean,
+        f'{band}_min': min(minima) if minima else None,
+        f'{band}_max': max(maxima) if maxima else None,
+    }
+    if kind == 'mean_min_max_std':
+        squares = sum(_values(partials, f'{band}_sq_sum'))
+        stats[f'{band}_stdDev'] = math.sqrt(max(squares / count - mean ** 2, 0)) if count else None
+    return stats
@@ -0,0 +1,117 @@
+"""
+Per-period time series for Earth Engine metrics
+A series is a list of daily, weekly or monthly composites reduced over a region.
+All requested periods are mapped server-side over an ee.List of date ranges and
+fetched with a single getInfo(); periods that can no longer change are kept so
+a refresh only fetches the newest ones.
+"""
+
+from datetime import datetime, timedelta
+
+import ee
+
+from datasets import DATASETS, composite, filtered, prepared, reducer
+from instrumentation import get_info
+
+# Default and maximum number of periods per request
+DEFAULT_PERIODS = {'daily': 30, 'weekly': 26, 'monthly': 12}
+MAX_PERIODS = 366
+
+
+# Metric -> per-period composite and presentation; the collection, bands,
+# preparation and scale factor come from the metric's declaration in
+# datasets.py. `settle_days` is how long after a period ends its composite can
+# still change as late scenes arrive; older periods are treated as final and
+# never refetched.
+SERIES = {
+    'ndvi': {
+        # Native scale before scale_policy: coarser than /ndvi's 10 m, as a trend
+        # over many composites does not need full resolution
+        'composite': 'median', 'scale': 30, 'digits': 3, 'unit': 'index', 'settle_days': 5,
+    },
+    'temperature': {'composite': 'median', 'digits': 1, 'unit': '°C', 'settle_days': 3},
+    'soil-moisture': {'composite': 'median', 'digits': 3, 'unit': 'm³/m³', 'settle_days': 4},
+    'precipitation': {'composite': 'sum', 'digits': 2, 'unit': 'mm', 'settle_days': 3},
+    'evapotranspiration': {'composite': 'median', 'digits': 2, 'unit': 'mm/8-day', 'settle_days': 10},
+    'air-quality': {'composite': 'median', 'digits': None, 'unit': 'mol/m²', 'settle_days': 5},
+    'fire': {'composite': 'count', 'reducer': 'max', 'digits': 0, 'unit': 'detections', 'settle_days': 3},
+}
+
+
+def series_scale(metric):
+    """Native reduction scale of a series, before scale_policy"""
+    return SERIES[metric].get('scale', DATASETS[metric]['scale'])
+
+
+def _period_start(day, period):
+    if period == 'weekly':
+        return day - timedelta(days=day.weekday())  # Monday
+    if period == 'monthly':
+        return day.replace(day=1)
+    return day
+
+
+def _next_period(start, period):
+    if period == 'weekly':
+        return start + timedelta(days=7)
+    if period == 'monthly':
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def period_ranges(period, count, today=None):
+    """The last `count` periods up to and including the current one, oldest first, as (start, end) dates"""
+    start = _period_start(today or datetime.utcnow().date(), period)
+    ranges = []
+    for _ in range(count):
+        ranges.append((start, _next_period(start, period)))
+        start = _period_start(start - timedelta(days=1), period)
+    return ranges[::-1]
+
+
+def is_final(metric, end, today=None):
+    """Whether a period ending on `end` has settled and will not change"""
+    return end + timedelta(days=SERIES[metric]['settle_days']) <= (today or datetime.utcnow().date())
+
+
+def series_reduction(metric, region, ranges, params):
+    """Build one unevaluated ee.List with a {date, images, value} dictionary per range"""
+    spec = SERIES[metric]
+    collection = prepared(metric, filtered(metric, region))
+    series_reducer = reducer(spec.get('reducer', 'mean'))
+
+    def reduce_period(item):
+        item = ee.List(item)
+        images = collection.filterDate(item.get(0), item.get(1))
+        count = images.size()
+        image = composite(metric, images, spec['composite'])
+        value = image.reduceRegion(reducer=series_reducer, geometry=region, **params).get(DATASETS[metric]['band'])
+        # An empty period has no bands to reduce
+        return ee.Dictionary({
+            'date': item.get(0),
+            'images': count,
+            'value': ee.Algorithms.If(count.gt(0), value, None),
+        })
+
+    return ee.List([[start.isoformat(), end.isoformat()] for start, end in ranges]).map(reduce_period)
+
+
+def fetch_points(metric, region, ranges, params):
+    """Fetch the points for the given ranges with a single getInfo(), reducing with `params` (see scale_policy.py)"""
+    if not ranges:
+        return []
+    spec = SERIES[metric]
+    info = get_info(series_reduction(metric, region, ranges, params), f'timeseries:{metric}')
+
+    points = []
+    for (start, end), entry in zip(ranges, info):
+        value = entry.get('value')
+        if value is not None and spec['digits'] is not None:
+            value = round(value, spec['digits'])
+        points.append({
+            'date': start.isoformat(),
+            'end': end.isoformat(),
+            'value': value,
+            'images': entry.get('images', 0),
+        })
+    return points